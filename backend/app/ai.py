@@ -1,11 +1,113 @@
 from __future__ import annotations
 
-from typing import List, Dict
-from sqlalchemy.orm import Session
-from openai import OpenAI
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import List, Dict, AsyncIterator, Iterator, Sequence, Set
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import httpx
+from openai import AsyncOpenAI
 
-from app.settings import Settings
+from app.settings import Settings, get_settings
 from app import models
+from app.cache import CachedReply, response_cache
+from app.metrics import SUMMARY_DURATION, llm_call, llm_operation
+
+
+class ModelUnavailable(Exception):
+    """The model gave no reply and the caller asked for no fallback text."""
+
+
+class AINotConfigured(ModelUnavailable):
+    pass
+
+
+# Process-wide client so completions reuse pooled keep-alive connections
+_client: AsyncOpenAI | None = None
+# Calls in flight per client (by id). A client replaced by a reload is
+# closed only once the last call using it has finished.
+_in_flight: Dict[int, int] = {}
+_retired: Dict[int, AsyncOpenAI] = {}
+_closing: Set[asyncio.Task] = set()
+
+
+def get_openai_client() -> AsyncOpenAI | None:
+    """Return the shared OpenAI client, or None when AI is not configured."""
+    global _client
+    settings = get_settings()
+    if not settings.openai_api_key:
+        return None
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            http2=settings.openai_http2,
+            limits=httpx.Limits(
+                max_connections=settings.openai_max_connections,
+                max_keepalive_connections=settings.openai_max_keepalive_connections,
+                keepalive_expiry=settings.openai_keepalive_expiry_seconds,
+            ),
+            timeout=httpx.Timeout(
+                settings.openai_timeout_seconds,
+                connect=settings.openai_connect_timeout_seconds,
+            ),
+        )
+        _client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            base_url=settings.openai_base_url,
+            max_retries=settings.openai_max_retries,
+            http_client=http_client,
+        )
+    return _client
+
+
+@contextmanager
+def using_openai_client(client: AsyncOpenAI) -> Iterator[AsyncOpenAI]:
+    """Mark a call on `client` as in flight, so a reload doesn't close it."""
+    key = id(client)
+    _in_flight[key] = _in_flight.get(key, 0) + 1
+    try:
+        yield client
+    finally:
+        _in_flight[key] -= 1
+        if not _in_flight[key]:
+            del _in_flight[key]
+            retired = _retired.pop(key, None)
+            if retired is not None:
+                # May run while a cancelled stream unwinds; close in a task
+                task = asyncio.get_running_loop().create_task(retired.close())
+                _closing.add(task)
+                task.add_done_callback(_closing.discard)
+
+
+async def close_openai_client() -> None:
+    """Close the shared client and any retired ones; for shutdown."""
+    global _client
+    client, _client = _client, None
+    clients = list(_retired.values()) + ([client] if client is not None else [])
+    _retired.clear()
+    for c in clients:
+        await c.close()
+    if _closing:
+        await asyncio.gather(*_closing, return_exceptions=True)
+
+
+async def reload_settings() -> Settings:
+    """Re-read .env/environment and rebuild the OpenAI client on next use.
+
+    Settings are otherwise read once per process; this is the explicit reload
+    hook behind SIGHUP and `POST /admin/reload-config`. Database and queue
+    settings still need a restart. Calls already running keep the old client,
+    which is closed when the last of them finishes.
+    """
+    global _client
+    get_settings.cache_clear()
+    client, _client = _client, None
+    if client is not None:
+        if _in_flight.get(id(client)):
+            _retired[id(client)] = client
+        else:
+            await client.close()
+    return get_settings()
 
 
 def _fallback_reply(
@@ -20,16 +122,9 @@ def _fallback_reply(
     return f"{prefix}Hi! While AI is disabled, I can still help organize your plan. Tell me about your academics, activities, and goals."
 
 
-def generate_assistant_reply(
-    history_messages: List[Dict[str, str]], student_context_summary: str | None
+def build_system_prompt(
+    student_context_summary: str | None, references: Sequence[str] | None = None
 ) -> str:
-    # Instantiate fresh settings each call to pick up latest .env/ENV
-    settings = Settings()
-
-    if not settings.openai_api_key:
-        return _fallback_reply(history_messages, student_context_summary)
-
-    messages: List[Dict[str, str]] = []
     system_content = (
         "You are a helpful AI college counseling assistant. "
         "Be concise, actionable, and supportive. "
@@ -40,48 +135,217 @@ def generate_assistant_reply(
             "\n\nStudent context summary (may be incomplete, do not assume facts not present):\n"
             + student_context_summary
         )
+    if references:
+        system_content += (
+            "\n\nExcerpts from the student's documents and earlier conversations "
+            "that may be relevant (use only if they help):\n"
+            + "\n".join(f"- {ref}" for ref in references)
+        )
+    return system_content
 
-    messages.append({"role": "system", "content": system_content})
+
+def _build_chat_messages(
+    history_messages: List[Dict[str, str]],
+    student_context_summary: str | None,
+    references: Sequence[str] | None = None,
+    system_prompt: str | None = None,
+) -> List[Dict[str, str]]:
+    if system_prompt is None:
+        system_prompt = build_system_prompt(student_context_summary, references)
+    messages: List[Dict[str, str]] = []
+    messages.append({"role": "system", "content": system_prompt})
     messages.extend(history_messages)
+    return messages
 
-    try:
-        client = OpenAI(api_key=settings.openai_api_key)
-        completion = client.chat.completions.create(
-            model=settings.openai_model,
-            messages=messages,
-        )
-        return completion.choices[0].message.content or ""
-    except Exception:
+
+def _cache_key(settings: Settings, messages: List[Dict[str, str]], use_cache: bool):
+    if not (use_cache and settings.response_cache_enabled):
+        return None
+    return response_cache.key_for(settings.openai_model, messages)
+
+
+async def generate_assistant_reply(
+    history_messages: List[Dict[str, str]],
+    student_context_summary: str | None,
+    use_cache: bool = True,
+    references: Sequence[str] | None = None,
+    fallback: bool = True,
+    system_prompt: str | None = None,
+) -> str:
+    """The model's reply, or `_fallback_reply` text when there is none.
+
+    With `fallback=False` a missing client raises `AINotConfigured` and a
+    failed or empty completion raises `ModelUnavailable`, for callers that
+    must not mistake the fallback for model output. `system_prompt` replaces
+    the counseling prompt, for non-chat tasks such as summarization.
+    """
+    client = get_openai_client()
+    if client is None:
+        if not fallback:
+            raise AINotConfigured("AI is not configured")
         return _fallback_reply(history_messages, student_context_summary)
 
+    settings = get_settings()
+    messages = _build_chat_messages(
+        history_messages, student_context_summary, references, system_prompt
+    )
+
+    cache_key = _cache_key(settings, messages, use_cache)
+    if cache_key is not None:
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            return cached.content
+
+    with using_openai_client(client), llm_call("reply") as call:
+        try:
+            completion = await client.chat.completions.create(
+                model=settings.openai_model,
+                messages=messages,
+            )
+        except Exception as exc:
+            call.outcome = "error"
+            if not fallback:
+                raise ModelUnavailable(f"Model call failed: {exc}") from exc
+            return _fallback_reply(history_messages, student_context_summary)
+        usage = getattr(completion, "usage", None)
+        call.usage(usage)
+
+    content = completion.choices[0].message.content or ""
+    if not content and not fallback:
+        raise ModelUnavailable("Model returned an empty reply")
+    if cache_key is not None and content:
+        await response_cache.set(
+            cache_key,
+            CachedReply(content, getattr(usage, "total_tokens", 0) or 0),
+        )
+    return content
+
+
+async def stream_assistant_reply(
+    history_messages: List[Dict[str, str]],
+    student_context_summary: str | None,
+    use_cache: bool = True,
+    references: Sequence[str] | None = None,
+) -> AsyncIterator[str]:
+    """Yield the assistant reply in chunks as the model produces them.
+
+    Falls back to `_fallback_reply` (as a single chunk) when AI is not
+    configured or the request fails before any text was produced. A failure
+    after text has started flowing raises `ModelUnavailable`, so the caller
+    can tell the text it received is incomplete. A cached reply is yielded as
+    a single chunk.
+    """
+    client = get_openai_client()
+    if client is None:
+        yield _fallback_reply(history_messages, student_context_summary)
+        return
+
+    settings = get_settings()
+    messages = _build_chat_messages(
+        history_messages, student_context_summary, references
+    )
+
+    cache_key = _cache_key(settings, messages, use_cache)
+    if cache_key is not None:
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            yield cached.content
+            return
 
-def summarize_student_context(db: Session, student_id: int) -> str:
+    parts: List[str] = []
+    total_tokens = 0
+    with using_openai_client(client), llm_call("stream") as call:
+        try:
+            stream = await client.chat.completions.create(
+                model=settings.openai_model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    total_tokens = usage.total_tokens or 0
+                    call.usage(usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as exc:
+            call.outcome = "error"
+            if parts:
+                raise ModelUnavailable(f"Stream interrupted: {exc}") from exc
+            yield _fallback_reply(history_messages, student_context_summary)
+            return
+
+    # Only complete replies are cached
+    if cache_key is not None and parts:
+        await response_cache.set(cache_key, CachedReply("".join(parts), total_tokens))
+
+
+async def summarize_student_context(db: AsyncSession, student_id: int) -> str:
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with llm_operation("summary"):
+            summary = await _summarize_student_context(db, student_id)
+        outcome = "ok"
+        return summary
+    finally:
+        SUMMARY_DURATION.observe(time.perf_counter() - started, outcome)
+
+
+async def _summarize_student_context(db: AsyncSession, student_id: int) -> str:
     # Fetch previous summary
     prev_summary: str = ""
     student_ctx = (
-        db.query(models.StudentContext)
-        .filter(models.StudentContext.student_id == student_id)
-        .one_or_none()
-    )
+        await db.execute(
+            select(models.StudentContext).where(
+                models.StudentContext.student_id == student_id
+            )
+        )
+    ).scalar_one_or_none()
     if student_ctx and student_ctx.context_summary:
         prev_summary = student_ctx.context_summary
+    watermark = student_ctx.last_summarized_message_id if student_ctx else None
 
-    # Fetch last 100 messages across all conversations for this student
-    messages = (
-        db.query(models.Message)
+    query = (
+        select(models.Message)
         .join(
             models.Conversation,
             models.Message.conversation_id == models.Conversation.id,
         )
-        .filter(models.Conversation.student_id == student_id)
-        .order_by(models.Message.created_at.desc())
-        .limit(100)
-        .all()
+        .where(models.Conversation.student_id == student_id)
     )
+    if watermark is not None:
+        # Fetch messages not yet folded into the summary, oldest first.
+        # Anything past the cap is picked up by the next run once the
+        # watermark advances.
+        query = query.where(models.Message.id > watermark)
+        messages = (
+            (await db.execute(query.order_by(models.Message.id.asc()).limit(100)))
+            .scalars()
+            .all()
+        )
+    else:
+        # No watermark yet (a new student, or a summary written before
+        # watermarks existed): build from the newest window, as summaries
+        # always were, rather than folding the oldest messages into it
+        newest = (
+            (await db.execute(query.order_by(models.Message.id.desc()).limit(100)))
+            .scalars()
+            .all()
+        )
+        messages = list(reversed(newest))
+
+    # Nothing new since the last run: keep the summary and skip the model call
+    if not messages:
+        return prev_summary
 
-    ordered = list(reversed(messages))
     history: List[Dict[str, str]] = [
-        {"role": m.role, "content": m.content} for m in ordered
+        {"role": m.role, "content": m.content} for m in messages
     ]
 
     prompt_messages: List[Dict[str, str]] = [
@@ -103,15 +367,26 @@ def summarize_student_context(db: Session, student_id: int) -> str:
         )
     prompt_messages.extend(history)
 
-    summary = generate_assistant_reply(prompt_messages[1:], prev_summary)
+    # On failure the summary and watermark stay put, so these messages are
+    # retried by the next run instead of being lost behind the watermark.
+    # The summarizer instruction replaces the counseling prompt, so the model
+    # writes a profile summary rather than a chat reply.
+    try:
+        summary = await generate_assistant_reply(
+            prompt_messages[1:],
+            prev_summary,
+            use_cache=False,
+            fallback=False,
+            system_prompt=prompt_messages[0]["content"],
+        )
+    except AINotConfigured:
+        return prev_summary
 
     if student_ctx is None:
-        student_ctx = models.StudentContext(
-            student_id=student_id, context_summary=summary
-        )
+        student_ctx = models.StudentContext(student_id=student_id)
         db.add(student_ctx)
-    else:
-        student_ctx.context_summary = summary
+    student_ctx.context_summary = summary
+    student_ctx.last_summarized_message_id = messages[-1].id
 
-    db.commit()
+    await db.commit()
     return summary
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from app.settings import get_settings
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """Bounded in-process LRU map with an optional per-entry TTL.
+
+    Not thread-safe; callers share it from the event loop thread.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float | None = None):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at and expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0.0
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@dataclass
+class CachedReply:
+    content: str
+    total_tokens: int = 0
+
+
+class ResponseCache:
+    """Cache of assistant replies keyed by a hash of the full prompt.
+
+    A memory LRU answers most lookups; when `db_path` is set, replies are
+    also written to a SQLite file so they survive restarts. The SQLite
+    tier runs in worker threads so a slow disk never stalls the event
+    loop. Hit/miss and saved-token counters are exposed through `stats()`.
+    """
+
+    _PRUNE_EVERY = 100
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        ttl_seconds: float = 3600.0,
+        db_path: str | None = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.memory: LRUCache[CachedReply] = LRUCache(maxsize, ttl_seconds)
+        self.db_path = db_path
+        self._db: sqlite3.Connection | None = None
+        # One connection shared by the worker threads
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+    @staticmethod
+    def key_for(model: str, messages: List[Dict[str, str]]) -> str:
+        """Hash the model and prompt (system content plus trimmed history)."""
+        payload = json.dumps([model, messages], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[CachedReply]:
+        reply = self.memory.get(key)
+        if reply is None and self.db_path:
+            reply = await asyncio.to_thread(self._disk_get, key)
+            if reply is not None:
+                self.disk_hits += 1
+                self.memory.set(key, reply)
+        if reply is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_tokens += reply.total_tokens
+        return reply
+
+    async def set(self, key: str, reply: CachedReply) -> None:
+        self.memory.set(key, reply)
+        if self.db_path:
+            await asyncio.to_thread(self._disk_set, key, reply)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.db_path:
+            with self._db_lock:
+                self._conn().execute("DELETE FROM responses")
+                self._conn().commit()
+        self.hits = self.disk_hits = self.misses = self.saved_tokens = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_tokens": self.saved_tokens,
+            "entries": len(self.memory),
+            "persistent": bool(self.db_path),
+        }
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, "
+                "total_tokens INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def _disk_get(self, key: str) -> Optional[CachedReply]:
+        with self._db_lock:
+            row = (
+                self._conn()
+                .execute(
+                    "SELECT content, total_tokens FROM responses "
+                    "WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                )
+                .fetchone()
+            )
+        return CachedReply(content=row[0], total_tokens=row[1]) if row else None
+
+    def _disk_set(self, key: str, reply: CachedReply) -> None:
+        now = time.time()
+        with self._db_lock:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, reply.content, reply.total_tokens, now + self.ttl_seconds),
+            )
+            self._writes += 1
+            if self._writes % self._PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            conn.commit()
+
+
+_settings = get_settings()
+response_cache = ResponseCache(
+    maxsize=_settings.response_cache_max_entries,
+    ttl_seconds=_settings.response_cache_ttl_seconds,
+    db_path=_settings.response_cache_path,
+)
@@ -0,0 +1,123 @@
+"""Negotiated gzip/brotli compression for large, complete responses.
+
+Long conversations with essays in them are mostly text and shrink several
+times over. Only single-body responses of a compressible type and at least
+`minimum_size` bytes are compressed; streamed responses (SSE, files) pass
+through untouched so tokens are never held back in a compressor buffer.
+Brotli is used when the optional `brotli` package is installed and the
+client accepts it, gzip otherwise.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+# Levels for dynamic content: gzip 4 is ~3.5x faster than 6 on chat JSON
+# for ~10% more bytes; brotli 11 is for static assets
+GZIP_LEVEL = 4
+BROTLI_QUALITY = 4
+# Bigger bodies are compressed off the event loop (zlib and brotli release
+# the GIL)
+THREAD_MIN_BYTES = 64 * 1024
+
+
+def available_encodings() -> List[str]:
+    """Encodings this process can produce, in order of preference."""
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """The preferred encoding allowed by an Accept-Encoding header."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    wildcard = weights.get("*", 0.0)
+    for encoding in available_encodings():
+        if weights.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    if content_type.startswith("text/event-stream"):
+        return False
+    return content_type.startswith(("application/json", "text/"))
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware, like `app.metrics.MetricsMiddleware`."""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        # The start message is held until the body shows whether it is
+        # complete and large enough
+        held: Dict[str, dict] = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                if message["status"] in (204, 304) or not _compressible(
+                    Headers(raw=message["headers"])
+                ):
+                    await send(message)
+                else:
+                    held["start"] = message
+                return
+            start = held.pop("start", None)
+            if start is not None and message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                complete = not message.get("more_body", False)
+                if complete and len(body) >= self.minimum_size:
+                    if len(body) >= THREAD_MIN_BYTES:
+                        body = await asyncio.to_thread(compress, body, encoding)
+                    else:
+                        body = compress(body, encoding)
+                    headers = MutableHeaders(scope=start)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    headers.add_vary_header("Accept-Encoding")
+                    message = {**message, "body": body}
+            if start is not None:
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
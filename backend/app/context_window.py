@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.ai import build_system_prompt
+from app.settings import get_settings
+
+# Tokens the chat format adds around each message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Rough characters-per-token ratio used when no tokenizer is available
+_CHARS_PER_TOKEN = 4
+
+_TOKEN_CACHE_SIZE = 10_000
+_message_token_cache: "OrderedDict[int, int]" = OrderedDict()
+
+
+@lru_cache(maxsize=1)
+def _get_encoder() -> Optional[Callable[[str], list]]:
+    """Return a tiktoken encode function, or None to use the heuristic.
+
+    tiktoken fetches its BPE files on first use, so an offline host without a
+    warm cache falls back to counting characters.
+    """
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(get_settings().openai_model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return encoding.encode
+    except Exception:
+        return None
+
+
+async def load_encoder() -> None:
+    """Resolve the tokenizer in a worker thread if it isn't yet.
+
+    The first resolution may download BPE files, so it must not run on the
+    event loop; called at startup and before each window is built.
+    """
+    if _get_encoder.cache_info().currsize == 0:
+        await asyncio.to_thread(_get_encoder)
+
+
+def count_tokens(text: str) -> int:
+    encode = _get_encoder()
+    if encode is None:
+        return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+    return len(encode(text))
+
+
+def message_tokens(message_id: Optional[int], content: str) -> int:
+    """Token cost of one chat message, cached by id for persisted messages."""
+    if message_id is None:
+        return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    cached = _message_token_cache.get(message_id)
+    if cached is not None:
+        _message_token_cache.move_to_end(message_id)
+        return cached
+    tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    _message_token_cache[message_id] = tokens
+    if len(_message_token_cache) > _TOKEN_CACHE_SIZE:
+        _message_token_cache.popitem(last=False)
+    return tokens
+
+
+@dataclass
+class ContextWindow:
+    """Messages chosen for a prompt, oldest first, plus how they were picked."""
+
+    budget: int
+    reserved_tokens: int
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    message_ids: List[Optional[int]] = field(default_factory=list)
+    message_tokens: List[int] = field(default_factory=list)
+    tokens_used: int = 0
+    dropped: int = 0
+
+    @property
+    def available_tokens(self) -> int:
+        return max(self.budget - self.reserved_tokens, 0)
+
+
+def build_context_window(
+    newest_first: Sequence, budget: int, reserved_tokens: int
+) -> ContextWindow:
+    """Pick the newest messages that fit in `budget - reserved_tokens`.
+
+    `newest_first` holds rows with `id`, `role` and `content`. The newest
+    message is always kept so the current turn reaches the model even when it
+    alone exceeds the budget; selection stops at the first message that does
+    not fit so the window stays contiguous.
+    """
+    window = ContextWindow(budget=budget, reserved_tokens=reserved_tokens)
+    chosen = []
+    for index, row in enumerate(newest_first):
+        tokens = message_tokens(row.id, row.content)
+        if chosen and window.tokens_used + tokens > window.available_tokens:
+            window.dropped = len(newest_first) - index
+            break
+        chosen.append((row, tokens))
+        window.tokens_used += tokens
+
+    for row, tokens in reversed(chosen):
+        window.messages.append({"role": row.role, "content": row.content})
+        window.message_ids.append(row.id)
+        window.message_tokens.append(tokens)
+    return window
+
+
+async def load_window_rows(
+    db: AsyncSession, conversation_id: int, pending: Sequence[Dict[str, str]] = ()
+) -> List:
+    """Newest-first candidate rows for a window: `pending`, then stored history.
+
+    `pending` holds messages of the current turn that are not stored yet;
+    they follow the stored history and count as its newest entries.
+    """
+    # Resolved here so fitting the rows never blocks on the tokenizer
+    await load_encoder()
+    settings = get_settings()
+    unsaved = [
+        SimpleNamespace(id=None, role=m["role"], content=m["content"])
+        for m in reversed(pending)
+    ]
+    stored = (
+        await db.execute(
+            select(models.Message.id, models.Message.role, models.Message.content)
+            .where(models.Message.conversation_id == conversation_id)
+            .order_by(models.Message.id.desc())
+            .limit(max(settings.context_max_messages - len(unsaved), 0))
+        )
+    ).all()
+    return unsaved + list(stored)
+
+
+def fit_context_window(
+    rows: Sequence,
+    student_context_summary: str | None,
+    references: Sequence[str] = (),
+) -> ContextWindow:
+    """Fit `rows` from `load_window_rows` into the prompt token budget.
+
+    `references` are retrieved excerpts that go into the system prompt.
+    """
+    settings = get_settings()
+    reserved = (
+        count_tokens(build_system_prompt(student_context_summary, references))
+        + MESSAGE_OVERHEAD_TOKENS
+        + settings.context_reply_reserve_tokens
+    )
+    return build_context_window(rows, settings.context_token_budget, reserved)
+
+
+async def load_context_window(
+    db: AsyncSession,
+    conversation_id: int,
+    student_context_summary: str | None,
+    pending: Sequence[Dict[str, str]] = (),
+    references: Sequence[str] = (),
+) -> ContextWindow:
+    """Build the prompt history for a conversation within the token budget."""
+    rows = await load_window_rows(db, conversation_id, pending)
+    return fit_context_window(rows, student_context_summary, references)
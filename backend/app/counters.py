@@ -0,0 +1,186 @@
+"""Denormalized message counters and conversation activity.
+
+`StudentContext.message_count` is bumped in the same transaction as each
+message insert so the summarization trigger never has to count a student's
+whole history. Likewise each conversation keeps its message count, latest
+message time and a preview of the latest message, so the sidebar list is a
+single indexed query. Both also carry version counters, bumped by the same
+writes, that the read endpoints turn into ETags. The `rebuild_*` functions
+repair these from the messages table, e.g. for databases created before the
+columns existed:
+
+    python -m app.counters
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.db import SessionLocal, dialect_insert
+
+
+async def increment_message_count(
+    db: AsyncSession, student_id: int, by: int = 1
+) -> int:
+    """Add `by` to the student's counter in the current transaction.
+
+    New messages change the conversation list (counts, previews, activity
+    order), so this also bumps the list version. Creates the StudentContext
+    row if needed and returns the new count.
+    """
+    ctx = models.StudentContext
+    stmt = (
+        dialect_insert(db)(ctx)
+        .values(student_id=student_id, message_count=by, conversations_version=1)
+        .on_conflict_do_update(
+            index_elements=[ctx.student_id],
+            set_={
+                "message_count": ctx.message_count + by,
+                "conversations_version": ctx.conversations_version + 1,
+            },
+        )
+        .returning(ctx.message_count)
+    )
+    return (await db.execute(stmt)).scalar_one()
+
+
+async def bump_conversations_version(db: AsyncSession, student_id: int) -> None:
+    """Mark the student's conversation list as changed in the current
+    transaction, for writes that add no messages."""
+    ctx = models.StudentContext
+    await db.execute(
+        dialect_insert(db)(ctx)
+        .values(student_id=student_id, conversations_version=1)
+        .on_conflict_do_update(
+            index_elements=[ctx.student_id],
+            set_={"conversations_version": ctx.conversations_version + 1},
+        )
+    )
+
+
+PREVIEW_CHARS = 140
+
+
+def message_preview(text: str) -> str:
+    """Single-line start of a message, for conversation lists."""
+    return " ".join(text.split())[:PREVIEW_CHARS]
+
+
+async def record_conversation_activity(
+    db: AsyncSession, last_message: models.Message, added: int
+) -> None:
+    """Fold `added` new messages, ending with `last_message`, into the
+    conversation's denormalized columns in the current transaction."""
+    conv = models.Conversation
+    await db.execute(
+        update(conv)
+        .where(conv.id == last_message.conversation_id)
+        .values(
+            message_count=conv.message_count + added,
+            last_message_at=last_message.created_at,
+            last_message_preview=message_preview(last_message.content),
+            version=conv.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def rebuild_conversation_activity(db: AsyncSession) -> int:
+    """Recompute every conversation's count, latest time and preview.
+
+    Returns the number of conversations updated.
+    """
+    msg, conv = models.Message, models.Conversation
+    in_conv = msg.conversation_id == conv.id
+    result = await db.execute(
+        update(conv)
+        .values(
+            message_count=select(func.count(msg.id)).where(in_conv).scalar_subquery(),
+            last_message_at=func.coalesce(
+                select(func.max(msg.created_at)).where(in_conv).scalar_subquery(),
+                conv.created_at,
+            ),
+            last_message_preview=None,
+            version=conv.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    # Previews go through message_preview() so they match the ones written
+    # on send, whitespace collapsed
+    latest_ids = select(func.max(msg.id)).group_by(msg.conversation_id)
+    latest = await db.stream(
+        select(msg.conversation_id, msg.content).where(msg.id.in_(latest_ids))
+    )
+    async for rows in latest.partitions(500):
+        # ORM bulk UPDATE by primary key
+        await db.execute(
+            update(conv),
+            [
+                {"id": cid, "last_message_preview": message_preview(content)}
+                for cid, content in rows
+            ],
+        )
+    # Lists cached before the rebuild are stale too
+    await db.execute(
+        update(models.StudentContext)
+        .values(conversations_version=models.StudentContext.conversations_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def rebuild_message_counts(db: AsyncSession) -> int:
+    """Recompute every student's counter from the messages table.
+
+    Returns the number of counters that were wrong or missing.
+    """
+    per_student = (
+        select(
+            models.Conversation.student_id.label("student_id"),
+            func.count(models.Message.id).label("message_count"),
+        )
+        .join(models.Message, models.Message.conversation_id == models.Conversation.id)
+        .group_by(models.Conversation.student_id)
+        .subquery()
+    )
+    actual = func.coalesce(
+        select(per_student.c.message_count)
+        .where(per_student.c.student_id == models.StudentContext.student_id)
+        .scalar_subquery(),
+        0,
+    )
+    fixed = await db.execute(
+        update(models.StudentContext)
+        .where(models.StudentContext.message_count != actual)
+        .values(message_count=actual)
+        .execution_options(synchronize_session=False)
+    )
+    missing = await db.execute(
+        insert(models.StudentContext).from_select(
+            ["student_id", "message_count"],
+            select(per_student.c.student_id, per_student.c.message_count).where(
+                per_student.c.student_id.not_in(
+                    select(models.StudentContext.student_id)
+                )
+            ),
+        )
+    )
+    await db.commit()
+    return fixed.rowcount + missing.rowcount
+
+
+async def _main() -> None:
+    async with SessionLocal() as db:
+        repaired = await rebuild_message_counts(db)
+        conversations = await rebuild_conversation_activity(db)
+    print(f"Repaired {repaired} message counters")
+    print(f"Rebuilt activity for {conversations} conversations")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,27 +1,174 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from app.settings import get_settings
+from typing import Any, Dict, List
 
-settings = get_settings()
-engine = create_engine(
-    settings.database_url,
-    connect_args=(
-        {"check_same_thread": False}
-        if settings.database_url.startswith("sqlite")
-        else {}
-    ),
-    future=True,
-    echo=False,
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
 )
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.schema import CreateColumn
+from app.metrics import instrument_engine
+from app.settings import Settings, get_settings
+
+# Async drivers for each backend; plain URLs in .env keep working.
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def to_async_url(database_url: str) -> str:
+    """Rewrite a sync database URL to use the matching async driver."""
+    scheme, sep, rest = database_url.partition("://")
+    if "+" in scheme or not sep:
+        return database_url
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+ENGINE_PROFILES = ("basic", "sqlite-wal", "postgres")
+
+
+def resolve_profile(database_url: str, profile: str = "auto") -> str:
+    """Map "auto" to the tuned profile for the URL's backend."""
+    if profile == "auto":
+        return "sqlite-wal" if database_url.startswith("sqlite") else "postgres"
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(
+            f"Unknown db_profile {profile!r}; expected auto or one of {ENGINE_PROFILES}"
+        )
+    return profile
+
+
+def sqlite_pragmas(settings: Settings) -> List[str]:
+    """PRAGMAs run on every new connection of the "sqlite-wal" profile.
+
+    WAL lets readers proceed while a write is in progress; synchronous=NORMAL
+    is durable across application crashes in WAL mode and only skips the
+    fsync per commit.
+    """
+    return [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size_bytes}",
+        # Negative values are KiB rather than pages
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib}",
+    ]
+
+
+def engine_options(
+    database_url: str, profile: str, settings: Settings
+) -> Dict[str, Any]:
+    """Keyword arguments for `create_async_engine` under an engine profile."""
+    profile = resolve_profile(database_url, profile)
+    options: Dict[str, Any] = {"echo": False}
+    if database_url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        in_memory = make_url(database_url).database in (None, "", ":memory:")
+        if profile == "sqlite-wal" and not in_memory:
+            # aiosqlite defaults to NullPool for files, which reopens the file
+            # and re-runs the PRAGMAs for every session
+            options.update(
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                pool_timeout=settings.db_pool_timeout_seconds,
+            )
+    elif profile == "postgres":
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+            pool_recycle=settings.db_pool_recycle_seconds,
+            pool_pre_ping=settings.db_pool_pre_ping,
+        )
+    return options
+
 
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+def make_engine(
+    database_url: str, profile: str = "auto", settings: Settings | None = None
+) -> AsyncEngine:
+    """Create the async engine for `database_url` under an engine profile."""
+    settings = settings or get_settings()
+    profile = resolve_profile(database_url, profile)
+    new_engine = create_async_engine(
+        to_async_url(database_url), **engine_options(database_url, profile, settings)
+    )
+    if profile == "sqlite-wal" and database_url.startswith("sqlite"):
+        pragmas = sqlite_pragmas(settings)
+
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    return new_engine
+
+
+settings = get_settings()
+engine = make_engine(settings.database_url, settings.db_profile, settings)
+instrument_engine(engine)
+
+SessionLocal = async_sessionmaker(
+    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """Dependency to get database session."""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+def dialect_insert(db: AsyncSession):
+    """Return the session backend's `insert`, which supports ON CONFLICT."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"No upsert support for {dialect!r}")
+    return insert
+
+
+def add_missing_columns(conn: Connection) -> List[str]:
+    """Add model columns that are missing from existing tables.
+
+    `create_all` only creates whole tables, so databases created before a
+    model gained a column need it added in place. Run via `conn.run_sync`;
+    returns the added columns as "table.column".
+    """
+    added: List[str] = []
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def add_missing_indexes(conn: Connection) -> None:
+    """Create model indexes that are missing from existing tables."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
@@ -0,0 +1,345 @@
+"""Persistent, content-addressed cache of embedding vectors.
+
+Vectors are appended as raw float32 rows to a data file that is read back
+through `numpy.memmap`, so a warm start maps the file instead of loading
+it, and a lookup touches only the rows it needs. A small SQLite file maps
+sha256(model, text) to a row number and tracks last use for LRU eviction.
+Evicted rows stay in the data file until `compact()` rewrites it; that
+happens automatically once dead rows outnumber live ones. Compaction
+writes a new generation of the file and leaves the previous one in place,
+since another worker may still be reading it; generations older than that
+are deleted on the next compaction.
+
+File and SQLite work is blocking, so `CachedEmbeddings` runs it in worker
+threads; the cache itself serializes callers with a lock.
+
+One cache exists per (directory, model, dim); `CachedEmbeddings` wraps any
+embedding provider with it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.metrics import REGISTRY
+
+
+class EmbeddingCache:
+    def __init__(
+        self, directory: str | os.PathLike, model: str, dim: int, max_entries: int
+    ):
+        self.model = model
+        self.dim = dim
+        self.max_entries = max_entries
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        safe_model = "".join(c if c.isalnum() or c in "-_." else "_" for c in model)
+        self._prefix = self.directory / f"{safe_model}-{dim}"
+        self._db = sqlite3.connect(
+            f"{self._prefix}.idx", check_same_thread=False, isolation_level=None
+        )
+        self._db.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key BLOB PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS ix_entries_last_used ON entries (last_used);"
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);"
+            "INSERT OR IGNORE INTO meta VALUES ('generation', 0), ('rows', 0);"
+        )
+        self._lock = threading.RLock()
+        # Metrics read through their own connection; under WAL that never
+        # waits for a writer, so a scrape can't stall behind a compaction
+        self._stats_db = sqlite3.connect(
+            f"{self._prefix}.idx", check_same_thread=False, isolation_level=None
+        )
+        self._stats_lock = threading.Lock()
+        self._map: Optional[np.memmap] = None
+        self._mapped: Tuple[int, int] = (-1, 0)  # (generation, rows)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compactions = 0
+
+    def key_for(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).digest()
+
+    def _data_path(self, generation: int) -> Path:
+        return Path(f"{self._prefix}.{generation}.f32")
+
+    def _meta(self, db: Optional[sqlite3.Connection] = None) -> Tuple[int, int]:
+        db = db or self._db
+        values = dict(db.execute("SELECT name, value FROM meta").fetchall())
+        return values["generation"], values["rows"]
+
+    def _vectors(self, generation: int, rows: int) -> np.ndarray:
+        """The data file as an (rows, dim) memmap, remapped only when it grew."""
+        if self._mapped != (generation, rows) or self._map is None:
+            self._map = np.memmap(
+                self._data_path(generation),
+                dtype=np.float32,
+                mode="r",
+                shape=(rows, self.dim),
+            )
+            self._mapped = (generation, rows)
+        return self._map
+
+    def get_many(self, texts: Sequence[str]) -> Tuple[np.ndarray, List[int]]:
+        """Cached vectors for `texts` and the indices of the ones missing.
+
+        Rows for missing texts are left as zeros.
+        """
+        with self._lock:
+            return self._get_many(texts)
+
+    def _get_many(self, texts: Sequence[str]) -> Tuple[np.ndarray, List[int]]:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        keys = [self.key_for(t) for t in texts]
+        found: Dict[bytes, int] = {}
+        self._db.execute("BEGIN")
+        try:
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                marks = ",".join("?" * len(batch))
+                found.update(
+                    self._db.execute(
+                        f"SELECT key, row FROM entries WHERE key IN ({marks})", batch
+                    ).fetchall()
+                )
+            generation, rows = self._meta()
+        finally:
+            self._db.execute("COMMIT")
+
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        hit_positions = [i for i, key in enumerate(keys) if key in found]
+        if hit_positions:
+            vectors = self._vectors(generation, rows)
+            out[hit_positions] = vectors[[found[keys[i]] for i in hit_positions]]
+            now = time.time()
+            self._db.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(now, key) for key in set(found)],
+            )
+        self.hits += len(hit_positions)
+        self.misses += len(missing)
+        return out, missing
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        with self._lock:
+            self._put_many(texts, vectors)
+
+    def _put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        unique: Dict[bytes, int] = {}
+        for i, text in enumerate(texts):
+            unique.setdefault(self.key_for(text), i)
+        if not unique:
+            return
+        now = time.time()
+        # IMMEDIATE serializes writers, so row numbers match the append order
+        # even with several worker processes sharing the files
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            new = [
+                (key, i)
+                for key, i in unique.items()
+                if self._db.execute(
+                    "SELECT 1 FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                is None
+            ]
+            if new:
+                generation, rows = self._meta()
+                with open(self._data_path(generation), "ab") as data:
+                    data.seek(rows * self.dim * 4)
+                    data.truncate()
+                    data.write(vectors[[i for _, i in new]].tobytes())
+                self._db.executemany(
+                    "INSERT INTO entries VALUES (?, ?, ?)",
+                    [(key, rows + n, now) for n, (key, _) in enumerate(new)],
+                )
+                self._db.execute(
+                    "UPDATE meta SET value = ? WHERE name = 'rows'", (rows + len(new),)
+                )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        if new:
+            self._evict_if_needed()
+
+    def _entry_count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _evict_if_needed(self) -> None:
+        entries = self._entry_count()
+        if entries <= self.max_entries:
+            return
+        # Drop the least recently used tenth below the cap in one go
+        excess = entries - int(self.max_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self.evictions += excess
+        _, rows = self._meta()
+        if rows - (entries - excess) > entries - excess:
+            self._compact()
+
+    def compact(self) -> None:
+        """Rewrite the data file with live rows only, as a new generation."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            generation, rows = self._meta()
+            live = self._db.execute(
+                "SELECT key, row FROM entries ORDER BY row"
+            ).fetchall()
+            old = self._vectors(generation, rows) if rows else None
+            new_path = self._data_path(generation + 1)
+            with open(new_path, "wb") as data:
+                for start in range(0, len(live), 4096):
+                    batch = [row for _, row in live[start : start + 4096]]
+                    data.write(np.asarray(old[batch]).tobytes())
+            self._db.executemany(
+                "UPDATE entries SET row = ? WHERE key = ?",
+                [(n, key) for n, (key, _) in enumerate(live)],
+            )
+            self._db.execute(
+                "UPDATE meta SET value = ? WHERE name = 'generation'", (generation + 1,)
+            )
+            self._db.execute(
+                "UPDATE meta SET value = ? WHERE name = 'rows'", (len(live),)
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._map = None
+        self.compactions += 1
+        self._remove_retired(generation + 1)
+
+    def _remove_retired(self, generation: int) -> None:
+        """Delete data files from before the generation preceding `generation`.
+
+        The one just replaced is kept: another process may have read its
+        number from the index and not yet opened or finished with the file.
+        """
+        prefix = f"{self._prefix.name}."
+        for path in self.directory.glob(f"{prefix}*.f32"):
+            number = path.name[len(prefix) : -len(".f32")]
+            if number.isdigit() and int(number) < generation - 1:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def clear(self) -> None:
+        with self._lock:
+            # A fresh, empty generation, so readers of the old file are unaffected
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                generation, _ = self._meta()
+                self._db.execute("DELETE FROM entries")
+                self._db.execute("UPDATE meta SET value = 0 WHERE name = 'rows'")
+                self._db.execute(
+                    "UPDATE meta SET value = ? WHERE name = 'generation'",
+                    (generation + 1,),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._map = None
+            self._remove_retired(generation + 1)
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            db = self._stats_db
+            db.execute("BEGIN")
+            try:
+                generation, rows = self._meta(db)
+                entries = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            finally:
+                db.execute("COMMIT")
+        path = self._data_path(generation)
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "dead_rows": rows - entries,
+            "evictions": self.evictions,
+            "compactions": self.compactions,
+            "file_bytes": path.stat().st_size if path.exists() else 0,
+        }
+
+
+class CachedEmbeddings:
+    """Embedding provider that only sends cache misses to `provider`."""
+
+    def __init__(self, provider, cache: EmbeddingCache):
+        self.provider = provider
+        self.cache = cache
+        self.model = provider.model
+        self.dim = provider.dim
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors, missing = await asyncio.to_thread(self.cache.get_many, texts)
+        if missing:
+            # Identical texts in one batch are embedded once
+            pending = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = await self.provider.embed(pending)
+            await asyncio.to_thread(self.cache.put_many, pending, fresh)
+            by_text = dict(zip(pending, fresh))
+            for i in missing:
+                vectors[i] = by_text[texts[i]]
+        return vectors
+
+
+_caches: Dict[Tuple[str, str, int], EmbeddingCache] = {}
+
+
+def get_embedding_cache(
+    directory: str, model: str, dim: int, max_entries: int
+) -> EmbeddingCache:
+    """The process-wide cache for a (directory, model, dim)."""
+    key = (str(Path(directory).resolve()), model, dim)
+    cache = _caches.get(key)
+    if cache is None:
+        cache = _caches[key] = EmbeddingCache(directory, model, dim, max_entries)
+    return cache
+
+
+@REGISTRY.collector
+def _embedding_cache_lines() -> List[str]:
+    lines: List[str] = []
+    kinds = (
+        ("hits", "counter"),
+        ("misses", "counter"),
+        ("evictions", "counter"),
+        ("entries", "gauge"),
+        ("dead_rows", "gauge"),
+        ("file_bytes", "gauge"),
+    )
+    all_stats = [(cache.model, cache.stats()) for cache in _caches.values()]
+    for key, kind in kinds:
+        name = f"embedding_cache_{key}" + ("_total" if kind == "counter" else "")
+        lines.append(f"# TYPE {name} {kind}")
+        for model, stats in all_stats:
+            lines.append(f'{name}{{model="{model}"}} {stats[key]}')
+    return lines
@@ -1,12 +1,46 @@
 from __future__ import annotations
 
-from typing import List
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import signal
+from datetime import datetime
+from typing import Literal, Optional
+import anyio
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from fastapi.responses import (
+    FileResponse,
+    ORJSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import (
+    DateTime,
+    String,
+    event,
+    insert,
+    inspect,
+    literal,
+    select,
+    tuple_,
+    type_coerce,
+)
 
-from app.db import Base, engine, SessionLocal, get_db
+from app.db import (
+    Base,
+    engine,
+    SessionLocal,
+    get_db,
+    dialect_insert,
+    add_missing_columns,
+    add_missing_indexes,
+)
 from app import models
 from app.schemas import (
     LoginRequest,
@@ -16,154 +50,753 @@ from app.schemas import (
     MessageCreate,
     MessageOut,
     MessagesResponse,
+    MessageSearchResponse,
     ConversationsResponse,
+    SummaryJobOut,
+    ContextWindowOut,
+    ReloadConfigOut,
+    CacheStatsOut,
+    DocumentOut,
+    DocumentUploadOut,
+    DocumentsResponse,
+    SuggestionsResponse,
+    SuggestionRunOut,
+)
+from app.ai import (
+    ModelUnavailable,
+    close_openai_client,
+    generate_assistant_reply,
+    reload_settings,
+    stream_assistant_reply,
+)
+from app.cache import LRUCache, response_cache
+from app.compression import CompressionMiddleware
+from app.context_window import (
+    fit_context_window,
+    load_context_window,
+    load_encoder,
+    load_window_rows,
 )
-from app.ai import generate_assistant_reply, summarize_student_context
+from app.counters import (
+    bump_conversations_version,
+    increment_message_count,
+    rebuild_conversation_activity,
+    rebuild_message_counts,
+    record_conversation_activity,
+)
+from app.metrics import MetricsMiddleware, render_metrics
+from app.retrieval import retrieval_index, retrieve_references
+from app.search import install_message_search, search_messages
+from app.settings import get_settings
+from app.storage import BlobTooLarge, blob_store
+from app.suggestions import suggestion_job, suggestion_triggers
+from app.summarizer import summary_queue
 
-app = FastAPI(title="College Counseling AI - Cupcake")
+app = FastAPI(
+    title="College Counseling AI - Cupcake", default_response_class=ORJSONResponse
+)
 
+app.add_middleware(
+    CompressionMiddleware, minimum_size=get_settings().response_compression_min_bytes
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(MetricsMiddleware)
 
 
 @app.on_event("startup")
-def on_startup():
-    Base.metadata.create_all(bind=engine)
+async def on_startup():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        added_columns = await conn.run_sync(add_missing_columns)
+        await conn.run_sync(add_missing_indexes)
+        await conn.run_sync(install_message_search)
+    if "student_context.message_count" in added_columns:
+        async with SessionLocal() as db:
+            await rebuild_message_counts(db)
+    if "conversations.message_count" in added_columns:
+        async with SessionLocal() as db:
+            await rebuild_conversation_activity(db)
+    await load_encoder()
+
+    # `kill -HUP <pid>` re-reads .env without a restart
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(
+            signal.SIGHUP, lambda: loop.create_task(reload_settings())
+        )
+    except (NotImplementedError, AttributeError, RuntimeError):
+        pass  # no SIGHUP on Windows / outside the main thread
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await summary_queue.shutdown()
+    await suggestion_triggers.shutdown()
+    await retrieval_index.shutdown()
+    await close_openai_client()
+
+
+# email -> StudentOut, so repeat logins (every session restore) skip the DB
+student_cache: LRUCache[StudentOut] = LRUCache(get_settings().student_cache_max_entries)
+
+
+@event.listens_for(models.Student, "after_update")
+@event.listens_for(models.Student, "after_delete")
+def _forget_student(mapper, connection, target) -> None:
+    student_cache.pop(target.email)
+    # An email change also leaves the old address cached
+    for email in inspect(target).attrs.email.history.deleted or ():
+        student_cache.pop(email)
 
 
 @app.post("/auth/login", response_model=StudentOut)
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    student = (
-        db.query(models.Student)
-        .filter(models.Student.email == payload.email)
-        .one_or_none()
-    )
-    if student is None:
-        student = models.Student(email=payload.email, name=payload.name or "Student")
-        db.add(student)
-        db.commit()
-        db.refresh(student)
+async def login(payload: LoginRequest, db: AsyncSession = Depends(get_db)):
+    cached = student_cache.get(payload.email)
+    if cached is not None:
+        return cached
+    Student = models.Student
+    columns = (Student.id, Student.email, Student.name)
+    # Concurrent first logins both land here; the loser just reads the winner's row
+    row = (
+        await db.execute(
+            dialect_insert(db)(Student)
+            .values(email=payload.email, name=payload.name or "Student")
+            .on_conflict_do_nothing(index_elements=[Student.email])
+            .returning(*columns)
+        )
+    ).one_or_none()
+    if row is None:
+        row = (
+            await db.execute(select(*columns).where(Student.email == payload.email))
+        ).one()
+    await db.commit()
+    student = StudentOut.model_validate(row)
+    student_cache.set(payload.email, student)
     return student
 
 
+def _check_cursors(before_id: Optional[int], after_id: Optional[int]) -> None:
+    if before_id is not None and after_id is not None:
+        raise HTTPException(
+            status_code=400, detail="Use either before_id or after_id, not both"
+        )
+
+
+def _encode_list_cursor(sort: str, direction: str, value, row_id: int) -> str:
+    """Opaque cursor holding the sort key of the last row on a page.
+
+    `value` is the sort column exactly as stored, so the next page compares
+    against what this page saw even if the row has moved since.
+    """
+    if isinstance(value, datetime):
+        stored = ["dt", value.isoformat()]
+    else:
+        stored = ["s", value]
+    token = json.dumps([sort, direction, *stored, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
+
+
+def _decode_list_cursor(cursor: str, sort: str) -> tuple:
+    """(direction, bound sort value, id) from `_encode_list_cursor`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, direction, kind, value, row_id = json.loads(
+            base64.urlsafe_b64decode(padded.encode())
+        )
+        if direction not in ("before", "after") or not isinstance(row_id, int):
+            raise ValueError(direction)
+        if kind == "dt":
+            bound = literal(datetime.fromisoformat(value), DateTime)
+        elif kind == "s" and isinstance(value, str):
+            bound = literal(value, String)
+        else:
+            raise ValueError(kind)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(
+            status_code=400, detail=f"Cursor was issued for sort={cursor_sort}"
+        )
+    return direction, bound, row_id
+
+
+def _etag(request: Request, kind: str, key: int, version: int) -> str:
+    """Weak validator for one version of a listing, per query string."""
+    params = hashlib.sha1(
+        str(sorted(request.query_params.multi_items())).encode()
+    ).hexdigest()[:12]
+    return f'W/"{kind}-{key}-{version}-{params}"'
+
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 if the client's If-None-Match matches `etag`, else None.
+
+    Freshly rendered responses carry the tag so clients can revalidate.
+    """
+    header = request.headers.get("if-none-match")
+    if header is not None:
+        # Weak comparison: W/ prefixes are ignored on both sides
+        tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+        if "*" in tags or etag.removeprefix("W/") in tags:
+            return Response(status_code=304, headers=_validator_headers(etag))
+    return None
+
+
+def _validator_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def _columns(schema: type[BaseModel], entity) -> list:
+    """The columns behind `schema`'s fields.
+
+    Read-only listings select these as plain tuples and hand them straight
+    to orjson, skipping identity-map bookkeeping and per-row validation.
+    """
+    return [getattr(entity, name) for name in schema.model_fields]
+
+
 @app.get("/conversations/{student_id}", response_model=ConversationsResponse)
-def list_conversations(student_id: int, db: Session = Depends(get_db)):
-    convos = (
-        db.query(models.Conversation)
-        .filter(models.Conversation.student_id == student_id)
-        .order_by(models.Conversation.created_at.desc())
-        .all()
+async def list_conversations(
+    student_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    sort: Literal["created", "activity"] = "created",
+    *,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    """List a student's conversations, one keyset page at a time.
+
+    Newest first by default; `sort=activity` orders by latest message
+    instead. `next_cursor` is set when more rows remain in that direction;
+    pass it back as `cursor` to continue. It carries the last row's sort
+    key, so a conversation that gets a new message between pages is not
+    listed twice or skipped over. `before_id` and `after_id` start a page
+    below or above a conversation's current position. Counts, latest-message
+    times and previews are stored on the rows, so each page is a single
+    query. Answers If-None-Match with 304 from the list version alone.
+    """
+    _check_cursors(before_id, after_id)
+    if cursor is not None and (before_id is not None or after_id is not None):
+        raise HTTPException(
+            status_code=400, detail="Use either cursor or before_id/after_id"
+        )
+    version = await db.scalar(
+        select(models.StudentContext.conversations_version).where(
+            models.StudentContext.student_id == student_id
+        )
+    )
+    etag = _etag(request, "conversations", student_id, version or 0)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    Conversation = models.Conversation
+    sort_column = (
+        Conversation.last_message_at if sort == "activity" else Conversation.created_at
     )
-    return {"conversations": convos}
+    sort_key = tuple_(sort_column, Conversation.id)
+    fields = list(ConversationOut.model_fields)
+    # The sort column as stored (text on SQLite), for the next cursor
+    stored_key = type_coerce(sort_column, String).label("cursor_key")
+    query = select(*_columns(ConversationOut, Conversation), stored_key).where(
+        Conversation.student_id == student_id
+    )
+    direction = "after" if after_id is not None else "before"
+    anchor = None
+    if cursor is not None:
+        direction, cursor_value, cursor_id = _decode_list_cursor(cursor, sort)
+        anchor = tuple_(cursor_value, cursor_id)
+    elif before_id is not None or after_id is not None:
+        anchor_id = after_id if after_id is not None else before_id
+        anchor_value = (
+            select(sort_column).where(Conversation.id == anchor_id).scalar_subquery()
+        )
+        anchor = tuple_(anchor_value, anchor_id)
+    if anchor is not None:
+        query = query.where(
+            sort_key > anchor if direction == "after" else sort_key < anchor
+        )
 
+    if direction == "after":
+        order = (sort_column.asc(), Conversation.id.asc())
+    else:
+        order = (sort_column.desc(), Conversation.id.desc())
+    convos = (await db.execute(query.order_by(*order).limit(limit + 1))).all()
 
-@app.post("/conversations", response_model=ConversationOut)
-def create_conversation(payload: ConversationCreate, db: Session = Depends(get_db)):
-    student = (
-        db.query(models.Student)
-        .filter(models.Student.id == payload.student_id)
-        .one_or_none()
+    has_more = len(convos) > limit
+    convos = convos[:limit]
+    next_cursor = None
+    if has_more:
+        last = convos[-1]
+        next_cursor = _encode_list_cursor(sort, direction, last.cursor_key, last.id)
+    if direction == "after":
+        convos.reverse()
+    return ORJSONResponse(
+        {
+            # zip() drops the trailing cursor_key column
+            "conversations": [dict(zip(fields, row)) for row in convos],
+            "next_cursor": next_cursor,
+        },
+        headers=_validator_headers(etag),
     )
+
+
+@app.post("/conversations", response_model=ConversationOut)
+async def create_conversation(
+    payload: ConversationCreate, db: AsyncSession = Depends(get_db)
+):
+    student = await db.get(models.Student, payload.student_id)
     if student is None:
         raise HTTPException(status_code=404, detail="Student not found")
     title = payload.title or "New Conversation"
     conv = models.Conversation(student_id=payload.student_id, title=title)
     db.add(conv)
-    db.commit()
-    db.refresh(conv)
+    await bump_conversations_version(db, payload.student_id)
+    await db.commit()
+    await db.refresh(conv)
     return conv
 
 
 @app.get("/conversations/{conversation_id}/messages", response_model=MessagesResponse)
-def get_messages(conversation_id: int, db: Session = Depends(get_db)):
-    conv = (
-        db.query(models.Conversation)
-        .filter(models.Conversation.id == conversation_id)
-        .one_or_none()
+async def get_messages(
+    conversation_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    since_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=500),
+    *,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    """Return one keyset page of a conversation's messages, oldest first.
+
+    Without a cursor this is the newest page; `before_id` pages backwards
+    through older messages and `after_id` forwards through newer ones.
+    `since_id` is for delta sync: a client passes the newest id it holds and
+    gets only the rows after it, an index range scan on (conversation_id, id).
+    `next_cursor` is set when more rows remain in that direction. Answers
+    If-None-Match with 304 from the conversation version alone.
+    """
+    _check_cursors(before_id, after_id)
+    if since_id is not None:
+        if before_id is not None or after_id is not None:
+            raise HTTPException(
+                status_code=400, detail="since_id cannot be combined with a cursor"
+            )
+        after_id = since_id
+    version = await db.scalar(
+        select(models.Conversation.version).where(
+            models.Conversation.id == conversation_id
+        )
     )
+    if version is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    etag = _etag(request, "messages", conversation_id, version)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    query = select(*_columns(MessageOut, models.Message)).where(
+        models.Message.conversation_id == conversation_id
+    )
+    if after_id is not None:
+        query = query.where(models.Message.id > after_id).order_by(
+            models.Message.id.asc()
+        )
+    else:
+        if before_id is not None:
+            query = query.where(models.Message.id < before_id)
+        query = query.order_by(models.Message.id.desc())
+    msgs = (await db.execute(query.limit(limit + 1))).all()
+
+    has_more = len(msgs) > limit
+    msgs = msgs[:limit]
+    next_cursor = msgs[-1].id if has_more else None
+    if after_id is None:
+        msgs.reverse()
+    return ORJSONResponse(
+        {"messages": [row._asdict() for row in msgs], "next_cursor": next_cursor},
+        headers=_validator_headers(etag),
+    )
+
+
+async def _get_conversation_or_404(
+    db: AsyncSession, conversation_id: int
+) -> models.Conversation:
+    conv = await db.get(models.Conversation, conversation_id)
     if conv is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    msgs = (
-        db.query(models.Message)
-        .filter(models.Message.conversation_id == conversation_id)
-        .order_by(models.Message.created_at.asc())
-        .all()
+    return conv
+
+
+def _maybe_schedule_summary(student_id: int, total_messages: int, added: int) -> None:
+    # Periodically update student context (every 6 messages total for this student)
+    if total_messages // 6 > (total_messages - added) // 6:
+        summary_queue.schedule(student_id)
+
+
+async def _load_turn_context(
+    db: AsyncSession, conversation_id: int
+) -> tuple[models.Conversation, str | None]:
+    """Fetch a conversation and its student's summary in one query."""
+    row = (
+        await db.execute(
+            select(models.Conversation, models.StudentContext.context_summary)
+            .outerjoin(
+                models.StudentContext,
+                models.StudentContext.student_id == models.Conversation.student_id,
+            )
+            .where(models.Conversation.id == conversation_id)
+        )
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return row[0], row[1]
+
+
+async def _build_turn_prompt(
+    db: AsyncSession, conversation_id: int, content: str
+) -> tuple[models.Conversation, list[dict[str, str]], str | None, list[str]]:
+    conv, ctx_summary = await _load_turn_context(db, conversation_id)
+    rows = await load_window_rows(
+        db, conv.id, pending=[{"role": "user", "content": content}]
     )
-    return {"messages": msgs}
+    # All reads are done: release the connection before the embedding and
+    # model calls, which are HTTP requests
+    await db.commit()
+    # Excerpts from documents and other conversations relevant to this turn
+    references = await retrieve_references(conv, content)
+    # Newest history that fits the prompt token budget, ending with this turn
+    window = fit_context_window(rows, ctx_summary, references)
+    return conv, window.messages, ctx_summary, references
+
+
+async def _store_messages(
+    db: AsyncSession, conv: models.Conversation, messages: list[dict]
+) -> list[models.Message]:
+    """Persist messages of a turn and bump the counters in one commit."""
+    # One multi-row INSERT ... RETURNING; row order is not guaranteed, the
+    # ids still follow the VALUES order
+    inserted = sorted(
+        (
+            await db.scalars(
+                insert(models.Message).returning(models.Message),
+                [{"conversation_id": conv.id, **message} for message in messages],
+            )
+        ).all(),
+        key=lambda m: m.id,
+    )
+    added = len(inserted)
+    await record_conversation_activity(db, inserted[-1], added=added)
+    total_messages = await increment_message_count(db, conv.student_id, by=added)
+    await db.commit()
+    _maybe_schedule_summary(conv.student_id, total_messages, added=added)
+    suggestion_triggers.notify(conv.student_id, "message_count", "essay_mentions")
+    retrieval_index.schedule_refresh(conv.student_id)
+    return inserted
+
+
+async def _store_turn(
+    db: AsyncSession, conv: models.Conversation, user_text: str, assistant_text: str
+) -> models.Message:
+    """Persist both messages of a turn in one commit; returns the reply."""
+    inserted = await _store_messages(
+        db,
+        conv,
+        [
+            {"role": "user", "content": user_text},
+            {"role": "assistant", "content": assistant_text},
+        ],
+    )
+    return inserted[-1]
 
 
 @app.post("/conversations/{conversation_id}/messages", response_model=MessageOut)
-def send_message(
-    conversation_id: int, payload: MessageCreate, db: Session = Depends(get_db)
+async def send_message(
+    conversation_id: int, payload: MessageCreate, db: AsyncSession = Depends(get_db)
 ):
-    conv = (
-        db.query(models.Conversation)
-        .filter(models.Conversation.id == conversation_id)
-        .one_or_none()
+    conv, history, ctx_summary, references = await _build_turn_prompt(
+        db, conversation_id, payload.content
     )
-    if conv is None:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+    assistant_text = await generate_assistant_reply(
+        history,
+        ctx_summary,
+        use_cache=not payload.bypass_cache,
+        references=references,
+    )
+    return await _store_turn(db, conv, payload.content, assistant_text)
+
 
-    # Store user message
-    user_msg = models.Message(
-        conversation_id=conversation_id, role="user", content=payload.content
+async def _store_reply(
+    db: AsyncSession, conv: models.Conversation, text: str, truncated: bool
+) -> models.Message:
+    """Persist a streamed reply; `truncated` if it did not finish."""
+    inserted = await _store_messages(
+        db, conv, [{"role": "assistant", "content": text, "truncated": truncated}]
     )
-    db.add(user_msg)
-    db.commit()
-    db.refresh(user_msg)
+    return inserted[0]
 
-    # Fetch recent history for prompt
-    recent_msgs = (
-        db.query(models.Message)
-        .filter(models.Message.conversation_id == conversation_id)
-        .order_by(models.Message.created_at.asc())
-        .limit(30)
-        .all()
+
+def _sse_event(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/conversations/{conversation_id}/messages/stream")
+async def send_message_stream(
+    conversation_id: int, payload: MessageCreate, db: AsyncSession = Depends(get_db)
+):
+    """Server-Sent Events variant of `send_message`.
+
+    The user message is saved before streaming starts. Emits
+    `data: {"delta": "..."}` events as tokens arrive, then a final
+    `event: done` carrying the persisted assistant `MessageOut`. A reply cut
+    off by a model error or a client disconnect is saved as far as it got,
+    with `truncated` set.
+    """
+    conv, history, ctx_summary, references = await _build_turn_prompt(
+        db, conversation_id, payload.content
+    )
+    # Saved up front so a disconnect mid-answer never loses the question
+    await _store_messages(db, conv, [{"role": "user", "content": payload.content}])
+
+    async def event_stream():
+        parts: list[str] = []
+        truncated = True
+        assistant_msg = None
+        try:
+            async for delta in stream_assistant_reply(
+                history,
+                ctx_summary,
+                use_cache=not payload.bypass_cache,
+                references=references,
+            ):
+                parts.append(delta)
+                yield _sse_event({"delta": delta})
+            truncated = False
+        except ModelUnavailable:
+            pass
+        finally:
+            # Runs on a client disconnect too, so the shield keeps the
+            # cancelled request from interrupting the write. The request's
+            # session is closed by now (dependencies exit before a streamed
+            # body runs), so the write gets a session of its own.
+            if parts:
+                with anyio.CancelScope(shield=True):
+                    async with SessionLocal() as session:
+                        assistant_msg = await _store_reply(
+                            session, conv, "".join(parts), truncated
+                        )
+        if assistant_msg is not None:
+            yield _sse_event(
+                MessageOut.model_validate(assistant_msg).model_dump(), event="done"
+            )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _find_document(
+    db: AsyncSession, student_id: int, sha256: str
+) -> models.Document | None:
+    return (
+        await db.execute(
+            select(models.Document).where(
+                models.Document.student_id == student_id,
+                models.Document.sha256 == sha256,
+            )
+        )
+    ).scalar_one_or_none()
+
+
+@app.post("/students/{student_id}/documents", response_model=DocumentUploadOut)
+async def upload_document(
+    student_id: int,
+    request: Request,
+    response: Response,
+    filename: str = Query(..., min_length=1, max_length=255),
+    db: AsyncSession = Depends(get_db),
+):
+    """Upload a document sent as the raw request body.
+
+    The body is streamed to the blob store and hashed as it arrives, never
+    held in memory whole. Uploading a file the student already has returns
+    the existing document (200, `deduplicated`) instead of a new one (201).
+    """
+    max_bytes = get_settings().document_max_bytes
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > max_bytes:
+        raise HTTPException(status_code=413, detail="Document too large")
+    if await db.get(models.Student, student_id) is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    # Don't hold a connection while the body uploads
+    await db.commit()
+
+    try:
+        blob = await blob_store.write_stream(request.stream(), max_bytes=max_bytes)
+    except BlobTooLarge:
+        raise HTTPException(status_code=413, detail="Document too large")
+
+    doc = await _find_document(db, student_id, blob.sha256)
+    deduplicated = doc is not None
+    if doc is None:
+        doc = models.Document(
+            student_id=student_id,
+            filename=filename,
+            content_type=request.headers.get(
+                "content-type", "application/octet-stream"
+            )[:100],
+            size_bytes=blob.size_bytes,
+            sha256=blob.sha256,
+        )
+        db.add(doc)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # A concurrent upload of the same file won the race
+            await db.rollback()
+            doc = await _find_document(db, student_id, blob.sha256)
+            deduplicated = True
+        else:
+            await db.refresh(doc)
+            suggestion_triggers.notify(student_id, "document_count")
+            retrieval_index.schedule_refresh(student_id)
+    response.status_code = 200 if deduplicated else 201
+    return DocumentUploadOut(
+        **DocumentOut.model_validate(doc).model_dump(), deduplicated=deduplicated
     )
-    history = [{"role": m.role, "content": m.content} for m in recent_msgs]
 
-    # Load student context
-    ctx = (
-        db.query(models.StudentContext)
-        .filter(models.StudentContext.student_id == conv.student_id)
-        .one_or_none()
+
+@app.get("/students/{student_id}/documents", response_model=DocumentsResponse)
+async def list_documents(student_id: int, db: AsyncSession = Depends(get_db)):
+    docs = (
+        (
+            await db.execute(
+                select(models.Document)
+                .where(models.Document.student_id == student_id)
+                .order_by(models.Document.id.desc())
+            )
+        )
+        .scalars()
+        .all()
     )
-    ctx_summary = ctx.context_summary if ctx else None
+    return {"documents": docs}
+
+
+@app.get("/students/{student_id}/search", response_model=MessageSearchResponse)
+async def search_student_messages(
+    student_id: int,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """Find a student's messages across all conversations, best match first."""
+    results = await search_messages(db, student_id, q, limit)
+    return {"query": q, "results": results}
 
-    assistant_text = generate_assistant_reply(history, ctx_summary)
 
-    assistant_msg = models.Message(
-        conversation_id=conversation_id, role="assistant", content=assistant_text
+@app.get("/documents/{document_id}/content")
+async def get_document_content(document_id: int, db: AsyncSession = Depends(get_db)):
+    doc = await db.get(models.Document, document_id)
+    if doc is None or not blob_store.exists(doc.sha256):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return FileResponse(
+        blob_store.path_for(doc.sha256),
+        media_type=doc.content_type,
+        filename=doc.filename,
     )
-    db.add(assistant_msg)
-    db.commit()
-    db.refresh(assistant_msg)
 
-    # Periodically update student context (every 6 messages total for this student)
-    total_messages = (
-        db.query(func.count(models.Message.id))
-        .join(
-            models.Conversation,
-            models.Message.conversation_id == models.Conversation.id,
+
+@app.get(
+    "/conversations/{conversation_id}/context-window", response_model=ContextWindowOut
+)
+async def get_context_window(conversation_id: int, db: AsyncSession = Depends(get_db)):
+    """Show which messages the next reply's prompt would include."""
+    _, ctx_summary = await _load_turn_context(db, conversation_id)
+    window = await load_context_window(db, conversation_id, ctx_summary)
+    return {
+        "conversation_id": conversation_id,
+        "budget": window.budget,
+        "reserved_tokens": window.reserved_tokens,
+        "tokens_used": window.tokens_used,
+        "dropped": window.dropped,
+        "message_ids": window.message_ids,
+        "message_tokens": window.message_tokens,
+    }
+
+
+@app.get("/students/{student_id}/summary-job", response_model=SummaryJobOut)
+async def get_summary_job(student_id: int):
+    return summary_queue.status(student_id)
+
+
+@app.get("/students/{student_id}/suggestions", response_model=SuggestionsResponse)
+async def list_suggestions(
+    student_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """A student's suggestions that have not been dismissed, newest first."""
+    suggestions = (
+        (
+            await db.execute(
+                select(models.Suggestion)
+                .where(
+                    models.Suggestion.student_id == student_id,
+                    models.Suggestion.dismissed_at.is_(None),
+                )
+                .order_by(models.Suggestion.suggested_on.desc())
+                .limit(limit)
+            )
         )
-        .filter(models.Conversation.student_id == conv.student_id)
-        .scalar()
+        .scalars()
+        .all()
     )
-    if total_messages and total_messages % 6 == 0:
-        try:
-            summarize_student_context(db, conv.student_id)
-        except Exception:
-            pass
+    return {"suggestions": suggestions}
 
-    return assistant_msg
+
+@app.post("/admin/suggestions/run", response_model=SuggestionRunOut)
+async def run_suggestions():
+    """Run the suggestion batch job now, as the nightly schedule would."""
+    return await suggestion_job.run()
+
+
+@app.post("/admin/reload-config", response_model=ReloadConfigOut)
+async def reload_config():
+    settings = await reload_settings()
+    return {
+        "ai_configured": bool(settings.openai_api_key),
+        "openai_model": settings.openai_model,
+    }
+
+
+@app.get("/admin/cache-stats", response_model=CacheStatsOut)
+async def cache_stats():
+    return response_cache.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 # Simple root
 @app.get("/")
-def root():
+async def root():
     return {"status": "ok"}
@@ -0,0 +1,390 @@
+"""Process metrics exposed at `GET /metrics` in Prometheus text format.
+
+Three sources feed the registry:
+
+- `MetricsMiddleware` times every request by route template and, through a
+  per-request context variable, collects the DB work done while serving it.
+- `instrument_engine` hooks SQLAlchemy cursor events to count and time
+  statements.
+- `llm_call` wraps model calls in `app.ai` to time them and record token
+  usage; `llm_operation` relabels calls made on behalf of summaries.
+
+Metrics live in this process only; with several workers, scrape each one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.cache import response_cache
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, _escape(str(value)))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        for labels, value in sorted(self._values.items()):
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}{label_str} {_format_value(value)}")
+        return lines
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # labels -> (per-bucket counts, sum, count)
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = ([0] * len(self.buckets), [0.0, 0])
+        counts, totals = series
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        totals[0] += value
+        totals[1] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(series[1][1]) if series else 0
+
+    def sum(self, *labels: str) -> float:
+        series = self._series.get(labels)
+        return series[1][0] if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        names = self.labelnames + ("le",)
+        for labels, (counts, (total, count)) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                label_str = _format_labels(names, labels + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {int(count)}")
+        return lines
+
+    def clear(self) -> None:
+        self._series.clear()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Counter | Histogram] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect: Callable[[], List[str]]) -> Callable[[], List[str]]:
+        """Register a function returning extra exposition lines at scrape time."""
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        for metric in self._metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, including streamed bodies.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DB_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries",
+    "Database statements issued while serving one request.",
+    ["method", "route"],
+    buckets=COUNT_BUCKETS,
+)
+HTTP_REQUEST_DB_SECONDS = REGISTRY.histogram(
+    "http_request_db_seconds",
+    "Time spent executing database statements while serving one request.",
+    ["method", "route"],
+)
+DB_QUERIES = REGISTRY.counter(
+    "db_queries_total", "Database statements executed.", ["statement"]
+)
+DB_QUERY_DURATION = REGISTRY.histogram(
+    "db_query_duration_seconds",
+    "Execution time of a single database statement.",
+    ["statement"],
+    buckets=QUERY_BUCKETS,
+)
+LLM_REQUEST_DURATION = REGISTRY.histogram(
+    "llm_request_duration_seconds",
+    "Model call time, to the last streamed token for streaming calls.",
+    ["operation", "outcome"],
+)
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "Tokens reported by the model API.", ["operation", "kind"]
+)
+RETRIEVAL_FAILURES = REGISTRY.counter(
+    "retrieval_failures_total",
+    "Retrieval steps that failed; turns then go without references.",
+    ["stage"],
+)
+SUGGESTION_FAILURES = REGISTRY.counter(
+    "suggestion_failures_total",
+    "Write-triggered suggestion runs that failed; the nightly job catches up.",
+)
+SUMMARY_DURATION = REGISTRY.histogram(
+    "student_summary_duration_seconds",
+    "Time to refresh one student's context summary.",
+    ["outcome"],
+)
+
+
+@REGISTRY.collector
+def _response_cache_lines() -> List[str]:
+    stats = response_cache.stats()
+    lines = []
+    for key, kind in (
+        ("hits", "counter"),
+        ("disk_hits", "counter"),
+        ("misses", "counter"),
+        ("saved_tokens", "counter"),
+        ("entries", "gauge"),
+    ):
+        name = f"response_cache_{key}" + ("_total" if kind == "counter" else "")
+        lines += [f"# TYPE {name} {kind}", f"{name} {stats[key]}"]
+    return lines
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def _statement_kind(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    kind = _statement_kind(statement)
+    DB_QUERIES.inc(kind)
+    DB_QUERY_DURATION.observe(elapsed, kind)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Count and time every statement executed through `engine`."""
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed to their end."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label to keep cardinality bounded
+            template = getattr(route, "path", None) or "<unmatched>"
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.observe(
+                elapsed, method, template, str(status["code"])
+            )
+            HTTP_REQUEST_DB_QUERIES.observe(stats.queries, method, template)
+            HTTP_REQUEST_DB_SECONDS.observe(stats.db_seconds, method, template)
+
+
+_llm_operation: ContextVar[Optional[str]] = ContextVar("llm_operation", default=None)
+
+
+@contextmanager
+def llm_operation(name: str) -> Iterator[None]:
+    """Label model calls made inside the block as `name` (e.g. "summary")."""
+    token = _llm_operation.set(name)
+    try:
+        yield
+    finally:
+        _llm_operation.reset(token)
+
+
+class LLMCall:
+    """Outcome and usage of one model call, filled in by the caller."""
+
+    def __init__(self, operation: str):
+        self.operation = _llm_operation.get() or operation
+        self.outcome = "ok"
+
+    def usage(self, usage) -> None:
+        """Record the API's usage object (prompt/completion/total tokens)."""
+        if usage is None:
+            return
+        for kind in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            tokens = getattr(usage, kind, None)
+            if tokens:
+                LLM_TOKENS.inc(
+                    self.operation, kind.replace("_tokens", ""), amount=tokens
+                )
+
+
+@contextmanager
+def llm_call(operation: str) -> Iterator[LLMCall]:
+    """Time a model call; an exception escaping the block marks it an error."""
+    call = LLMCall(operation)
+    started = time.perf_counter()
+    try:
+        yield call
+    except (GeneratorExit, asyncio.CancelledError):
+        # The client went away mid-stream
+        call.outcome = "cancelled"
+        raise
+    except Exception:
+        call.outcome = "error"
+        raise
+    finally:
+        LLM_REQUEST_DURATION.observe(
+            time.perf_counter() - started, call.operation, call.outcome
+        )
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
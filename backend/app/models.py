@@ -1,4 +1,16 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, func
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    Integer,
+    String,
+    Text,
+    DateTime,
+    ForeignKey,
+    Index,
+    UniqueConstraint,
+    func,
+)
 from sqlalchemy.orm import relationship
 from app.db import Base
 
@@ -20,6 +32,15 @@ class Student(Base):
         back_populates="student",
         cascade="all, delete-orphan",
     )
+    documents = relationship(
+        "Document", back_populates="student", cascade="all, delete-orphan"
+    )
+    deadlines = relationship(
+        "Deadline", back_populates="student", cascade="all, delete-orphan"
+    )
+    suggestions = relationship(
+        "Suggestion", back_populates="student", cascade="all, delete-orphan"
+    )
 
 
 class Conversation(Base):
@@ -29,6 +50,26 @@ class Conversation(Base):
     student_id = Column(Integer, ForeignKey("students.id"), nullable=False, index=True)
     title = Column(String(255), nullable=False, server_default="New Conversation")
     created_at = Column(DateTime, server_default=func.now())
+    # Denormalized from messages by the send path (see app.counters)
+    message_count = Column(Integer, nullable=False, server_default="0")
+    # Latest message time, or creation time while empty
+    last_message_at = Column(DateTime, default=func.now())
+    last_message_preview = Column(String(200))
+    # Bumped with every change to the messages, for ETags
+    version = Column(Integer, nullable=False, server_default="0")
+
+    # Keyset pagination of a student's conversations, newest or most active first
+    __table_args__ = (
+        Index(
+            "ix_conversations_student_id_created_at", "student_id", "created_at", "id"
+        ),
+        Index(
+            "ix_conversations_student_id_last_message_at",
+            "student_id",
+            "last_message_at",
+            "id",
+        ),
+    )
 
     student = relationship("Student", back_populates="conversations")
     messages = relationship(
@@ -45,16 +86,104 @@ class Message(Base):
     )
     role = Column(String(20), nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
+    # A streamed reply cut off by a model error or a client disconnect
+    truncated = Column(Boolean, nullable=False, default=False, server_default="0")
     created_at = Column(DateTime, server_default=func.now())
 
+    # Keyset pagination within a conversation
+    __table_args__ = (Index("ix_messages_conversation_id_id", "conversation_id", "id"),)
+
     conversation = relationship("Conversation", back_populates="messages")
 
 
+class Document(Base):
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    # Content hash; the bytes live in the blob store (see app.storage)
+    sha256 = Column(String(64), nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    # One row per distinct file per student, however often it is uploaded
+    __table_args__ = (
+        UniqueConstraint("student_id", "sha256", name="uq_documents_student_id_sha256"),
+    )
+
+    student = relationship("Student", back_populates="documents")
+
+
+class Deadline(Base):
+    __tablename__ = "deadlines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
+    title = Column(String(255), nullable=False)
+    # Naive UTC, like the server-side timestamps
+    due_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    # A student's upcoming deadlines, soonest first
+    __table_args__ = (
+        Index("ix_deadlines_student_id_due_at", "student_id", "due_at"),
+        Index("ix_deadlines_due_at", "due_at"),
+    )
+
+    student = relationship("Student", back_populates="deadlines")
+
+
+class Suggestion(Base):
+    __tablename__ = "suggestions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
+    kind = Column(String(50), nullable=False)  # name of the rule that fired
+    message = Column(Text, nullable=False)
+    # UTC day the suggestion is for
+    suggested_on = Column(Date, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    dismissed_at = Column(DateTime)
+
+    # No spam: at most one suggestion per student per day
+    __table_args__ = (
+        UniqueConstraint(
+            "student_id", "suggested_on", name="uq_suggestions_student_id_suggested_on"
+        ),
+    )
+
+    student = relationship("Student", back_populates="suggestions")
+
+
+# One run of the suggestion batch job and the watermarks it reached
+class SuggestionRun(Base):
+    __tablename__ = "suggestion_runs"
+
+    id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    # Highest Message.id and Deadline.id seen by this run
+    last_message_id = Column(Integer, nullable=False, server_default="0")
+    last_deadline_id = Column(Integer, nullable=False, server_default="0")
+    # Deadlines due up to here were already inside the reminder horizon
+    horizon_until = Column(DateTime)
+    candidates = Column(Integer, nullable=False, server_default="0")
+    created = Column(Integer, nullable=False, server_default="0")
+
+
 class StudentContext(Base):
     __tablename__ = "student_context"
 
     student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
     context_summary = Column(Text)
+    # Highest Message.id already folded into context_summary
+    last_summarized_message_id = Column(Integer)
+    # Messages across all of the student's conversations (see app.counters)
+    message_count = Column(Integer, nullable=False, server_default="0")
+    # Bumped with every change to the conversation list, for ETags
+    conversations_version = Column(Integer, nullable=False, server_default="0")
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     student = relationship("Student", back_populates="context")
@@ -0,0 +1,478 @@
+"""Per-student embedding index over uploaded documents and past messages.
+
+Each student's chunks live in one contiguous float32 matrix of unit vectors,
+so a top-k cosine query is a single matrix-vector product. Indexes are
+filled by background tasks, scheduled by the write paths and by searches,
+and topped up incrementally from per-student watermarks; a turn only embeds
+its query and searches what is already indexed. The indexes are not
+persisted, a restart rebuilds them from the database and blob store. API
+embeddings are kept in an on-disk cache (`app.embedding_cache`), so a
+rebuild only embeds new text.
+
+Embeddings come from a pluggable provider: OpenAI when configured, or the
+deterministic `HashingEmbeddings` (no network) for tests and local use.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Protocol, Sequence, Set
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.ai import get_openai_client, using_openai_client
+from app.cache import LRUCache
+from app.db import SessionLocal
+from app.embedding_cache import CachedEmbeddings, get_embedding_cache
+from app.metrics import RETRIEVAL_FAILURES, llm_call
+from app.settings import Settings, get_settings
+from app.storage import blob_store
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Content types whose bytes can be indexed as UTF-8 text
+_TEXT_TYPES = ("text/", "application/json", "application/xml")
+
+
+def chunk_text(text: str, max_chars: int = 1000, overlap: int = 150) -> List[str]:
+    """Split text into overlapping chunks, preferring paragraph boundaries."""
+    text = text.strip()
+    if not text:
+        return []
+    if len(text) <= max_chars:
+        return [text]
+    chunks: List[str] = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            # Break at the last paragraph, line or sentence end in the window
+            window = text[start:end]
+            for sep in ("\n\n", "\n", ". ", " "):
+                cut = window.rfind(sep, max_chars // 2)
+                if cut != -1:
+                    end = start + cut + len(sep)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class EmbeddingProvider(Protocol):
+    model: str
+    dim: int
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Return a (len(texts), dim) float32 array of unit vectors."""
+
+
+class HashingEmbeddings:
+    """Deterministic bag-of-words embeddings via feature hashing.
+
+    Needs no model or network; similarity reflects shared words only, which
+    is enough for tests and for running retrieval without an API key.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD_RE.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if value >> 63 else -1.0
+        return vector
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return normalize_rows(np.stack([self._embed_one(t) for t in texts]))
+
+
+class OpenAIEmbeddings:
+    """Embeddings from the OpenAI API, via the shared client."""
+
+    _BATCH = 256
+
+    def __init__(self, model: str, dim: int):
+        self.model = model
+        self.dim = dim
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        client = get_openai_client()
+        if client is None:
+            raise RuntimeError("OpenAI is not configured")
+        rows: List[List[float]] = []
+        for start in range(0, len(texts), self._BATCH):
+            batch = list(texts[start : start + self._BATCH])
+            with using_openai_client(client), llm_call("embedding") as call:
+                response = await client.embeddings.create(
+                    model=self.model, input=batch, dimensions=self.dim
+                )
+                call.usage(getattr(response, "usage", None))
+            rows.extend(item.embedding for item in response.data)
+        if not rows:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return normalize_rows(np.asarray(rows, dtype=np.float32))
+
+
+def get_embedding_provider(settings: Settings) -> Optional[EmbeddingProvider]:
+    """Provider for `settings.embedding_provider`, or None when disabled.
+
+    "auto" uses OpenAI when an API key is set; without one replies come from
+    the fallback text, so there is no prompt to enrich. OpenAI embeddings go
+    through the on-disk cache unless `embedding_cache_dir` is empty.
+    """
+    choice = settings.embedding_provider
+    if choice == "auto":
+        choice = "openai" if settings.openai_api_key else "none"
+    if choice == "openai":
+        provider = OpenAIEmbeddings(settings.embedding_model, settings.embedding_dim)
+        if not settings.embedding_cache_dir:
+            return provider
+        cache = get_embedding_cache(
+            settings.embedding_cache_dir,
+            provider.model,
+            provider.dim,
+            settings.embedding_cache_max_entries,
+        )
+        return CachedEmbeddings(provider, cache)
+    if choice == "hash":
+        return HashingEmbeddings(settings.embedding_dim)
+    return None
+
+
+@dataclass
+class Chunk:
+    source: str  # "document" or "message"
+    source_id: int
+    label: str
+    text: str
+
+
+@dataclass
+class SearchHit:
+    chunk: Chunk
+    score: float
+
+    def as_reference(self) -> str:
+        return f"[{self.chunk.label}] {self.chunk.text}"
+
+
+class StudentIndex:
+    """Growable (n, dim) float32 matrix of chunk vectors plus their metadata."""
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        # Conversation id per row (-1 for documents), for vectorized filtering
+        self._conversation_ids = np.empty(capacity, dtype=np.int64)
+        self.chunks: List[Chunk] = []
+        self.last_message_id = 0
+        self.last_document_id = 0
+        self.lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[: len(self.chunks)]
+
+    def add(
+        self,
+        vectors: np.ndarray,
+        chunks: Sequence[Chunk],
+        conversation_ids: Sequence[int],
+    ) -> None:
+        n, needed = len(self.chunks), len(self.chunks) + len(chunks)
+        if needed > len(self._vectors):
+            capacity = max(needed, 2 * len(self._vectors))
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[:n] = self._vectors[:n]
+            ids = np.empty(capacity, dtype=np.int64)
+            ids[:n] = self._conversation_ids[:n]
+            self._vectors, self._conversation_ids = grown, ids
+        self._vectors[n:needed] = vectors
+        self._conversation_ids[n:needed] = conversation_ids
+        self.chunks.extend(chunks)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        min_score: float = 0.0,
+        exclude_conversation_id: Optional[int] = None,
+    ) -> List[SearchHit]:
+        """Top-k chunks by cosine similarity to the unit vector `query`."""
+        n = len(self.chunks)
+        if n == 0 or k <= 0:
+            return []
+        scores = self.vectors @ query
+        if exclude_conversation_id is not None:
+            scores[self._conversation_ids[:n] == exclude_conversation_id] = -np.inf
+        if k < n:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(n)
+        top = top[np.argsort(-scores[top])]
+        return [
+            SearchHit(self.chunks[i], float(scores[i]))
+            for i in top
+            if scores[i] >= min_score
+        ]
+
+
+def _document_text(doc) -> Optional[str]:
+    is_text = doc.content_type.startswith(_TEXT_TYPES) or doc.filename.lower().endswith(
+        (".txt", ".md")
+    )
+    if not is_text or not blob_store.exists(doc.sha256):
+        return None
+    return blob_store.path_for(doc.sha256).read_text(encoding="utf-8", errors="replace")
+
+
+class RetrievalIndex:
+    """Process-wide set of per-student indexes, bounded by an LRU.
+
+    `schedule_refresh(student_id)` indexes new documents and messages in the
+    background after a short debounce, coalescing further writes. Refreshes
+    read in their own short sessions and embed after closing them, so no
+    request transaction or pooled connection is held across embedding calls.
+    """
+
+    # Messages embedded per batch while catching up on a backlog
+    _MESSAGE_BATCH = 500
+
+    def __init__(
+        self,
+        max_students: int = 256,
+        session_factory: Callable[[], AsyncSession] = SessionLocal,
+        debounce_seconds: float = 0.5,
+    ):
+        self._students: LRUCache[StudentIndex] = LRUCache(max_students)
+        self._provider: Optional[EmbeddingProvider] = None
+        self._provider_key: Optional[tuple] = None
+        self.session_factory = session_factory
+        self.debounce_seconds = debounce_seconds
+        # Students with a refresh queued, and those that changed during one
+        self._pending: Set[int] = set()
+        self._dirty: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.last_error: Optional[str] = None
+
+    def provider(self) -> Optional[EmbeddingProvider]:
+        settings = get_settings()
+        key = (
+            settings.embedding_provider,
+            settings.embedding_model,
+            settings.embedding_dim,
+            bool(settings.openai_api_key),
+        )
+        if key != self._provider_key:
+            # Vectors from different models are not comparable
+            self._provider, self._provider_key = get_embedding_provider(settings), key
+            self._students.clear()
+        return self._provider
+
+    def student(self, student_id: int, dim: int) -> StudentIndex:
+        index = self._students.get(student_id)
+        if index is None:
+            index = StudentIndex(dim)
+            self._students.set(student_id, index)
+        return index
+
+    def clear(self) -> None:
+        self._students.clear()
+        self._provider_key = None
+
+    def schedule_refresh(self, student_id: int) -> None:
+        """Index the student's new documents and messages in the background."""
+        if self.provider() is None:
+            return
+        if student_id in self._pending:
+            self._dirty.add(student_id)
+            return
+        self._pending.add(student_id)
+        task = asyncio.get_running_loop().create_task(self._run(student_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, student_id: int) -> None:
+        try:
+            await asyncio.sleep(self.debounce_seconds)
+            while True:
+                self._dirty.discard(student_id)
+                await self.refresh(student_id)
+                if student_id not in self._dirty:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.last_error = str(exc)
+            RETRIEVAL_FAILURES.inc("refresh")
+            logger.exception(
+                "Retrieval index refresh failed for student %s", student_id
+            )
+        finally:
+            self._pending.discard(student_id)
+            self._dirty.discard(student_id)
+
+    async def _load_new(self, student_id: int, index: StudentIndex):
+        """Documents and a batch of messages past the index's watermarks."""
+        async with self.session_factory() as db:
+            docs = (
+                await db.execute(
+                    select(
+                        models.Document.id,
+                        models.Document.filename,
+                        models.Document.content_type,
+                        models.Document.sha256,
+                    )
+                    .where(
+                        models.Document.student_id == student_id,
+                        models.Document.id > index.last_document_id,
+                    )
+                    .order_by(models.Document.id)
+                )
+            ).all()
+            messages = (
+                await db.execute(
+                    select(
+                        models.Message.id,
+                        models.Message.conversation_id,
+                        models.Message.content,
+                    )
+                    .join(models.Conversation)
+                    .where(
+                        models.Conversation.student_id == student_id,
+                        models.Message.id > index.last_message_id,
+                    )
+                    .order_by(models.Message.id)
+                    .limit(self._MESSAGE_BATCH)
+                )
+            ).all()
+        return docs, messages
+
+    async def refresh(self, student_id: int) -> None:
+        """Embed everything added since the index's watermarks."""
+        provider = self.provider()
+        if provider is None:
+            return
+        index = self.student(student_id, provider.dim)
+        async with index.lock:
+            while True:
+                docs, messages = await self._load_new(student_id, index)
+                chunks: List[Chunk] = []
+                conversation_ids: List[int] = []
+                for doc in docs:
+                    text = await asyncio.to_thread(_document_text, doc)
+                    for piece in chunk_text(text or ""):
+                        chunks.append(Chunk("document", doc.id, doc.filename, piece))
+                        conversation_ids.append(-1)
+                for message in messages:
+                    for piece in chunk_text(message.content):
+                        label = f"conversation {message.conversation_id}"
+                        chunks.append(Chunk("message", message.id, label, piece))
+                        conversation_ids.append(message.conversation_id)
+
+                if chunks:
+                    vectors = await provider.embed([c.text for c in chunks])
+                    index.add(vectors, chunks, conversation_ids)
+                if docs:
+                    index.last_document_id = docs[-1].id
+                if messages:
+                    index.last_message_id = messages[-1].id
+                if len(messages) < self._MESSAGE_BATCH:
+                    break
+
+    async def search(
+        self,
+        student_id: int,
+        query: str,
+        k: int,
+        min_score: float = 0.0,
+        exclude_conversation_id: Optional[int] = None,
+    ) -> List[SearchHit]:
+        """Top-k indexed chunks of a student's documents and other conversations.
+
+        Only the query is embedded here. A refresh is scheduled so writes
+        made by other processes are picked up for later turns; a cold index
+        returns nothing until its first refresh completes.
+        """
+        provider = self.provider()
+        if provider is None or k <= 0:
+            return []
+        index = self.student(student_id, provider.dim)
+        self.schedule_refresh(student_id)
+        if len(index) == 0:
+            return []
+        query_vector = (await provider.embed([query]))[0]
+        return index.search(query_vector, k, min_score, exclude_conversation_id)
+
+    async def join(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await self.join()
+
+    def reset(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+        self._pending.clear()
+        self._dirty.clear()
+        self.clear()
+
+
+_settings = get_settings()
+retrieval_index = RetrievalIndex(
+    _settings.retrieval_max_students,
+    debounce_seconds=_settings.retrieval_refresh_debounce_seconds,
+)
+
+
+async def retrieve_references(conv: models.Conversation, query: str) -> List[str]:
+    """Excerpts to add to the prompt for a turn; [] when retrieval is off.
+
+    The current conversation is excluded since its recent history is already
+    in the prompt. Failures are logged and counted, and the turn goes on
+    without references.
+    """
+    settings = get_settings()
+    try:
+        hits = await retrieval_index.search(
+            conv.student_id,
+            query,
+            k=settings.retrieval_top_k,
+            min_score=settings.retrieval_min_score,
+            exclude_conversation_id=conv.id,
+        )
+    except Exception:
+        RETRIEVAL_FAILURES.inc("query")
+        logger.exception("Retrieval failed for conversation %s", conv.id)
+        return []
+    return [hit.as_reference() for hit in hits]
@@ -0,0 +1,179 @@
+"""Suggestion rules and the engine that indexes them by the facts they read.
+
+Each rule declares the facts it depends on. The engine keeps an index from
+fact to rules, so when one fact changes (a new message, an upload, a new
+deadline) only the rules that read it are re-evaluated, and only the facts
+those rules need are loaded (see `app.suggestions.load_facts`).
+
+Rules are pure functions of `StudentFacts`, so they can run anywhere,
+including in worker processes.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+FACTS = (
+    "message_count",
+    "essay_mentions",
+    "document_count",
+    "deadlines",
+    "open_suggestions",
+)
+
+
+@dataclass
+class StudentFacts:
+    """What the rules may look at for one student; picklable.
+
+    Facts that were not loaded keep their defaults.
+    """
+
+    student_id: int
+    now: datetime
+    message_count: int = 0
+    # Recent user messages that talk about essays
+    essay_mentions: int = 0
+    document_count: int = 0
+    # Future deadlines as (title, due_at), soonest first
+    deadlines: List[Tuple[str, datetime]] = field(default_factory=list)
+    # Kinds of suggestions already made and not dismissed
+    open_suggestions: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class Draft:
+    kind: str
+    message: str
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    depends_on: FrozenSet[str]
+    evaluate: Callable[[StudentFacts, int], Optional[Draft]]
+
+
+def rule(*depends_on: str) -> Callable[[Callable], Rule]:
+    """Declare a rule function and the facts it reads."""
+    unknown = set(depends_on) - set(FACTS)
+    if unknown:
+        raise ValueError(f"Unknown facts: {sorted(unknown)}")
+
+    def wrap(evaluate: Callable[[StudentFacts, int], Optional[Draft]]) -> Rule:
+        return Rule(evaluate.__name__, frozenset(depends_on), evaluate)
+
+    return wrap
+
+
+def _days_until(facts: StudentFacts, when: datetime) -> int:
+    return max(1, math.ceil((when - facts.now).total_seconds() / 86400))
+
+
+@rule("deadlines")
+def deadline_soon(facts: StudentFacts, horizon_days: int) -> Optional[Draft]:
+    if not facts.deadlines:
+        return None
+    title, due_at = facts.deadlines[0]
+    days = _days_until(facts, due_at)
+    if days > horizon_days:
+        return None
+    when = "tomorrow" if days == 1 else f"in {days} days"
+    return Draft(
+        "deadline_soon",
+        f"{title} is due {when}—would you like to review your application "
+        "checklist or get tips for your essays?",
+    )
+
+
+@rule("essay_mentions", "document_count")
+def essay_feedback(facts: StudentFacts, horizon_days: int) -> Optional[Draft]:
+    if facts.essay_mentions == 0 or facts.document_count > 0:
+        return None
+    return Draft(
+        "essay_feedback",
+        "You've been working on essays—upload a draft and I can give you "
+        "feedback on it.",
+    )
+
+
+@rule("deadlines", "message_count", "open_suggestions")
+def plan_deadlines(facts: StudentFacts, horizon_days: int) -> Optional[Draft]:
+    if facts.deadlines or facts.message_count < 6:
+        return None
+    # Nothing changes the answer until a deadline is added, so ask once
+    if "plan_deadlines" in facts.open_suggestions:
+        return None
+    return Draft(
+        "plan_deadlines",
+        "You haven't added any application deadlines yet—want help building "
+        "a timeline for your college list?",
+    )
+
+
+class RuleEngine:
+    """Rules in priority order, indexed by the facts they depend on."""
+
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules = list(rules)
+        self._priority = {r.name: i for i, r in enumerate(self.rules)}
+        self._by_fact: Dict[str, List[Rule]] = {}
+        for r in self.rules:
+            for fact in r.depends_on:
+                self._by_fact.setdefault(fact, []).append(r)
+
+    def rules_for(self, changed: Iterable[str]) -> List[Rule]:
+        """Rules that read any of the `changed` facts, in priority order."""
+        affected: Dict[str, Rule] = {}
+        for fact in changed:
+            for r in self._by_fact.get(fact, ()):
+                affected[r.name] = r
+        return sorted(affected.values(), key=lambda r: self._priority[r.name])
+
+    @staticmethod
+    def facts_for(rules: Iterable[Rule]) -> Set[str]:
+        """Facts that must be loaded to evaluate `rules`."""
+        return {fact for r in rules for fact in r.depends_on}
+
+    def evaluate(
+        self,
+        facts: StudentFacts,
+        horizon_days: int,
+        rules: Optional[Sequence[Rule]] = None,
+    ) -> Optional[Draft]:
+        """The first of `rules` (default: all) that fires for `facts`."""
+        for r in self.rules if rules is None else rules:
+            draft = r.evaluate(facts, horizon_days)
+            if draft is not None:
+                return draft
+        return None
+
+
+# In priority order; the first rule that fires is the day's suggestion
+RULES = (deadline_soon, essay_feedback, plan_deadlines)
+rule_engine = RuleEngine(RULES)
+
+
+def evaluate_batch(
+    batch: Sequence[StudentFacts], horizon_days: int
+) -> List[Tuple[int, Draft]]:
+    """Best suggestion per student; module-level so a process pool can run it."""
+    results = []
+    for facts in batch:
+        draft = rule_engine.evaluate(facts, horizon_days)
+        if draft is not None:
+            results.append((facts.student_id, draft))
+    return results
@@ -1,4 +1,5 @@
-from typing import Optional, List, Literal
+from datetime import date, datetime
+from typing import Dict, Optional, List, Literal
 from pydantic import BaseModel, EmailStr
 
 
@@ -25,6 +26,10 @@ class ConversationOut(BaseModel):
     id: int
     student_id: int
     title: str
+    message_count: int = 0
+    # Latest message time, or creation time while empty
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -32,6 +37,8 @@ class ConversationOut(BaseModel):
 
 class MessageCreate(BaseModel):
     content: str
+    # Skip the reply cache and always ask the model
+    bypass_cache: bool = False
 
 
 class MessageOut(BaseModel):
@@ -39,6 +46,7 @@ class MessageOut(BaseModel):
     conversation_id: int
     role: Literal["user", "assistant"]
     content: str
+    truncated: bool = False
 
     class Config:
         from_attributes = True
@@ -46,7 +54,115 @@ class MessageOut(BaseModel):
 
 class MessagesResponse(BaseModel):
     messages: List[MessageOut]
+    # Pass back as before_id (or after_id, when paging forward) for the next page
+    next_cursor: Optional[int] = None
+
+
+class MessageSearchHit(BaseModel):
+    message_id: int
+    conversation_id: int
+    conversation_title: str
+    role: Literal["user", "assistant"]
+    # Matched terms are wrapped in ** markers
+    snippet: str
+    score: float
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class MessageSearchResponse(BaseModel):
+    query: str
+    results: List[MessageSearchHit]
 
 
 class ConversationsResponse(BaseModel):
     conversations: List[ConversationOut]
+    # Opaque; pass back as `cursor`
+    next_cursor: Optional[str] = None
+
+
+class DocumentOut(BaseModel):
+    id: int
+    student_id: int
+    filename: str
+    content_type: str
+    size_bytes: int
+    sha256: str
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class DocumentUploadOut(DocumentOut):
+    # True when the student already had this exact file
+    deduplicated: bool = False
+
+
+class DocumentsResponse(BaseModel):
+    documents: List[DocumentOut]
+
+
+class SuggestionOut(BaseModel):
+    id: int
+    kind: str
+    message: str
+    suggested_on: date
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class SuggestionsResponse(BaseModel):
+    suggestions: List[SuggestionOut]
+
+
+class SuggestionRunOut(BaseModel):
+    run_id: int
+    candidates: int
+    evaluated: int
+    created: int
+    batches: int
+    # Seconds per phase: watermarks, candidates, facts, evaluate, insert, total
+    timings: Dict[str, float]
+
+
+class SummaryJobOut(BaseModel):
+    student_id: int
+    state: Literal["idle", "queued", "running", "done", "failed", "cancelled"]
+    triggers: int
+    runs: int
+    last_started_at: Optional[datetime] = None
+    last_finished_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ContextWindowOut(BaseModel):
+    conversation_id: int
+    budget: int
+    reserved_tokens: int
+    tokens_used: int
+    dropped: int
+    message_ids: List[int]
+    message_tokens: List[int]
+
+
+class ReloadConfigOut(BaseModel):
+    ai_configured: bool
+    openai_model: str
+
+
+class CacheStatsOut(BaseModel):
+    hits: int
+    disk_hits: int
+    misses: int
+    hit_rate: float
+    saved_tokens: int
+    entries: int
+    persistent: bool
@@ -0,0 +1,204 @@
+"""Full-text search over a student's messages.
+
+On SQLite, an FTS5 table (`messages_fts`) indexes `messages.content` as an
+external-content table: it stores only the index, and triggers on
+`messages` keep it in sync with every insert, update and delete. Results
+are ranked by BM25 and come with highlighted snippets.
+
+On PostgreSQL the same search runs on `to_tsvector` with a GIN expression
+index. Other dialects fall back to a LIKE per term, which is correct but
+scans.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import Integer, and_, column, event, func, literal_column, select, table
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+# Inlined rather than bound, so queries match the index expression
+_PG_CONFIG = literal_column("'english'")
+# Snippet highlight markers; plain text, so clients never render raw HTML
+MARK_START, MARK_END = "**", "**"
+SNIPPET_TOKENS = 16
+
+# The index also holds each message's student id, so a search intersects
+# the query terms with one student's postings instead of ranking every
+# student's matches. `messages_fts_source` is the external content it reads
+# back for snippets and rebuilds.
+_STUDENT_OF = "(SELECT student_id FROM conversations WHERE id = {}.conversation_id)"
+_SQLITE_DDL = (
+    "CREATE VIEW IF NOT EXISTS messages_fts_source AS "
+    "SELECT m.id, m.content, c.student_id FROM messages m "
+    "JOIN conversations c ON c.id = m.conversation_id",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, student_id, content='messages_fts_source', content_rowid='id', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content, student_id) "
+    f"VALUES (new.id, new.content, {_STUDENT_OF.format('new')}); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content, student_id) "
+    f"VALUES ('delete', old.id, old.content, {_STUDENT_OF.format('old')}); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content "
+    "ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content, student_id) "
+    f"VALUES ('delete', old.id, old.content, {_STUDENT_OF.format('old')}); "
+    "INSERT INTO messages_fts(rowid, content, student_id) "
+    f"VALUES (new.id, new.content, {_STUDENT_OF.format('new')}); END",
+)
+_POSTGRES_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_messages_content_fts ON messages "
+    "USING gin (to_tsvector('english', content))",
+)
+
+
+def install_message_search(conn: Connection) -> bool:
+    """Create the search index for `messages` if missing; True if created.
+
+    Runs when the table is created and again at startup, so databases that
+    predate search are indexed in place. Run via `conn.run_sync`.
+    """
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).first()
+        for ddl in _SQLITE_DDL:
+            conn.exec_driver_sql(ddl)
+        if exists is None:
+            # Index messages written before the table existed
+            conn.exec_driver_sql(
+                "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"
+            )
+        return exists is None
+    if dialect == "postgresql":
+        for ddl in _POSTGRES_DDL:
+            conn.exec_driver_sql(ddl)
+        return True
+    return False
+
+
+@event.listens_for(models.Message.__table__, "after_create")
+def _create_search_index(target, connection, **kw) -> None:
+    install_message_search(connection)
+
+
+@event.listens_for(models.Message.__table__, "before_drop")
+def _drop_search_index(target, connection, **kw) -> None:
+    # Triggers go with the table, but the FTS table would outlive it
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("DROP TABLE IF EXISTS messages_fts")
+        connection.exec_driver_sql("DROP VIEW IF EXISTS messages_fts_source")
+
+
+@dataclass
+class MessageMatch:
+    message_id: int
+    conversation_id: int
+    conversation_title: str
+    role: str
+    snippet: str
+    # Higher is more relevant; only comparable within one result list
+    score: float
+    created_at: Optional[datetime]
+
+
+def search_terms(query: str) -> List[str]:
+    return _TERM_RE.findall(query)
+
+
+def contains_term(column: ColumnElement[str], term: str) -> ColumnElement[bool]:
+    """Case-insensitive substring match; `%` and `_` in `term` are literal."""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+
+def _fts5_query(student_id: int, terms: List[str]) -> str:
+    # Quoting every term keeps FTS5 operators in user input literal
+    quoted = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    return f'student_id : "{int(student_id)}" AND content : ({quoted})'
+
+
+async def search_messages(
+    db: AsyncSession, student_id: int, query: str, limit: int = 20
+) -> List[MessageMatch]:
+    """Messages of `student_id` containing every term in `query`, best first."""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    Message, Conversation = models.Message, models.Conversation
+    columns = (
+        Message.id,
+        Message.conversation_id,
+        Conversation.title,
+        Message.role,
+        Message.created_at,
+    )
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        fts = table("messages_fts", column("rowid", Integer))
+        fts_ref = literal_column("messages_fts")
+        # The student column is a filter only; it must not affect ranking
+        rank = func.bm25(fts_ref, 1.0, 0.0)
+        snippet = func.snippet(fts_ref, 0, MARK_START, MARK_END, "…", SNIPPET_TOKENS)
+        stmt = (
+            select(*columns, snippet.label("snippet"), (-rank).label("score"))
+            .select_from(fts)
+            .join(Message, Message.id == fts.c.rowid)
+            .where(fts_ref.op("MATCH")(_fts5_query(student_id, terms)))
+            .order_by(rank)
+        )
+    elif dialect == "postgresql":
+        vector = func.to_tsvector(_PG_CONFIG, Message.content)
+        tsquery = func.plainto_tsquery(_PG_CONFIG, " ".join(terms))
+        rank = func.ts_rank(vector, tsquery)
+        options = (
+            f"StartSel={MARK_START}, StopSel={MARK_END}, "
+            f"MaxWords={SNIPPET_TOKENS}, MinWords={SNIPPET_TOKENS // 2}"
+        )
+        snippet = func.ts_headline(_PG_CONFIG, Message.content, tsquery, options)
+        stmt = (
+            select(*columns, snippet.label("snippet"), rank.label("score"))
+            .where(vector.op("@@")(tsquery))
+            .order_by(rank.desc(), Message.id.desc())
+        )
+    else:
+        stmt = (
+            select(
+                *columns,
+                func.substr(Message.content, 1, 200).label("snippet"),
+                literal_column("0.0").label("score"),
+            )
+            .where(and_(*(contains_term(Message.content, term) for term in terms)))
+            .order_by(Message.id.desc())
+        )
+    stmt = (
+        stmt.join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Conversation.student_id == student_id)
+        .limit(limit)
+    )
+
+    rows = (await db.execute(stmt)).all()
+    return [
+        MessageMatch(
+            message_id=row.id,
+            conversation_id=row.conversation_id,
+            conversation_title=row.title,
+            role=row.role,
+            snippet=row.snippet,
+            score=float(row.score),
+            created_at=row.created_at,
+        )
+        for row in rows
+    ]
@@ -13,6 +13,66 @@ class Settings(BaseSettings):
     # Use absolute sqlite path by default
     database_url: str = f"sqlite:///{ABS_DB_PATH}"
     openai_model: str = "gpt-4o-mini"
+    # Engine profile (see app.db.engine_options): "auto" picks "sqlite-wal" or
+    # "postgres" from the database URL; "basic" is the untuned engine
+    db_profile: str = "auto"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kib: int = 65536
+    sqlite_mmap_size_bytes: int = 268435456
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    # Shared OpenAI HTTP client (see app.ai.get_openai_client)
+    openai_base_url: str | None = None
+    openai_timeout_seconds: float = 60.0
+    openai_connect_timeout_seconds: float = 5.0
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry_seconds: float = 30.0
+    openai_http2: bool = True
+    openai_max_retries: int = 2
+    # Logins served from memory (see app.main.login)
+    student_cache_max_entries: int = 10_000
+    # Assistant reply cache (in-process LRU, optional SQLite file tier)
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = 1000
+    response_cache_ttl_seconds: float = 3600.0
+    response_cache_path: str | None = None
+    # Prompt history is the newest messages that fit this many tokens, after
+    # reserving room for the system prompt/summary and the model's reply
+    context_token_budget: int = 8000
+    context_reply_reserve_tokens: int = 1000
+    context_max_messages: int = 200
+    # Uploaded documents: content-addressed blobs on disk (see app.storage)
+    document_storage_dir: str = str(BACKEND_DIR / "uploads")
+    document_max_bytes: int = 20 * 1024 * 1024
+    # Retrieval over documents and earlier conversations (see app.retrieval);
+    # "auto" embeds with OpenAI when a key is set, "hash" needs no network
+    embedding_provider: str = "auto"
+    embedding_model: str = "text-embedding-3-small"
+    embedding_dim: int = 512
+    retrieval_top_k: int = 4
+    retrieval_min_score: float = 0.25
+    retrieval_max_students: int = 256
+    # Coalescing delay before new documents and messages are indexed
+    retrieval_refresh_debounce_seconds: float = 0.5
+    # On-disk cache of API embeddings (see app.embedding_cache); "" disables
+    embedding_cache_dir: str = str(BACKEND_DIR / "embedding_cache")
+    embedding_cache_max_entries: int = 200_000
+    # Nightly proactive-suggestion job (see app.suggestions); 0 workers
+    # evaluates rules in-process instead of in a process pool
+    suggestion_batch_size: int = 500
+    suggestion_workers: int = 0
+    suggestion_deadline_horizon_days: int = 14
+    # Coalescing delay for suggestions triggered by writes
+    suggestion_debounce_seconds: float = 1.0
+    # Background student-context summarization
+    summary_debounce_seconds: float = 2.0
+    summary_max_concurrency: int = 2
+    # Smaller responses are sent uncompressed (see app.compression)
+    response_compression_min_bytes: int = 1024
 
     class Config:
         # Always load this absolute .env file if present
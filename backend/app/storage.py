@@ -0,0 +1,84 @@
+"""Content-addressed blob storage for uploaded documents.
+
+Uploads are streamed to a temporary file while their SHA-256 is computed,
+then moved to `<root>/<aa>/<bb>/<sha256>`. Identical content therefore maps to
+one file no matter how often, or by whom, it is uploaded. Only metadata is
+kept in the database (see `models.Document`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterable
+
+from app.settings import get_settings
+
+
+class BlobTooLarge(Exception):
+    """The stream exceeded the configured maximum size."""
+
+
+@dataclass
+class StoredBlob:
+    sha256: str
+    size_bytes: int
+    path: Path
+    # False when identical content was already on disk
+    created: bool
+
+
+class BlobStore:
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+
+    def path_for(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+
+    def exists(self, sha256: str) -> bool:
+        return self.path_for(sha256).is_file()
+
+    async def write_stream(
+        self, chunks: AsyncIterable[bytes], max_bytes: int | None = None
+    ) -> StoredBlob:
+        """Store a byte stream, hashing it as it arrives.
+
+        Memory use is bounded by the chunk size; file writes run in a worker
+        thread so the event loop keeps serving other requests. Raises
+        `BlobTooLarge` (and keeps nothing) once `max_bytes` is exceeded.
+        """
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f"upload exceeds {max_bytes} bytes")
+                    digest.update(chunk)
+                    await asyncio.to_thread(tmp.write, chunk)
+            sha256 = digest.hexdigest()
+            final = self.path_for(sha256)
+            if final.is_file():
+                os.unlink(tmp_name)
+                return StoredBlob(sha256, size, final, created=False)
+            final.parent.mkdir(parents=True, exist_ok=True)
+            # Atomic, so concurrent uploads of the same content are safe
+            os.replace(tmp_name, final)
+            return StoredBlob(sha256, size, final, created=True)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+
+blob_store = BlobStore(get_settings().document_storage_dir)
@@ -0,0 +1,472 @@
+"""Proactive suggestions (Milestone 4): event-driven triggers and a nightly job.
+
+Writes that change a student's facts call `suggestion_triggers.notify`,
+which re-evaluates only the rules that read those facts (see app.rules).
+The nightly job covers what no write announces, deadlines coming within
+the reminder horizon, and catches up on anything the triggers missed.
+
+A nightly run only looks at students that changed since the previous run:
+those with new messages (past the run's `Message.id` watermark) and those
+with a deadline that is new or has just come within the reminder horizon.
+They are processed in fixed-size batches; each batch loads its facts with a
+few grouped queries, evaluates the rules (optionally in a process pool) and
+bulk-inserts the results. The unique (student_id, suggested_on) constraint
+enforces "at most one suggestion per student per day", so an interrupted
+or overlapping run can safely be repeated.
+
+Schedule it nightly with cron or similar:
+
+    cd backend
+    python -m app.suggestions
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, or_, select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.cache import LRUCache
+from app.db import SessionLocal, dialect_insert
+from app.metrics import SUGGESTION_FAILURES
+from app.rules import (
+    FACTS,
+    Draft,
+    RuleEngine,
+    StudentFacts,
+    evaluate_batch,
+    rule_engine,
+)
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("watermarks", "candidates", "facts", "evaluate", "insert")
+# How far back a mention of essays counts as recent
+ESSAY_WINDOW_DAYS = 7
+
+
+@dataclass
+class SuggestionRunReport:
+    run_id: int
+    candidates: int
+    evaluated: int
+    created: int
+    batches: int
+    # Seconds spent in each phase, summed over batches, plus "total"
+    timings: Dict[str, float]
+
+
+def _utcnow() -> datetime:
+    # Naive UTC, comparable with the server-side timestamps
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def load_facts(
+    db: AsyncSession,
+    student_ids: Sequence[int],
+    now: datetime,
+    names: Iterable[str] = FACTS,
+) -> List[StudentFacts]:
+    """Facts for a batch of students, with one grouped query per loaded fact.
+
+    Only the facts in `names` are loaded; the rest keep their defaults.
+    """
+    names = set(names)
+    facts = {sid: StudentFacts(student_id=sid, now=now) for sid in student_ids}
+    Message, Conversation = models.Message, models.Conversation
+
+    if "message_count" in names:
+        counts = await db.execute(
+            select(
+                models.StudentContext.student_id, models.StudentContext.message_count
+            ).where(models.StudentContext.student_id.in_(student_ids))
+        )
+        for student_id, message_count in counts:
+            facts[student_id].message_count = message_count or 0
+
+    if "essay_mentions" in names:
+        mentions = await db.execute(
+            select(Conversation.student_id, func.count(Message.id))
+            .select_from(Message)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .where(
+                Conversation.student_id.in_(student_ids),
+                Message.role == "user",
+                Message.created_at >= now - timedelta(days=ESSAY_WINDOW_DAYS),
+                func.lower(Message.content).like("%essay%"),
+            )
+            .group_by(Conversation.student_id)
+        )
+        for student_id, essay_mentions in mentions:
+            facts[student_id].essay_mentions = essay_mentions
+
+    if "document_count" in names:
+        documents = await db.execute(
+            select(models.Document.student_id, func.count())
+            .where(models.Document.student_id.in_(student_ids))
+            .group_by(models.Document.student_id)
+        )
+        for student_id, document_count in documents:
+            facts[student_id].document_count = document_count
+
+    if "deadlines" in names:
+        deadlines = await db.execute(
+            select(
+                models.Deadline.student_id,
+                models.Deadline.title,
+                models.Deadline.due_at,
+            )
+            .where(
+                models.Deadline.student_id.in_(student_ids),
+                models.Deadline.due_at > now,
+            )
+            .order_by(models.Deadline.student_id, models.Deadline.due_at)
+        )
+        for student_id, title, due_at in deadlines:
+            facts[student_id].deadlines.append((title, due_at))
+
+    if "open_suggestions" in names:
+        open_kinds = await db.execute(
+            select(models.Suggestion.student_id, models.Suggestion.kind)
+            .where(
+                models.Suggestion.student_id.in_(student_ids),
+                models.Suggestion.dismissed_at.is_(None),
+            )
+            .distinct()
+        )
+        for student_id, kind in open_kinds:
+            facts[student_id].open_suggestions.add(kind)
+
+    return list(facts.values())
+
+
+async def insert_suggestions(
+    db: AsyncSession, drafts: Sequence[Tuple[int, Draft]], today: date
+) -> int:
+    """Bulk-insert drafts, skipping students that already have one today."""
+    if not drafts:
+        return 0
+    insert = dialect_insert(db)
+    stmt = (
+        insert(models.Suggestion)
+        .values(
+            [
+                {
+                    "student_id": student_id,
+                    "kind": draft.kind,
+                    "message": draft.message,
+                    "suggested_on": today,
+                }
+                for student_id, draft in drafts
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["student_id", "suggested_on"])
+        .returning(models.Suggestion.id)
+    )
+    created = len((await db.execute(stmt)).all())
+    await db.commit()
+    return created
+
+
+class SuggestionJob:
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = SessionLocal,
+        batch_size: int = 500,
+        workers: int = 0,
+        horizon_days: int = 14,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        # 0 evaluates in-process; rules are cheap, the pool pays off at scale
+        self.workers = workers
+        self.horizon_days = horizon_days
+
+    async def run(self, now: Optional[datetime] = None) -> SuggestionRunReport:
+        now = now or _utcnow()
+        today = now.date()
+        horizon_until = now + timedelta(days=self.horizon_days)
+        timings = {phase: 0.0 for phase in PHASES}
+        started = time.perf_counter()
+
+        async with self.session_factory() as db:
+            mark = time.perf_counter()
+            previous = (
+                await db.execute(
+                    select(models.SuggestionRun)
+                    .where(models.SuggestionRun.finished_at.is_not(None))
+                    .order_by(models.SuggestionRun.id.desc())
+                    .limit(1)
+                )
+            ).scalar_one_or_none()
+            last_message_id = previous.last_message_id if previous else 0
+            last_deadline_id = previous.last_deadline_id if previous else 0
+            previous_horizon = previous.horizon_until if previous else None
+            max_message_id, max_deadline_id = (
+                await db.execute(
+                    select(
+                        select(
+                            func.coalesce(func.max(models.Message.id), 0)
+                        ).scalar_subquery(),
+                        select(
+                            func.coalesce(func.max(models.Deadline.id), 0)
+                        ).scalar_subquery(),
+                    )
+                )
+            ).one()
+            run = models.SuggestionRun(
+                started_at=now,
+                last_message_id=max_message_id,
+                last_deadline_id=max_deadline_id,
+                horizon_until=horizon_until,
+            )
+            db.add(run)
+            await db.commit()
+            timings["watermarks"] += time.perf_counter() - mark
+
+            mark = time.perf_counter()
+            student_ids = await self._candidates(
+                db,
+                now,
+                today,
+                horizon_until,
+                (last_message_id, max_message_id),
+                (last_deadline_id, max_deadline_id),
+                previous_horizon,
+            )
+            timings["candidates"] += time.perf_counter() - mark
+
+            created = evaluated = batches = 0
+            executor = ProcessPoolExecutor(self.workers) if self.workers > 0 else None
+            try:
+                for start in range(0, len(student_ids), self.batch_size):
+                    batch = student_ids[start : start + self.batch_size]
+                    batches += 1
+
+                    mark = time.perf_counter()
+                    facts = await load_facts(db, batch, now)
+                    timings["facts"] += time.perf_counter() - mark
+
+                    mark = time.perf_counter()
+                    drafts = await self._evaluate(executor, facts)
+                    evaluated += len(facts)
+                    timings["evaluate"] += time.perf_counter() - mark
+
+                    mark = time.perf_counter()
+                    created += await insert_suggestions(db, drafts, today)
+                    timings["insert"] += time.perf_counter() - mark
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+            # Only a finished run moves the watermarks forward
+            run.finished_at = _utcnow()
+            run.candidates = len(student_ids)
+            run.created = created
+            await db.commit()
+
+        timings["total"] = time.perf_counter() - started
+        return SuggestionRunReport(
+            run_id=run.id,
+            candidates=len(student_ids),
+            evaluated=evaluated,
+            created=created,
+            batches=batches,
+            timings=timings,
+        )
+
+    async def _candidates(
+        self,
+        db: AsyncSession,
+        now: datetime,
+        today: date,
+        horizon_until: datetime,
+        message_range: Tuple[int, int],
+        deadline_range: Tuple[int, int],
+        previous_horizon: Optional[datetime],
+    ) -> List[int]:
+        """Students with activity or a newly due deadline, minus those done today."""
+        Message, Deadline = models.Message, models.Deadline
+        active = (
+            select(models.Conversation.student_id)
+            .select_from(Message)
+            .join(
+                models.Conversation, models.Conversation.id == Message.conversation_id
+            )
+            .where(Message.id > message_range[0], Message.id <= message_range[1])
+        )
+        newly_due = Deadline.id > deadline_range[0]
+        if previous_horizon is not None:
+            # Deadlines that crossed into the horizon since the last run
+            newly_due = or_(newly_due, Deadline.due_at > previous_horizon)
+        due = select(Deadline.student_id).where(
+            Deadline.id <= deadline_range[1],
+            Deadline.due_at > now,
+            Deadline.due_at <= horizon_until,
+            newly_due,
+        )
+        candidates = union(active, due).subquery()
+        suggested_today = select(models.Suggestion.student_id).where(
+            models.Suggestion.suggested_on == today
+        )
+        rows = await db.execute(
+            select(candidates.c.student_id)
+            .where(candidates.c.student_id.not_in(suggested_today))
+            .order_by(candidates.c.student_id)
+        )
+        return list(rows.scalars())
+
+    async def _evaluate(
+        self, executor: Optional[Executor], facts: List[StudentFacts]
+    ) -> List[Tuple[int, Draft]]:
+        if executor is None:
+            return evaluate_batch(facts, self.horizon_days)
+        loop = asyncio.get_running_loop()
+        size = math.ceil(len(facts) / self.workers)
+        parts = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor, evaluate_batch, facts[i : i + size], self.horizon_days
+                )
+                for i in range(0, len(facts), size)
+            )
+        )
+        return [result for part in parts for result in part]
+
+
+class SuggestionTriggers:
+    """Near-real-time suggestions, driven by the write paths.
+
+    `notify(student_id, *facts)` is called after a write changes facts. After
+    a short debounce (coalescing further changes), only the rules that read
+    those facts are evaluated, after loading only the facts they need.
+    Students that already got today's suggestion are skipped without
+    touching the database.
+    """
+
+    def __init__(
+        self,
+        engine: RuleEngine = rule_engine,
+        session_factory: Callable[[], AsyncSession] = SessionLocal,
+        debounce_seconds: float = 1.0,
+        horizon_days: int = 14,
+        max_students: int = 10_000,
+    ):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.debounce_seconds = debounce_seconds
+        self.horizon_days = horizon_days
+        # student_id -> UTC day of their latest suggestion
+        self._suggested_on: LRUCache[date] = LRUCache(max_students)
+        self._pending: Dict[int, Set[str]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.last_error: Optional[str] = None
+
+    def notify(self, student_id: int, *facts: str) -> None:
+        if self._suggested_on.get(student_id) == _utcnow().date():
+            return
+        if not self.engine.rules_for(facts):
+            return
+        pending = self._pending.get(student_id)
+        if pending is not None:
+            pending.update(facts)
+            return
+        self._pending[student_id] = set(facts)
+        task = asyncio.get_running_loop().create_task(self._run(student_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, student_id: int) -> None:
+        try:
+            await asyncio.sleep(self.debounce_seconds)
+            changed = self._pending.pop(student_id, set())
+            async with self.session_factory() as db:
+                await self.process(db, student_id, changed)
+        except asyncio.CancelledError:
+            self._pending.pop(student_id, None)
+            raise
+        except Exception as exc:
+            self.last_error = str(exc)
+            SUGGESTION_FAILURES.inc()
+            logger.exception("Suggestion trigger failed for student %s", student_id)
+
+    async def process(
+        self,
+        db: AsyncSession,
+        student_id: int,
+        changed: Iterable[str],
+        now: Optional[datetime] = None,
+    ) -> Optional[Draft]:
+        """Re-evaluate the rules affected by `changed`; the stored draft, if any."""
+        now = now or _utcnow()
+        today = now.date()
+        if self._suggested_on.get(student_id) == today:
+            return None
+        rules = self.engine.rules_for(changed)
+        if not rules:
+            return None
+        (facts,) = await load_facts(db, [student_id], now, self.engine.facts_for(rules))
+        draft = self.engine.evaluate(facts, self.horizon_days, rules)
+        if draft is None:
+            return None
+        created = await insert_suggestions(db, [(student_id, draft)], today)
+        # Either way the student now has today's suggestion
+        self._suggested_on.set(student_id, today)
+        return draft if created else None
+
+    async def join(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await self.join()
+
+    def reset(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+        self._pending.clear()
+        self._suggested_on.clear()
+
+
+_settings = get_settings()
+suggestion_job = SuggestionJob(
+    batch_size=_settings.suggestion_batch_size,
+    workers=_settings.suggestion_workers,
+    horizon_days=_settings.suggestion_deadline_horizon_days,
+)
+suggestion_triggers = SuggestionTriggers(
+    debounce_seconds=_settings.suggestion_debounce_seconds,
+    horizon_days=_settings.suggestion_deadline_horizon_days,
+)
+
+
+async def _main() -> None:
+    from app.db import Base, engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    report = await suggestion_job.run()
+    await engine.dispose()
+    print(
+        f"run {report.run_id}: {report.candidates} candidates, "
+        f"{report.created} suggestions in {report.batches} batches"
+    )
+    for phase, seconds in report.timings.items():
+        print(f"  {phase:<11}{seconds * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.ai import summarize_student_context
+from app.cache import LRUCache
+from app.db import SessionLocal
+from app.settings import get_settings
+
+
+@dataclass
+class SummaryJob:
+    """Status of the background summarization job for one student."""
+
+    student_id: int
+    state: str = "idle"  # idle | queued | running | done | failed | cancelled
+    triggers: int = 0  # triggers not yet picked up by a run
+    runs: int = 0
+    rerun: bool = False
+    last_started_at: Optional[datetime] = None
+    last_finished_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+
+
+class SummarizationQueue:
+    """Debounced, coalescing background runner for `summarize_student_context`.
+
+    Triggers for a student that already has a queued job are folded into it;
+    a trigger that arrives while the job is running schedules exactly one
+    follow-up run. At most `max_concurrency` summaries run at once. Only
+    queued and running jobs are held for good; finished ones are kept in an
+    LRU of `max_finished` entries for `status()`, then reported as idle.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = SessionLocal,
+        summarize: Callable[
+            [AsyncSession, int], Awaitable[str]
+        ] = summarize_student_context,
+        debounce_seconds: float = 2.0,
+        max_concurrency: int = 2,
+        max_finished: int = 10_000,
+    ):
+        self.session_factory = session_factory
+        self.summarize = summarize
+        self.debounce_seconds = debounce_seconds
+        self.max_concurrency = max_concurrency
+        # Queued or running jobs; finished ones move to `_finished`
+        self._jobs: Dict[int, SummaryJob] = {}
+        self._finished: LRUCache[SummaryJob] = LRUCache(max_finished)
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def schedule(self, student_id: int) -> SummaryJob:
+        job = self._jobs.get(student_id)
+        if job is None:
+            job = self._finished.get(student_id) or SummaryJob(student_id=student_id)
+            self._finished.pop(student_id)
+            self._jobs[student_id] = job
+        job.triggers += 1
+        if job.state == "queued":
+            return job
+        if job.state == "running":
+            job.rerun = True
+            return job
+        job.state = "queued"
+        self._start(job)
+        return job
+
+    def status(self, student_id: int) -> SummaryJob:
+        return (
+            self._jobs.get(student_id)
+            or self._finished.get(student_id)
+            or SummaryJob(student_id=student_id)
+        )
+
+    async def join(self) -> None:
+        """Wait until no jobs are queued or running."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await self.join()
+
+    def reset(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+        self._jobs.clear()
+        self._finished.clear()
+        self._semaphore = None
+
+    def _start(self, job: SummaryJob) -> None:
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: SummaryJob) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.sleep(self.debounce_seconds)
+            async with self._semaphore:
+                job.state = "running"
+                job.triggers = 0
+                job.rerun = False
+                job.runs += 1
+                job.last_started_at = datetime.now(timezone.utc)
+                try:
+                    async with self.session_factory() as db:
+                        await self.summarize(db, job.student_id)
+                finally:
+                    job.last_finished_at = datetime.now(timezone.utc)
+                job.state = "done"
+                job.last_error = None
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            self._retire(job)
+            raise
+        except Exception as exc:
+            job.state = "failed"
+            job.last_error = str(exc)
+
+        if job.rerun:
+            job.state = "queued"
+            job.rerun = False
+            self._start(job)
+        else:
+            self._retire(job)
+
+    def _retire(self, job: SummaryJob) -> None:
+        if self._jobs.get(job.student_id) is job:
+            del self._jobs[job.student_id]
+        self._finished.set(job.student_id, job)
+
+
+_settings = get_settings()
+summary_queue = SummarizationQueue(
+    debounce_seconds=_settings.summary_debounce_seconds,
+    max_concurrency=_settings.summary_max_concurrency,
+)
@@ -0,0 +1,57 @@
+"""Top-k query latency of a per-student retrieval index.
+
+Fills a `StudentIndex` with random unit vectors and times `search`, the
+single matrix-vector product plus argpartition used on every chat turn:
+
+    cd backend
+    python -m benchmarks.bench_retrieval --chunks 20000 --dim 512
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from app.retrieval import Chunk, StudentIndex, normalize_rows
+
+
+def main(chunks: int, dim: int, queries: int, k: int) -> None:
+    rng = np.random.default_rng(0)
+    index = StudentIndex(dim)
+    batch = 5000
+    for start in range(0, chunks, batch):
+        n = min(batch, chunks - start)
+        vectors = normalize_rows(rng.standard_normal((n, dim), dtype=np.float32))
+        index.add(
+            vectors,
+            [Chunk("message", start + i, "bench", "") for i in range(n)],
+            [(start + i) % 50 for i in range(n)],
+        )
+
+    probes = normalize_rows(rng.standard_normal((queries, dim), dtype=np.float32))
+    latencies = []
+    for probe in probes:
+        started = time.perf_counter()
+        index.search(probe, k, min_score=-1.0, exclude_conversation_id=7)
+        latencies.append(time.perf_counter() - started)
+
+    latencies.sort()
+    size_mb = index.vectors.nbytes / 1e6
+    print(f"{chunks} chunks x {dim} dims ({size_mb:.0f} MB), top-{k}")
+    print(
+        f"p50 {statistics.median(latencies) * 1000:.2f} ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+    main(args.chunks, args.dim, args.queries, args.k)
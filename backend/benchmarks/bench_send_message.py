@@ -0,0 +1,190 @@
+"""Database round trips and latency per chat turn, previous vs current path.
+
+Runs both write paths against a throwaway SQLite file with the model call
+stubbed out, so only database work is measured:
+
+    cd backend
+    python -m benchmarks.bench_send_message --turns 200 --llm-latency 0.05
+
+"previous" replays the flow `send_message` used before the single-transaction
+rework: commit + refresh of the user message, separate context and history
+queries, then commit + refresh of the assistant message.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import main, models
+from app.context_window import load_context_window
+from app.counters import increment_message_count
+from app.db import Base
+from app.retrieval import retrieval_index
+from app.schemas import MessageCreate
+from app.suggestions import suggestion_triggers
+from app.summarizer import summary_queue
+
+REPLY = "Start by listing the deadlines for the schools on your list."
+
+
+class RoundTrips:
+    """Counts statements, commits and checked-out connections of an engine."""
+
+    def __init__(self, engine):
+        self.statements = 0
+        self.commits = 0
+        self.checked_out = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine.sync_engine, "commit", self._on_commit)
+        event.listen(engine.sync_engine.pool, "checkout", self._on_checkout)
+        event.listen(engine.sync_engine.pool, "checkin", self._on_checkin)
+
+    def _on_checkout(self, *args) -> None:
+        self.checked_out += 1
+
+    def _on_checkin(self, *args) -> None:
+        self.checked_out -= 1
+
+    def _on_execute(self, *args) -> None:
+        self.statements += 1
+
+    def _on_commit(self, conn) -> None:
+        self.commits += 1
+
+    @property
+    def total(self) -> int:
+        return self.statements + self.commits
+
+
+async def previous_send_message(
+    db: AsyncSession, conversation_id: int, content: str, reply
+) -> models.Message:
+    conv = await db.get(models.Conversation, conversation_id)
+    user_msg = models.Message(conversation_id=conv.id, role="user", content=content)
+    db.add(user_msg)
+    await increment_message_count(db, conv.student_id)
+    await db.commit()
+    await db.refresh(user_msg)
+    ctx = await db.get(models.StudentContext, conv.student_id)
+    ctx_summary = ctx.context_summary if ctx else None
+    window = await load_context_window(db, conv.id, ctx_summary)
+    text = await reply(window.messages, ctx_summary)
+    assistant_msg = models.Message(
+        conversation_id=conv.id, role="assistant", content=text
+    )
+    db.add(assistant_msg)
+    await increment_message_count(db, conv.student_id)
+    await db.commit()
+    await db.refresh(assistant_msg)
+    return assistant_msg
+
+
+async def current_send_message(
+    db: AsyncSession, conversation_id: int, content: str, reply
+) -> models.Message:
+    return await main.send_message(conversation_id, MessageCreate(content=content), db)
+
+
+async def run_path(
+    name: str,
+    send: Callable[..., Awaitable[models.Message]],
+    turns: int,
+    llm_latency: float,
+) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with Session() as db:
+            student = models.Student(email="bench@example.com", name="Bench")
+            db.add(student)
+            await db.flush()
+            conv = models.Conversation(student_id=student.id, title="Bench")
+            db.add(conv)
+            await db.commit()
+            conversation_id = conv.id
+
+        trips = RoundTrips(engine)
+        held_during_llm = []
+
+        async def reply(history, summary, use_cache=True, references=None):
+            held_during_llm.append(trips.checked_out > 0)
+            if llm_latency:
+                await asyncio.sleep(llm_latency)
+            return REPLY
+
+        trips.statements = trips.commits = 0
+        main.generate_assistant_reply = reply
+        latencies: List[float] = []
+        for i in range(turns):
+            async with Session() as db:
+                started = time.perf_counter()
+                await send(db, conversation_id, f"Question {i}", reply)
+                latencies.append(time.perf_counter() - started)
+        await engine.dispose()
+
+    latencies.sort()
+    return {
+        "path": name,
+        "statements": trips.statements / turns,
+        "commits": trips.commits / turns,
+        "round_trips": trips.total / turns,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "held_during_llm": sum(held_during_llm) / turns,
+    }
+
+
+async def _main(turns: int, llm_latency: float) -> None:
+    original_reply = main.generate_assistant_reply
+    # Summaries, suggestion triggers and index refreshes are scheduled but
+    # never run; they are not part of a turn and would use the app database
+    summary_queue.debounce_seconds = 3600
+    suggestion_triggers.debounce_seconds = 3600
+    retrieval_index.debounce_seconds = 3600
+    try:
+        results = [
+            await run_path("previous", previous_send_message, turns, llm_latency),
+            await run_path("current", current_send_message, turns, llm_latency),
+        ]
+    finally:
+        main.generate_assistant_reply = original_reply
+        summary_queue.reset()
+        suggestion_triggers.reset()
+        retrieval_index.reset()
+
+    print(
+        f"{'path':<10}{'stmts':>8}{'commits':>9}{'trips':>8}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'conn held in LLM':>18}"
+    )
+    for r in results:
+        print(
+            f"{r['path']:<10}{r['statements']:>8.1f}{r['commits']:>9.1f}"
+            f"{r['round_trips']:>8.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+            f"{r['held_during_llm']:>17.0%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument(
+        "--llm-latency",
+        type=float,
+        default=0.0,
+        help="seconds the stubbed model call sleeps (default: 0)",
+    )
+    args = parser.parse_args()
+    asyncio.run(_main(args.turns, args.llm_latency))
@@ -0,0 +1,146 @@
+"""Serialization time and bytes sent for one long conversation page.
+
+Loads a synthetic conversation (chat turns with pasted essays) into a
+throwaway SQLite file and renders it the previous way (ORM entities,
+per-row `MessageOut` validation, the stdlib JSON encoder) and the current
+way (column tuples straight to orjson), then reports the body size under
+each encoding the server can negotiate:
+
+    cd backend
+    python -m benchmarks.bench_serialization --messages 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Callable, List
+
+import orjson
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import models
+from app.compression import available_encodings, compress
+from app.db import Base, make_engine
+from app.schemas import MessageOut, MessagesResponse
+
+WORDS = (
+    "the a my i and to of in that was for it with as on at by lab robotics arm "
+    "summer solder pizza failing usefully skill controller logged drop hand team "
+    "grandmother kitchen recipe language learned taught debate coach argument "
+    "volunteer clinic patients waiting room translated forms community college "
+    "essay draft deadline scholarship financial aid early decision internship "
+    "research chemistry biology history calculus leadership club captain failed "
+    "tried again started finished realized wanted needed because although when"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(8, 22))
+    return " ".join(words).capitalize() + "."
+
+
+def _content(rng: random.Random, role: str) -> str:
+    if role == "user" and rng.random() < 0.2:
+        # A pasted draft, roughly 650 words
+        return " ".join(_sentence(rng) for _ in range(rng.randint(35, 50)))
+    return " ".join(_sentence(rng) for _ in range(rng.randint(1, 8)))
+
+
+def _stdlib_json(content) -> bytes:
+    # What starlette's JSONResponse.render does
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+async def _time(rounds: int, render: Callable) -> tuple[List[float], bytes]:
+    latencies = []
+    body = b""
+    for _ in range(rounds):
+        started = time.perf_counter()
+        body = await render()
+        latencies.append(time.perf_counter() - started)
+    return latencies, body
+
+
+async def main(messages: int, rounds: int) -> None:
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'serialize.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with Session() as db:
+            db.add(models.Student(id=1, email="s@example.com", name="S"))
+            db.add(models.Conversation(id=1, student_id=1, title="Bench"))
+            await db.flush()
+            roles = ["user", "assistant"] * (messages // 2 + 1)
+            await db.execute(
+                insert(models.Message),
+                [
+                    {"conversation_id": 1, "role": role, "content": _content(rng, role)}
+                    for role in roles[:messages]
+                ],
+            )
+            await db.commit()
+
+        where = models.Message.conversation_id == 1
+        order = models.Message.id.asc()
+
+        async def previous() -> bytes:
+            async with Session() as db:
+                stmt = select(models.Message).where(where).order_by(order)
+                rows = (await db.execute(stmt)).scalars().all()
+                page = MessagesResponse.model_validate(
+                    {"messages": rows, "next_cursor": None}, from_attributes=True
+                )
+                return _stdlib_json(page.model_dump(mode="json"))
+
+        async def current() -> bytes:
+            columns = [getattr(models.Message, f) for f in MessageOut.model_fields]
+            async with Session() as db:
+                rows = (
+                    await db.execute(select(*columns).where(where).order_by(order))
+                ).all()
+                return orjson.dumps(
+                    {"messages": [row._asdict() for row in rows], "next_cursor": None}
+                )
+
+        # Warm up both paths (statement cache, imports)
+        await previous()
+        await current()
+        print(f"{messages} messages, {rounds} rounds")
+        paths = (("orm+pydantic+json", previous), ("columns+orjson", current))
+        for label, render in paths:
+            latencies, body = await _time(rounds, render)
+            print(
+                f"{label:<18} p50 {statistics.median(latencies) * 1000:8.2f} ms"
+                f"   {len(body):>10,} bytes"
+            )
+
+        for encoding in available_encodings():
+            started = time.perf_counter()
+            compressed = compress(body, encoding)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{encoding:<18}     {elapsed * 1000:8.2f} ms"
+                f"   {len(compressed):>10,} bytes"
+                f"   ({len(body) / len(compressed):.1f}x smaller)"
+            )
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.rounds))
@@ -0,0 +1,194 @@
+"""Local stand-in for the OpenAI chat completions and embeddings APIs.
+
+Serves `POST /v1/chat/completions` (plain and `stream: true`) with a
+configurable time to first token, generation rate and error rate, and
+`POST /v1/embeddings` with deterministic vectors after a fixed latency, so
+the backend can be load-tested without network access or API spend:
+
+    cd backend
+    python -m benchmarks.fake_openai --port 9100 --latency 0.4 --error-rate 0.01
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:9100/v1 and any
+non-empty OPENAI_API_KEY.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeConfig:
+    latency: float = 0.3  # seconds to first token
+    jitter: float = 0.1  # +/- uniform jitter on latency
+    tokens_per_second: float = 80.0
+    reply_tokens: int = 120
+    error_rate: float = 0.0  # fraction of chat requests answered with a 500/429
+    embedding_latency: float = 0.05  # seconds per embeddings request
+
+
+_WORDS = (
+    "Focus on your essays early and keep a list of every deadline for the "
+    "schools you are applying to so nothing slips"
+).split()
+
+
+def _reply_words(count: int) -> list[str]:
+    return [_WORDS[i % len(_WORDS)] for i in range(count)]
+
+
+def _fake_embedding(text: str, dim: int) -> list[float]:
+    """Stable pseudo-random vector per text, so cached and fresh ones agree."""
+    digest = hashlib.blake2b(text.encode(), digest_size=8).digest()
+    rng = random.Random(int.from_bytes(digest, "big"))
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    app.state.config = config
+    app.state.requests = 0
+    app.state.embedding_requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        if random.random() < config.error_rate:
+            status = random.choice((429, 500))
+            return JSONResponse(
+                {"error": {"message": "injected failure", "type": "server_error"}},
+                status_code=status,
+            )
+
+        model = body.get("model", "gpt-4o-mini")
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        words = _reply_words(config.reply_tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        per_token = 1 / config.tokens_per_second if config.tokens_per_second else 0
+        first_token = max(
+            config.latency + random.uniform(-config.jitter, config.jitter), 0
+        )
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token + per_token * len(words))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": " ".join(words)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        def chunk(choices, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            await asyncio.sleep(first_token)
+            for i, word in enumerate(words):
+                text = word if i == 0 else f" {word}"
+                yield chunk(
+                    [{"index": 0, "delta": {"content": text}, "finish_reason": None}]
+                )
+                if per_token:
+                    await asyncio.sleep(per_token)
+            yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield chunk([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        app.state.embedding_requests += 1
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = body.get("dimensions") or 1536
+        await asyncio.sleep(config.embedding_latency)
+        tokens = sum(len(text) for text in inputs) // 4
+        return {
+            "object": "list",
+            "model": body.get("model", "text-embedding-3-small"),
+            "data": [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": _fake_embedding(text, dim),
+                }
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "requests": app.state.requests,
+            "embedding_requests": app.state.embedding_requests,
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=FakeConfig.latency)
+    parser.add_argument("--jitter", type=float, default=FakeConfig.jitter)
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=FakeConfig.tokens_per_second
+    )
+    parser.add_argument("--reply-tokens", type=int, default=FakeConfig.reply_tokens)
+    parser.add_argument("--error-rate", type=float, default=FakeConfig.error_rate)
+    parser.add_argument(
+        "--embedding-latency", type=float, default=FakeConfig.embedding_latency
+    )
+    args = parser.parse_args()
+    config = FakeConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        embedding_latency=args.embedding_latency,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,343 @@
+"""Concurrent chat load test against a real backend process.
+
+Starts the fake OpenAI server (benchmarks/fake_openai.py) and the backend
+under uvicorn with a throwaway SQLite database, then runs N simulated
+students. Each student logs in, opens a conversation and sends M messages.
+Prints throughput and p50/p95/p99 per endpoint:
+
+    cd backend
+    python -m benchmarks.load_test --students 50 --messages 5
+    python -m benchmarks.load_test --stream --latency 0.8 --error-rate 0.02
+
+Use --target to load an already running backend instead. For a pre-deploy
+check, pass --max-p95-ms and/or --max-error-rate; the exit status is 1 when
+a limit is exceeded. A failed model call still answers 200 with a fallback
+reply, so the error rate also counts failed reply/stream calls, read from
+the backend's /metrics before and after the run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# Suffix of the pseudo-endpoint timing the first streamed event
+FIRST_TOKEN = "(first token)"
+# Model calls behind chat replies; a failure there becomes a fallback reply
+CHAT_OPERATIONS = ("reply", "stream")
+
+
+class Recorder:
+    """Latencies and error counts per endpoint template."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        if ok:
+            self.latencies[endpoint].append(seconds)
+        else:
+            self.errors[endpoint] += 1
+
+    def endpoints(self) -> List[str]:
+        return sorted(set(self.latencies) | set(self.errors))
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+async def _timed(
+    recorder: Recorder, endpoint: str, request
+) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        recorder.record(endpoint, time.perf_counter() - started, ok=False)
+        return None
+    ok = response.status_code < 400
+    recorder.record(endpoint, time.perf_counter() - started, ok=ok)
+    return response if ok else None
+
+
+async def _stream_turn(
+    client: httpx.AsyncClient, recorder: Recorder, conversation_id: int, content: str
+) -> None:
+    endpoint = "POST /conversations/{id}/messages/stream"
+    started = time.perf_counter()
+    first_token = None
+    try:
+        async with client.stream(
+            "POST",
+            f"/conversations/{conversation_id}/messages/stream",
+            json={"content": content},
+        ) as response:
+            ok = response.status_code < 400
+            async for line in response.aiter_lines():
+                if first_token is None and line.startswith("data:"):
+                    first_token = time.perf_counter() - started
+    except httpx.HTTPError:
+        ok = False
+    recorder.record(endpoint, time.perf_counter() - started, ok=ok)
+    if ok and first_token is not None:
+        recorder.record(f"{endpoint} {FIRST_TOKEN}", first_token, ok=True)
+
+
+async def simulate_student(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    index: int,
+    messages: int,
+    stream: bool,
+    think_time: float,
+) -> None:
+    login = await _timed(
+        recorder,
+        "POST /auth/login",
+        client.post(
+            "/auth/login",
+            json={"email": f"load{index}@example.com", "name": f"Student {index}"},
+        ),
+    )
+    if login is None:
+        return
+    conv = await _timed(
+        recorder,
+        "POST /conversations",
+        client.post("/conversations", json={"student_id": login.json()["id"]}),
+    )
+    if conv is None:
+        return
+    conversation_id = conv.json()["id"]
+    for turn in range(messages):
+        content = f"Student {index}, question {turn}: what should I do next?"
+        if stream:
+            await _stream_turn(client, recorder, conversation_id, content)
+        else:
+            await _timed(
+                recorder,
+                "POST /conversations/{id}/messages",
+                client.post(
+                    f"/conversations/{conversation_id}/messages",
+                    json={"content": content},
+                ),
+            )
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def model_errors(client: httpx.AsyncClient) -> Optional[int]:
+    """Failed chat model calls so far per the backend's /metrics, if exposed."""
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    total = 0.0
+    for line in response.text.splitlines():
+        if not line.startswith("llm_request_duration_seconds_count{"):
+            continue
+        labels, _, value = line.rpartition(" ")
+        if 'outcome="error"' in labels and any(
+            f'operation="{op}"' in labels for op in CHAT_OPERATIONS
+        ):
+            total += float(value)
+    return int(total)
+
+
+async def wait_until_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+            await asyncio.sleep(0.2)
+
+
+def start_servers(args, tmp: str) -> List[subprocess.Popen]:
+    fake = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.fake_openai",
+            "--port",
+            str(args.fake_port),
+            "--latency",
+            str(args.latency),
+            "--tokens-per-second",
+            str(args.tokens_per_second),
+            "--reply-tokens",
+            str(args.reply_tokens),
+            "--error-rate",
+            str(args.error_rate),
+        ],
+        cwd=BACKEND_DIR,
+    )
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-load-test",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.fake_port}/v1",
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'load.db')}",
+        # Every prompt should reach the model
+        "RESPONSE_CACHE_ENABLED": "false",
+        # Retrieval embeds through the fake server; start from a cold cache
+        "EMBEDDING_PROVIDER": "openai",
+        "EMBEDDING_CACHE_DIR": os.path.join(tmp, "embedding_cache"),
+    }
+    backend = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    return [fake, backend]
+
+
+def report(
+    recorder: Recorder, elapsed: float, fallbacks: Optional[int] = None
+) -> Dict[str, float]:
+    print(
+        f"{'endpoint':<56}{'ok':>7}{'err':>6}{'req/s':>8}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    )
+    worst_p95 = 0.0
+    total_ok = total_err = 0
+    for endpoint in recorder.endpoints():
+        values = sorted(recorder.latencies[endpoint])
+        errors = recorder.errors[endpoint]
+        p95 = percentile(values, 95) * 1000
+        print(
+            f"{endpoint:<56}{len(values):>7}{errors:>6}{len(values) / elapsed:>8.1f}"
+            f"{percentile(values, 50) * 1000:>9.1f}{p95:>9.1f}"
+            f"{percentile(values, 99) * 1000:>9.1f}"
+        )
+        if not endpoint.endswith(FIRST_TOKEN):
+            worst_p95 = max(worst_p95, p95)
+            total_ok += len(values)
+            total_err += errors
+    total = total_ok + total_err
+    if fallbacks is None:
+        print("\n/metrics unavailable: fallback replies are not counted as errors")
+    else:
+        print(f"\n{fallbacks} replies were fallbacks after a failed model call")
+    error_rate = (total_err + (fallbacks or 0)) / total if total else 0.0
+    print(
+        f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), "
+        f"error rate {error_rate:.2%}"
+    )
+    return {
+        "worst_p95_ms": worst_p95,
+        "error_rate": error_rate,
+        "fallback_replies": fallbacks or 0,
+    }
+
+
+async def run(args) -> Dict[str, float]:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.students)
+    async with httpx.AsyncClient(
+        base_url=args.target, limits=limits, timeout=args.timeout
+    ) as client:
+        errors_before = await model_errors(client)
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                simulate_student(
+                    client, recorder, i, args.messages, args.stream, args.think_time
+                )
+                for i in range(args.students)
+            )
+        )
+        elapsed = time.perf_counter() - started
+        errors_after = await model_errors(client)
+    fallbacks = None
+    if errors_before is not None and errors_after is not None:
+        fallbacks = errors_after - errors_before
+    print(
+        f"{args.students} students x {args.messages} messages"
+        f"{' (streaming)' if args.stream else ''}\n"
+    )
+    return report(recorder, elapsed, fallbacks)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5, help="per student")
+    parser.add_argument("--stream", action="store_true", help="use the SSE endpoint")
+    parser.add_argument("--think-time", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--target", help="base URL of an already running backend")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fake-port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-p95-ms", type=float)
+    parser.add_argument("--max-error-rate", type=float)
+    parser.add_argument("--json", action="store_true", help="also print a JSON summary")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        processes: List[subprocess.Popen] = []
+        if args.target is None:
+            args.target = f"http://127.0.0.1:{args.port}"
+            processes = start_servers(args, tmp)
+        try:
+            asyncio.run(wait_until_ready(f"{args.target}/"))
+            summary = asyncio.run(run(args))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=10)
+
+    if args.json:
+        print(json.dumps(summary))
+    failed = False
+    if args.max_p95_ms is not None and summary["worst_p95_ms"] > args.max_p95_ms:
+        print(f"FAIL: p95 {summary['worst_p95_ms']:.1f} ms > {args.max_p95_ms} ms")
+        failed = True
+    if args.max_error_rate is not None and summary["error_rate"] > args.max_error_rate:
+        print(
+            f"FAIL: error rate {summary['error_rate']:.2%} > {args.max_error_rate:.2%}"
+        )
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
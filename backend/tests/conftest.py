@@ -1,49 +1,148 @@
+import asyncio
 import pytest
 import sys
 import os
+from contextlib import contextmanager
 from pathlib import Path
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.pool import StaticPool
 
 # Add the backend directory to Python path for imports
 backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
-from app.main import app
+from app import main
+from app.main import app, student_cache
 from app.db import Base, get_db
+from app.suggestions import suggestion_job, suggestion_triggers
+from app.summarizer import summary_queue
+from app.cache import response_cache
+from app.storage import blob_store
+from app.retrieval import retrieval_index
 
 
 @pytest.fixture
-def test_db():
+def test_db(monkeypatch):
     """Create a test database in memory."""
-    engine = create_engine(
-        "sqlite:///:memory:",
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
         connect_args={"check_same_thread": False},
         poolclass=StaticPool,
     )
-    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    
+    TestingSessionLocal = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    async def drop_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
     # Create tables
-    Base.metadata.create_all(bind=engine)
-    
-    def override_get_db():
-        try:
-            db = TestingSessionLocal()
+    asyncio.run(create_tables())
+
+    async def override_get_db():
+        async with TestingSessionLocal() as db:
             yield db
-        finally:
-            db.close()
-    
+
     app.dependency_overrides[get_db] = override_get_db
-    
+    # Work that outlives a request (the streamed turn's write) opens its own
+    monkeypatch.setattr(main, "SessionLocal", TestingSessionLocal)
+
+    # Background summaries use the test database. TestClient runs each request
+    # on its own event loop and cancels leftover tasks when it closes, so jobs
+    # stay parked in their debounce by default; tests that exercise them run a
+    # single loop (see test_summarizer.py).
+    monkeypatch.setattr(summary_queue, "session_factory", TestingSessionLocal)
+    monkeypatch.setattr(summary_queue, "debounce_seconds", 3600)
+    monkeypatch.setattr(suggestion_job, "session_factory", TestingSessionLocal)
+    monkeypatch.setattr(suggestion_triggers, "session_factory", TestingSessionLocal)
+    monkeypatch.setattr(suggestion_triggers, "debounce_seconds", 3600)
+    monkeypatch.setattr(retrieval_index, "session_factory", TestingSessionLocal)
+    monkeypatch.setattr(retrieval_index, "debounce_seconds", 3600)
+
     yield engine
-    
+
     # Cleanup
-    Base.metadata.drop_all(bind=engine)
+    summary_queue.reset()
+    suggestion_triggers.reset()
+    asyncio.run(drop_tables())
     app.dependency_overrides.clear()
 
 
+class QueryCounter:
+    """Records every statement issued through the test engine.
+
+    Use `budget(n)` around a request to make its query count a contract:
+
+        with query_counter.budget(4):
+            client.post(...)
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def reset(self):
+        self.statements.clear()
+
+    @contextmanager
+    def budget(self, max_queries):
+        start = len(self.statements)
+        yield self
+        issued = self.statements[start:]
+        assert len(issued) <= max_queries, (
+            f"{len(issued)} queries issued, budget is {max_queries}:\n"
+            + "\n".join(f"  {i + 1}. {sql}" for i, sql in enumerate(issued))
+        )
+
+
+@pytest.fixture
+def query_counter(test_db):
+    """Count the statements the app issues against the test database."""
+    counter = QueryCounter()
+    event.listen(test_db.sync_engine, "before_cursor_execute", counter)
+    yield counter
+    event.remove(test_db.sync_engine, "before_cursor_execute", counter)
+
+
+@pytest.fixture(autouse=True)
+def reset_response_cache():
+    """Keep cached assistant replies and logins from leaking between tests."""
+    response_cache.clear()
+    student_cache.clear()
+    yield
+    response_cache.clear()
+    student_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_retrieval_index():
+    """Drop per-student embedding indexes built against another test's data."""
+    retrieval_index.reset()
+    yield
+    retrieval_index.reset()
+
+
+@pytest.fixture(autouse=True)
+def isolated_blob_store(tmp_path, monkeypatch):
+    """Keep uploaded documents out of the real storage directory."""
+    monkeypatch.setattr(blob_store, "root", tmp_path / "blobs")
+    return blob_store
+
+
 @pytest.fixture
 def client(test_db):
     """Create a test client with test database."""
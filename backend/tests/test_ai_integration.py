@@ -1,9 +1,11 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 
 
 import os
 import importlib
+from types import SimpleNamespace
 
 
 def test_ai_response_without_api_key(
@@ -162,3 +164,162 @@ def test_student_context_summary_creation(client: TestClient, sample_student):
     # All messages should have content
     for msg in messages:
         assert len(msg["content"]) > 0
+
+
+class _FakeStreamClient:
+    """Minimal stand-in for the OpenAI client that streams pre-baked chunks."""
+
+    def __init__(self, chunks, fail_after=None):
+        self._chunks = chunks
+        self._fail_after = fail_after
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        assert kwargs.get("stream") is True
+        return self._stream()
+
+    async def _stream(self):
+        for i, text in enumerate(self._chunks):
+            if self._fail_after is not None and i == self._fail_after:
+                raise RuntimeError("connection dropped")
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=text))]
+            )
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.asyncio
+async def test_stream_assistant_reply_yields_chunks(monkeypatch):
+    """Test that streamed completions are yielded chunk by chunk."""
+    from app import ai
+
+    monkeypatch.setattr(
+        ai, "get_openai_client", lambda: _FakeStreamClient(["Hel", "lo", None, "!"])
+    )
+
+    chunks = await _collect(
+        ai.stream_assistant_reply([{"role": "user", "content": "hi"}], None)
+    )
+    assert chunks == ["Hel", "lo", "!"]
+
+
+@pytest.mark.asyncio
+async def test_stream_assistant_reply_falls_back_on_error(monkeypatch):
+    """Test that a failure before the first token yields the fallback reply."""
+    from app import ai
+
+    monkeypatch.setattr(
+        ai, "get_openai_client", lambda: _FakeStreamClient(["never"], fail_after=0)
+    )
+
+    chunks = await _collect(
+        ai.stream_assistant_reply([{"role": "user", "content": "hi"}], None)
+    )
+    assert len(chunks) == 1
+    assert "(AI not configured)" in chunks[0]
+
+
+@pytest.mark.asyncio
+async def test_generate_assistant_reply_uses_async_client(monkeypatch):
+    """Test that non-streaming replies are awaited through the shared client."""
+    from app import ai
+
+    async def create(**kwargs):
+        assert kwargs["messages"][0]["role"] == "system"
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Async hi"))]
+        )
+
+    monkeypatch.setattr(
+        ai,
+        "get_openai_client",
+        lambda: SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+        ),
+    )
+
+    reply = await ai.generate_assistant_reply([{"role": "user", "content": "hi"}], None)
+    assert reply == "Async hi"
+
+
+@pytest.mark.asyncio
+async def test_openai_client_is_shared_until_reload(monkeypatch):
+    """Test that one pooled client is reused and rebuilt only on reload."""
+    from app import ai
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    ai.get_settings.cache_clear()
+    try:
+        client = ai.get_openai_client()
+        assert client is not None
+        assert ai.get_openai_client() is client
+
+        monkeypatch.setenv("OPENAI_MODEL", "gpt-test")
+        assert ai.get_settings().openai_model != "gpt-test"  # cached until reload
+
+        settings = await ai.reload_settings()
+        assert settings.openai_model == "gpt-test"
+        assert ai.get_openai_client() is not client
+    finally:
+        await ai.close_openai_client()
+        ai.get_settings.cache_clear()
+
+
+@pytest.mark.asyncio
+async def test_reload_closes_old_client_after_in_flight_calls(monkeypatch):
+    """Test that a reload doesn't cut off a reply still using the old client."""
+    from app import ai
+
+    release = asyncio.Event()
+    closed = []
+
+    class _SlowClient:
+        def __init__(self):
+            completions = SimpleNamespace(create=self._create)
+            self.chat = SimpleNamespace(completions=completions)
+
+        async def _create(self, **kwargs):
+            await release.wait()
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content="Done"))]
+            )
+
+        async def close(self):
+            closed.append(self)
+
+    slow = _SlowClient()
+    monkeypatch.setattr(ai, "_client", slow)
+    monkeypatch.setattr(ai, "get_openai_client", lambda: slow)
+    try:
+        call = asyncio.create_task(
+            ai.generate_assistant_reply(
+                [{"role": "user", "content": "hi"}], None, use_cache=False
+            )
+        )
+        await asyncio.sleep(0)
+        await ai.reload_settings()
+        assert ai._client is None
+        assert closed == []
+
+        release.set()
+        assert await call == "Done"
+        await asyncio.gather(*ai._closing)
+        assert closed == [slow]
+    finally:
+        ai.get_settings.cache_clear()
+
+
+def test_reload_config_endpoint(client: TestClient, monkeypatch):
+    """Test that the admin endpoint re-reads configuration."""
+    from app import ai
+
+    monkeypatch.setenv("OPENAI_MODEL", "gpt-reloaded")
+    try:
+        response = client.post("/admin/reload-config")
+        assert response.status_code == 200
+        assert response.json()["openai_model"] == "gpt-reloaded"
+    finally:
+        ai.get_settings.cache_clear()
@@ -1,5 +1,13 @@
+import asyncio
+
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import models
+from app.main import login, student_cache
+from app.schemas import LoginRequest
 
 
 def test_root_endpoint(client: TestClient):
@@ -9,9 +17,10 @@ def test_root_endpoint(client: TestClient):
     assert response.json() == {"status": "ok"}
 
 
-def test_login_new_student(client: TestClient, sample_student):
+def test_login_new_student(client: TestClient, sample_student, query_counter):
     """Test logging in with a new student creates the student."""
-    response = client.post("/auth/login", json=sample_student)
+    with query_counter.budget(1):
+        response = client.post("/auth/login", json=sample_student)
     assert response.status_code == 200
     
     data = response.json()
@@ -21,15 +30,16 @@ def test_login_new_student(client: TestClient, sample_student):
     assert data["id"] > 0
 
 
-def test_login_existing_student(client: TestClient, sample_student):
+def test_login_existing_student(client: TestClient, sample_student, query_counter):
     """Test logging in with an existing student returns the same student."""
     # First login
     response1 = client.post("/auth/login", json=sample_student)
     assert response1.status_code == 200
     student_id1 = response1.json()["id"]
     
-    # Second login with same email
-    response2 = client.post("/auth/login", json=sample_student)
+    # Second login with same email is served from the cache
+    with query_counter.budget(0):
+        response2 = client.post("/auth/login", json=sample_student)
     assert response2.status_code == 200
     student_id2 = response2.json()["id"]
     
@@ -37,6 +47,52 @@ def test_login_existing_student(client: TestClient, sample_student):
     assert student_id1 == student_id2
 
 
+def test_login_existing_student_after_restart(
+    client: TestClient, sample_student, query_counter
+):
+    """Test a cache miss for a known email: the insert is a no-op, then a read."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    student_cache.clear()
+
+    with query_counter.budget(2):
+        response = client.post("/auth/login", json=sample_student)
+    assert response.json()["id"] == student_id
+
+
+def test_concurrent_first_logins_get_one_student(test_db, sample_student):
+    """Test that racing first logins neither fail nor create duplicates."""
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+
+    async def race():
+        async def one():
+            async with Session() as db:
+                return await login(LoginRequest(**sample_student), db)
+
+        results = await asyncio.gather(one(), one(), one())
+        async with Session() as db:
+            count = await db.scalar(select(func.count(models.Student.id)))
+        return results, count
+
+    results, count = asyncio.run(race())
+    assert len({r.id for r in results}) == 1
+    assert count == 1
+
+
+def test_student_writes_invalidate_the_login_cache(client: TestClient, test_db):
+    """Test that renaming a student is visible on the next login."""
+    login_data = {"email": "rename@example.com", "name": "Old"}
+    student_id = client.post("/auth/login", json=login_data).json()["id"]
+
+    async def rename():
+        async with async_sessionmaker(bind=test_db)() as db:
+            student = await db.get(models.Student, student_id)
+            student.name = "New"
+            await db.commit()
+
+    asyncio.run(rename())
+    assert client.post("/auth/login", json=login_data).json()["name"] == "New"
+
+
 def test_login_without_name(client: TestClient):
     """Test logging in without a name uses default name."""
     login_data = {"email": "no-name@example.com"}
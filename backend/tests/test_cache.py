@@ -0,0 +1,145 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import ai
+from app.cache import CachedReply, LRUCache, ResponseCache, response_cache
+
+
+class _CountingClient:
+    """Fake OpenAI client returning a fixed completion and counting calls."""
+
+    def __init__(self, content="Start with your transcript.", total_tokens=120):
+        self.calls = 0
+        self.content = content
+        self.total_tokens = total_tokens
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))],
+            usage=SimpleNamespace(total_tokens=self.total_tokens),
+        )
+
+
+def test_lru_evicts_least_recently_used():
+    """Test that the oldest untouched entry is evicted at capacity."""
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recent
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_expires_entries(monkeypatch):
+    """Test that entries past their TTL are treated as misses."""
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=10, ttl_seconds=60)
+    cache.set("k", "v")
+
+    now[0] += 59
+    assert cache.get("k") == "v"
+    now[0] += 2
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_key_depends_on_model_and_prompt():
+    """Test that any change to model or prompt changes the cache key."""
+    history = [{"role": "user", "content": "What should I do first?"}]
+    key = ResponseCache.key_for("gpt-4o-mini", history)
+
+    assert key == ResponseCache.key_for("gpt-4o-mini", [dict(history[0])])
+    assert key != ResponseCache.key_for("gpt-4o", history)
+    assert key != ResponseCache.key_for(
+        "gpt-4o-mini", [{"role": "user", "content": "What should I do next?"}]
+    )
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Test that the SQLite tier serves replies to a fresh cache instance."""
+    path = str(tmp_path / "responses.sqlite")
+    asyncio.run(ResponseCache(db_path=path).set("k", CachedReply("cached reply", 50)))
+
+    restarted = ResponseCache(db_path=path)
+    reply = asyncio.run(restarted.get("k"))
+
+    assert reply.content == "cached reply"
+    stats = restarted.stats()
+    assert stats["hits"] == 1
+    assert stats["disk_hits"] == 1
+    assert stats["saved_tokens"] == 50
+
+
+@pytest.mark.asyncio
+async def test_repeated_prompt_is_served_from_cache(monkeypatch):
+    """Test that an identical prompt only reaches the model once."""
+    fake = _CountingClient()
+    monkeypatch.setattr(ai, "get_openai_client", lambda: fake)
+    history = [{"role": "user", "content": "What should I do first?"}]
+
+    first = await ai.generate_assistant_reply(history, None)
+    second = await ai.generate_assistant_reply(history, None)
+    bypassed = await ai.generate_assistant_reply(history, None, use_cache=False)
+
+    assert first == second == bypassed == fake.content
+    assert fake.calls == 2
+    stats = response_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["saved_tokens"] == fake.total_tokens
+
+
+@pytest.mark.asyncio
+async def test_fallback_replies_are_not_cached(monkeypatch):
+    """Test that failed completions never populate the cache."""
+
+    async def failing(**kwargs):
+        raise RuntimeError("rate limited")
+
+    monkeypatch.setattr(
+        ai,
+        "get_openai_client",
+        lambda: SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=failing))
+        ),
+    )
+    await ai.generate_assistant_reply([{"role": "user", "content": "hi"}], None)
+
+    assert response_cache.stats()["entries"] == 0
+
+
+def test_bypass_cache_flag_and_stats_endpoint(
+    client: TestClient, sample_student, monkeypatch
+):
+    """Test the per-request bypass flag and the cache stats endpoint."""
+    fake = _CountingClient()
+    monkeypatch.setattr(ai, "get_openai_client", lambda: fake)
+
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conv_ids = [
+        client.post("/conversations", json={"student_id": student_id}).json()["id"]
+        for _ in range(3)
+    ]
+    question = {"content": "What should I do first?"}
+
+    client.post(f"/conversations/{conv_ids[0]}/messages", json=question)
+    client.post(f"/conversations/{conv_ids[1]}/messages", json=question)
+    client.post(
+        f"/conversations/{conv_ids[2]}/messages",
+        json={**question, "bypass_cache": True},
+    )
+    assert fake.calls == 2
+
+    stats = client.get("/admin/cache-stats").json()
+    assert stats["hits"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["saved_tokens"] == fake.total_tokens
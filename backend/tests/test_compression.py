@@ -0,0 +1,74 @@
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import compression
+from app.schemas import MessageOut
+
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    """Negotiate as if the optional brotli package were not installed."""
+    monkeypatch.setattr(compression, "brotli", None)
+
+
+def test_choose_encoding_honours_q_values(gzip_only):
+    """Test Accept-Encoding negotiation, including refusals and wildcards."""
+    assert compression.choose_encoding("gzip, deflate") == "gzip"
+    assert compression.choose_encoding("br;q=1.0, gzip;q=0.5") == "gzip"
+    assert compression.choose_encoding("gzip;q=0") is None
+    assert compression.choose_encoding("*") == "gzip"
+    assert compression.choose_encoding("*, gzip;q=0") is None
+    assert compression.choose_encoding("identity") is None
+    assert compression.choose_encoding("") is None
+
+
+def _long_conversation(client: TestClient, sample_student) -> str:
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conversation_id = client.post(
+        "/conversations", json={"student_id": student_id}
+    ).json()["id"]
+    essay = "My summer at the robotics lab taught me to fail usefully. " * 40
+    client.post(f"/conversations/{conversation_id}/messages", json={"content": essay})
+    return f"/conversations/{conversation_id}/messages"
+
+
+def test_large_listings_are_gzipped(client: TestClient, sample_student, gzip_only):
+    """Test that a big message page is compressed and decodes to the same rows."""
+    url = _long_conversation(client, sample_student)
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(response.content) / 3
+    messages = response.json()["messages"]
+    assert set(messages[0]) == set(MessageOut.model_fields)
+    assert messages[0]["content"].startswith("My summer")
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.content == response.content
+
+
+def test_small_and_streamed_responses_are_not_compressed(
+    client: TestClient, sample_student, gzip_only
+):
+    """Test the size threshold and that SSE passes through untouched."""
+    url = _long_conversation(client, sample_student)
+
+    small = client.get("/", headers={"Accept-Encoding": "gzip"})
+    stream = client.post(
+        f"{url}/stream", json={"content": "Hi"}, headers={"Accept-Encoding": "gzip"}
+    )
+
+    assert "content-encoding" not in small.headers
+    assert stream.headers["content-type"].startswith("text/event-stream")
+    assert "content-encoding" not in stream.headers
+
+
+def test_compress_round_trips():
+    """Test the gzip codec used by the middleware."""
+    body = b'{"messages": []}' * 100
+    assert gzip.decompress(compression.compress(body, "gzip")) == body
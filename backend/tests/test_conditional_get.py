@@ -0,0 +1,81 @@
+from fastapi.testclient import TestClient
+
+
+def _start(client: TestClient, sample_student):
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conv = client.post("/conversations", json={"student_id": student_id}).json()
+    client.post(f"/conversations/{conv['id']}/messages", json={"content": "Hi"})
+    return student_id, conv["id"]
+
+
+def test_unchanged_messages_are_not_reloaded(
+    client: TestClient, sample_student, query_counter
+):
+    """Test that a matching If-None-Match costs one query and no Message rows."""
+    _, conversation_id = _start(client, sample_student)
+    url = f"/conversations/{conversation_id}/messages"
+    first = client.get(url)
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert first.headers["cache-control"] == "no-cache"
+
+    query_counter.reset()
+    cached = client.get(url, headers={"If-None-Match": etag})
+
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+    assert query_counter.count == 1
+    assert "messages" not in query_counter.statements[0]
+
+
+def test_writes_and_query_params_change_the_etag(client: TestClient, sample_student):
+    """Test that a new turn or a different page gets a fresh validator."""
+    _, conversation_id = _start(client, sample_student)
+    url = f"/conversations/{conversation_id}/messages"
+    etag = client.get(url).headers["etag"]
+
+    other_page = client.get(url, params={"limit": 1}, headers={"If-None-Match": etag})
+    assert other_page.status_code == 200
+    assert other_page.headers["etag"] != etag
+
+    client.post(url, json={"content": "Again"})
+    fresh = client.get(url, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert len(fresh.json()["messages"]) == 4
+    assert fresh.headers["etag"] != etag
+    # Weak comparison and lists of tags are both accepted
+    strong = fresh.headers["etag"].removeprefix("W/")
+    assert (
+        client.get(url, headers={"If-None-Match": f'"stale", {strong}'}).status_code
+        == 304
+    )
+
+
+def test_conversation_list_revalidates_on_list_changes(
+    client: TestClient, sample_student, query_counter
+):
+    """Test the list ETag across new conversations and new messages."""
+    student_id, conversation_id = _start(client, sample_student)
+    url = f"/conversations/{student_id}"
+    etag = client.get(url).headers["etag"]
+
+    query_counter.reset()
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert query_counter.count == 1
+
+    client.post(f"/conversations/{conversation_id}/messages", json={"content": "2"})
+    after_turn = client.get(url, headers={"If-None-Match": etag})
+    assert after_turn.status_code == 200
+
+    etag = after_turn.headers["etag"]
+    client.post("/conversations", json={"student_id": student_id})
+    after_create = client.get(url, headers={"If-None-Match": etag})
+    assert after_create.status_code == 200
+    assert len(after_create.json()["conversations"]) == 2
+
+
+def test_missing_conversation_is_never_not_modified(client: TestClient):
+    """Test that If-None-Match: * still reports a missing conversation."""
+    response = client.get("/conversations/999/messages", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
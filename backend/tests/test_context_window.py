@@ -0,0 +1,159 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import tiktoken
+from fastapi.testclient import TestClient
+
+from app import context_window, main
+from app.context_window import (
+    MESSAGE_OVERHEAD_TOKENS,
+    build_context_window,
+    count_tokens,
+    message_tokens,
+)
+
+
+def _rows(*contents, start_id=1):
+    """Build newest-first message rows with sequential ids."""
+    rows = [
+        SimpleNamespace(
+            id=start_id + i, role="user" if i % 2 == 0 else "assistant", content=c
+        )
+        for i, c in enumerate(contents)
+    ]
+    return list(reversed(rows))
+
+
+def test_window_keeps_newest_messages_within_budget():
+    """Test that the newest messages that fit are chosen, oldest first."""
+    rows = _rows("a" * 400, "b" * 40, "c" * 40, "d" * 40, start_id=100)
+    per_small = count_tokens("b" * 40) + MESSAGE_OVERHEAD_TOKENS
+
+    window = build_context_window(rows, budget=3 * per_small + 5, reserved_tokens=5)
+
+    assert window.message_ids == [101, 102, 103]
+    assert [m["content"][0] for m in window.messages] == ["b", "c", "d"]
+    assert window.tokens_used == 3 * per_small
+    assert window.tokens_used <= window.available_tokens
+    assert window.dropped == 1
+
+
+def test_window_always_keeps_newest_message():
+    """Test that the current turn is kept even if it exceeds the budget."""
+    rows = _rows("older", "x" * 2000, start_id=200)
+
+    window = build_context_window(rows, budget=50, reserved_tokens=40)
+
+    assert window.message_ids == [201]
+    assert window.dropped == 1
+
+
+def test_window_is_contiguous():
+    """Test that a large message ends the window instead of being skipped."""
+    rows = _rows("small", "x" * 2000, "small", start_id=300)
+    per_small = count_tokens("small") + MESSAGE_OVERHEAD_TOKENS
+
+    window = build_context_window(rows, budget=3 * per_small, reserved_tokens=0)
+
+    assert window.message_ids == [302]
+
+
+def test_message_tokens_are_cached_by_id(monkeypatch):
+    """Test that persisted messages are only tokenized once."""
+    calls = []
+
+    def counting(text):
+        calls.append(text)
+        return 7
+
+    monkeypatch.setattr(context_window, "count_tokens", counting)
+    monkeypatch.setattr(context_window, "_message_token_cache", OrderedDict())
+
+    assert message_tokens(42, "hello") == 7 + MESSAGE_OVERHEAD_TOKENS
+    assert message_tokens(42, "hello") == 7 + MESSAGE_OVERHEAD_TOKENS
+    assert message_tokens(None, "unsaved") == 7 + MESSAGE_OVERHEAD_TOKENS
+    assert calls == ["hello", "unsaved"]
+
+
+def test_encoder_is_resolved_off_the_event_loop(monkeypatch):
+    """Test that the tokenizer lookup runs in a worker thread, only once."""
+    threads = []
+
+    def resolving(model):
+        threads.append(threading.get_ident())
+        raise KeyError(model)
+
+    monkeypatch.setattr(tiktoken, "encoding_for_model", resolving)
+    context_window._get_encoder.cache_clear()
+
+    async def run():
+        await context_window.load_encoder()
+        await context_window.load_encoder()
+        return threading.get_ident()
+
+    try:
+        loop_thread = asyncio.run(run())
+    finally:
+        context_window._get_encoder.cache_clear()
+
+    assert len(threads) == 1
+    assert threads[0] != loop_thread
+
+
+def _create_conversation(client: TestClient, sample_student) -> int:
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conv = client.post("/conversations", json={"student_id": student_id})
+    return conv.json()["id"]
+
+
+def test_send_message_uses_newest_history(
+    client: TestClient, sample_student, monkeypatch
+):
+    """Test that the prompt history ends with the message just sent."""
+    seen = []
+
+    async def fake_reply(history, summary, use_cache=True, references=None):
+        seen.append(history)
+        return "ok"
+
+    monkeypatch.setattr(main, "generate_assistant_reply", fake_reply)
+    conversation_id = _create_conversation(client, sample_student)
+
+    for i in range(20):
+        client.post(
+            f"/conversations/{conversation_id}/messages",
+            json={"content": f"message {i}"},
+        )
+
+    # 40 stored messages; the old query would have sent the oldest 30
+    last_history = seen[-1]
+    assert last_history[-1] == {"role": "user", "content": "message 19"}
+    assert len(last_history) == 39
+
+
+def test_context_window_endpoint(client: TestClient, sample_student, query_counter):
+    """Test that the debug endpoint reports the chosen window."""
+    conversation_id = _create_conversation(client, sample_student)
+    client.post(
+        f"/conversations/{conversation_id}/messages", json={"content": "Hello there"}
+    )
+    messages = client.get(f"/conversations/{conversation_id}/messages").json()[
+        "messages"
+    ]
+
+    with query_counter.budget(2):
+        response = client.get(f"/conversations/{conversation_id}/context-window")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["message_ids"] == [m["id"] for m in messages]
+    assert data["tokens_used"] == sum(data["message_tokens"])
+    assert data["reserved_tokens"] > 0
+    assert data["dropped"] == 0
+
+
+def test_context_window_endpoint_nonexistent_conversation(client: TestClient):
+    """Test that the debug endpoint 404s for unknown conversations."""
+    response = client.get("/conversations/99999/context-window")
+    assert response.status_code == 404
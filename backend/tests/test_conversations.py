@@ -1,8 +1,15 @@
+import asyncio
+from datetime import datetime, timedelta
+
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import models
+from app.counters import message_preview
 
 
-def test_create_conversation(client: TestClient, sample_student):
+def test_create_conversation(client: TestClient, sample_student, query_counter):
     """Test creating a new conversation."""
     # First create a student
     student_response = client.post("/auth/login", json=sample_student)
@@ -10,7 +17,8 @@ def test_create_conversation(client: TestClient, sample_student):
     
     # Create conversation
     conv_data = {"student_id": student_id, "title": "Test Conv"}
-    response = client.post("/conversations", json=conv_data)
+    with query_counter.budget(4):
+        response = client.post("/conversations", json=conv_data)
     assert response.status_code == 200
     
     data = response.json()
@@ -57,7 +65,9 @@ def test_list_conversations_empty(client: TestClient, sample_student):
     assert data["conversations"] == []
 
 
-def test_list_conversations_with_data(client: TestClient, sample_student):
+def test_list_conversations_with_data(
+    client: TestClient, sample_student, query_counter
+):
     """Test listing conversations returns created conversations."""
     # Create a student
     student_response = client.post("/auth/login", json=sample_student)
@@ -72,7 +82,8 @@ def test_list_conversations_with_data(client: TestClient, sample_student):
     client.post("/conversations", json=conv_data2)
     
     # List conversations
-    response = client.get(f"/conversations/{student_id}")
+    with query_counter.budget(2):
+        response = client.get(f"/conversations/{student_id}")
     assert response.status_code == 200
     
     data = response.json()
@@ -89,3 +100,143 @@ def test_list_conversations_nonexistent_student(client: TestClient):
     
     data = response.json()
     assert data["conversations"] == []
+
+
+def test_list_conversations_pagination(client: TestClient, sample_student):
+    """Test keyset paging through a student's conversations, newest first."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    created = [
+        client.post(
+            "/conversations", json={"student_id": student_id, "title": f"Conv {i}"}
+        ).json()["id"]
+        for i in range(5)
+    ]
+    newest_first = list(reversed(created))
+
+    page1 = client.get(f"/conversations/{student_id}", params={"limit": 2}).json()
+    assert [c["id"] for c in page1["conversations"]] == newest_first[:2]
+    assert page1["next_cursor"] is not None
+
+    page2 = client.get(
+        f"/conversations/{student_id}",
+        params={"limit": 2, "cursor": page1["next_cursor"]},
+    ).json()
+    assert [c["id"] for c in page2["conversations"]] == newest_first[2:4]
+
+    page3 = client.get(
+        f"/conversations/{student_id}",
+        params={"limit": 2, "cursor": page2["next_cursor"]},
+    ).json()
+    assert [c["id"] for c in page3["conversations"]] == newest_first[4:]
+    assert page3["next_cursor"] is None
+
+    # after_id returns conversations newer than the cursor, newest first
+    newer = client.get(
+        f"/conversations/{student_id}", params={"after_id": created[2]}
+    ).json()
+    assert [c["id"] for c in newer["conversations"]] == newest_first[:2]
+    assert newer["next_cursor"] is None
+
+
+def test_list_conversations_shows_latest_message(client: TestClient, sample_student):
+    """Test that a turn updates the listed count, activity time and preview."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conv = client.post("/conversations", json={"student_id": student_id}).json()
+    assert conv["message_count"] == 0
+    assert conv["last_message_preview"] is None
+    assert conv["last_message_at"] is not None
+
+    client.post(f"/conversations/{conv['id']}/messages", json={"content": "Hi"})
+    listed = client.get(f"/conversations/{student_id}").json()["conversations"][0]
+    messages = client.get(f"/conversations/{conv['id']}/messages").json()["messages"]
+
+    assert listed["message_count"] == 2
+    assert listed["last_message_preview"] == message_preview(messages[-1]["content"])
+    assert listed["last_message_at"] >= conv["last_message_at"]
+
+
+def test_list_conversations_by_activity(client: TestClient, test_db, query_counter):
+    """Test keyset paging by latest message in a single list query per page."""
+    start = datetime(2026, 9, 1)
+
+    async def seed():
+        async with async_sessionmaker(bind=test_db)() as db:
+            db.add(models.Student(id=1, email="a@example.com", name="A"))
+            # Created in id order; the oldest has the most recent message
+            for i, active_days in enumerate([9, 3, 5, 1], start=1):
+                db.add(
+                    models.Conversation(
+                        id=i,
+                        student_id=1,
+                        title=f"Conv {i}",
+                        created_at=start + timedelta(days=i),
+                        last_message_at=start + timedelta(days=active_days),
+                    )
+                )
+            await db.commit()
+
+    asyncio.run(seed())
+
+    with query_counter.budget(2):
+        page1 = client.get(
+            "/conversations/1", params={"sort": "activity", "limit": 2}
+        ).json()
+    assert [c["id"] for c in page1["conversations"]] == [1, 3]
+
+    page2 = client.get(
+        "/conversations/1",
+        params={"sort": "activity", "limit": 2, "cursor": page1["next_cursor"]},
+    ).json()
+    assert [c["id"] for c in page2["conversations"]] == [2, 4]
+    assert page2["next_cursor"] is None
+
+    newer = client.get(
+        "/conversations/1", params={"sort": "activity", "after_id": 2}
+    ).json()
+    assert [c["id"] for c in newer["conversations"]] == [1, 3]
+
+    # The default ordering is still by creation time
+    default = client.get("/conversations/1").json()
+    assert [c["id"] for c in default["conversations"]] == [4, 3, 2, 1]
+    assert client.get("/conversations/1", params={"sort": "bogus"}).status_code == 422
+
+
+def test_activity_cursor_survives_new_messages(client: TestClient, sample_student):
+    """Test that a conversation moving up between pages is not listed twice."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    created = [
+        client.post(
+            "/conversations", json={"student_id": student_id, "title": f"Conv {i}"}
+        ).json()["id"]
+        for i in range(4)
+    ]
+    for conv_id in created:
+        client.post(f"/conversations/{conv_id}/messages", json={"content": "Hi"})
+    url = f"/conversations/{student_id}"
+    params = {"sort": "activity", "limit": 2}
+
+    page1 = client.get(url, params=params).json()
+    assert [c["id"] for c in page1["conversations"]] == created[:1:-1]
+    # The last row of page 1 becomes the most recently active
+    client.post(f"/conversations/{created[2]}/messages", json={"content": "Again"})
+
+    page2 = client.get(url, params={**params, "cursor": page1["next_cursor"]}).json()
+    assert [c["id"] for c in page2["conversations"]] == created[1::-1]
+    assert page2["next_cursor"] is None
+
+
+def test_list_conversations_rejects_bad_cursors(client: TestClient, sample_student):
+    """Test that malformed or mismatched cursors are a 400."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    for i in range(3):
+        client.post(
+            "/conversations", json={"student_id": student_id, "title": f"Conv {i}"}
+        )
+    url = f"/conversations/{student_id}"
+    cursor = client.get(url, params={"limit": 1}).json()["next_cursor"]
+
+    assert client.get(url, params={"cursor": "not-a-cursor"}).status_code == 400
+    mismatched = {"cursor": cursor, "sort": "activity"}
+    assert client.get(url, params=mismatched).status_code == 400
+    both = {"cursor": cursor, "before_id": 1}
+    assert client.get(url, params=both).status_code == 400
@@ -0,0 +1,150 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import models
+from app.counters import (
+    PREVIEW_CHARS,
+    increment_message_count,
+    message_preview,
+    rebuild_conversation_activity,
+    rebuild_message_counts,
+)
+from app.summarizer import summary_queue
+
+
+@pytest.mark.asyncio
+async def test_increment_creates_and_bumps_counter(test_db):
+    """Test that the counter row is created on first use and then incremented."""
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+    async with Session() as session:
+        session.add(models.Student(id=1, email="c@example.com", name="C"))
+        await session.commit()
+
+        assert await increment_message_count(session, 1) == 1
+        assert await increment_message_count(session, 1, by=2) == 3
+        await session.commit()
+
+        ctx = await session.get(models.StudentContext, 1)
+        assert ctx.message_count == 3
+
+
+def test_send_message_maintains_counter(client: TestClient, sample_student, test_db):
+    """Test that each turn adds both messages to the student's counter."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conv_a = client.post("/conversations", json={"student_id": student_id}).json()
+    conv_b = client.post("/conversations", json={"student_id": student_id}).json()
+
+    client.post(f"/conversations/{conv_a['id']}/messages", json={"content": "one"})
+    client.post(f"/conversations/{conv_b['id']}/messages", json={"content": "two"})
+
+    async def read_count():
+        Session = async_sessionmaker(bind=test_db)
+        async with Session() as session:
+            return (await session.get(models.StudentContext, student_id)).message_count
+
+    assert asyncio.run(read_count()) == 4
+
+
+def test_summary_scheduled_every_sixth_message(client: TestClient, sample_student):
+    """Test that the counter drives the summarization trigger."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conv = client.post("/conversations", json={"student_id": student_id}).json()
+
+    for i in range(2):
+        client.post(f"/conversations/{conv['id']}/messages", json={"content": f"{i}"})
+    assert summary_queue.status(student_id).state == "idle"
+
+    client.post(f"/conversations/{conv['id']}/messages", json={"content": "third"})
+    assert summary_queue.status(student_id).triggers == 1
+
+
+@pytest.mark.asyncio
+async def test_rebuild_repairs_wrong_and_missing_counters(test_db):
+    """Test that the backfill recomputes counters from the messages table."""
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+    async with Session() as session:
+        session.add_all(
+            [
+                models.Student(id=1, email="a@example.com", name="A"),
+                models.Student(id=2, email="b@example.com", name="B"),
+                models.Student(id=3, email="z@example.com", name="Z"),
+                models.Conversation(id=10, student_id=1, title="A"),
+                models.Conversation(id=20, student_id=2, title="B"),
+            ]
+        )
+        await session.flush()
+        session.add_all(
+            [
+                models.Message(conversation_id=10, role="user", content=str(i))
+                for i in range(3)
+            ]
+            + [models.Message(conversation_id=20, role="user", content="y")]
+        )
+        # Student 1 has a stale counter, student 2 none, student 3 a phantom count
+        session.add(models.StudentContext(student_id=1, message_count=1))
+        session.add(models.StudentContext(student_id=3, message_count=5))
+        await session.commit()
+
+        assert await rebuild_message_counts(session) == 3
+
+        counts = {
+            sid: (await session.get(models.StudentContext, sid, populate_existing=True))
+            for sid in (1, 2, 3)
+        }
+        assert {sid: ctx.message_count for sid, ctx in counts.items()} == {
+            1: 3,
+            2: 1,
+            3: 0,
+        }
+
+        # A second run has nothing to repair
+        assert await rebuild_message_counts(session) == 0
+
+
+def test_message_preview_is_one_short_line():
+    """Test that previews collapse whitespace and are truncated."""
+    assert message_preview("  Hello\n\n  there\t!") == "Hello there !"
+    assert len(message_preview("word " * 100)) == PREVIEW_CHARS
+
+
+@pytest.mark.asyncio
+async def test_rebuild_backfills_conversation_activity(test_db):
+    """Test the backfill of counts, latest times and previews per conversation."""
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+    async with Session() as session:
+        created = datetime(2026, 9, 1)
+        session.add_all(
+            [
+                models.Student(id=1, email="a@example.com", name="A"),
+                models.Conversation(id=10, student_id=1, title="A", created_at=created),
+                models.Conversation(id=20, student_id=1, title="B", created_at=created),
+            ]
+        )
+        await session.flush()
+        session.add_all(
+            [
+                models.Message(
+                    conversation_id=10,
+                    role="user",
+                    content=f"message\n\n  {i}",
+                    created_at=created + timedelta(hours=i),
+                )
+                for i in range(3)
+            ]
+        )
+        await session.commit()
+
+        assert await rebuild_conversation_activity(session) == 2
+
+        busy, empty = [
+            await session.get(models.Conversation, cid, populate_existing=True)
+            for cid in (10, 20)
+        ]
+        assert (busy.message_count, busy.last_message_preview) == (3, "message 2")
+        assert busy.last_message_at == created + timedelta(hours=2)
+        assert (empty.message_count, empty.last_message_preview) == (0, None)
+        assert empty.last_message_at == created
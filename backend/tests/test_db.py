@@ -0,0 +1,140 @@
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.db import (
+    add_missing_columns,
+    add_missing_indexes,
+    engine_options,
+    make_engine,
+    resolve_profile,
+    to_async_url,
+)
+from app.settings import Settings
+
+
+def test_to_async_url_sqlite():
+    """Test that sqlite URLs are routed through aiosqlite."""
+    assert to_async_url("sqlite:////tmp/app.db") == "sqlite+aiosqlite:////tmp/app.db"
+
+
+def test_to_async_url_postgres():
+    """Test that postgres URLs are routed through asyncpg."""
+    assert (
+        to_async_url("postgresql://u:p@localhost/db")
+        == "postgresql+asyncpg://u:p@localhost/db"
+    )
+    assert (
+        to_async_url("postgres://u:p@localhost/db")
+        == "postgresql+asyncpg://u:p@localhost/db"
+    )
+
+
+def test_to_async_url_keeps_explicit_driver():
+    """Test that URLs with an explicit driver are left untouched."""
+    url = "postgresql+psycopg://u:p@localhost/db"
+    assert to_async_url(url) == url
+
+
+@pytest.mark.asyncio
+async def test_add_missing_columns_upgrades_existing_table():
+    """Test that columns added to a model are added to an older table."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql(
+            "CREATE TABLE student_context ("
+            "student_id INTEGER PRIMARY KEY, context_summary TEXT, updated_at DATETIME)"
+        )
+        await conn.exec_driver_sql(
+            "INSERT INTO student_context (student_id, context_summary) VALUES (1, 'x')"
+        )
+        await conn.run_sync(add_missing_columns)
+        columns = await conn.run_sync(
+            lambda sync_conn: {
+                col["name"] for col in inspect(sync_conn).get_columns("student_context")
+            }
+        )
+        # Running again is a no-op
+        await conn.run_sync(add_missing_columns)
+    await engine.dispose()
+
+    assert "last_summarized_message_id" in columns
+
+
+@pytest.mark.asyncio
+async def test_add_missing_indexes_creates_pagination_indexes():
+    """Test that keyset pagination indexes are added to existing tables."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation_id INTEGER, "
+            "role VARCHAR(20), content TEXT, created_at DATETIME)"
+        )
+        await conn.run_sync(add_missing_indexes)
+        indexes = await conn.run_sync(
+            lambda sync_conn: {
+                ix["name"]: ix["column_names"]
+                for ix in inspect(sync_conn).get_indexes("messages")
+            }
+        )
+        plan = await conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM messages "
+            "WHERE conversation_id = 1 AND id < 50 ORDER BY id DESC LIMIT 20"
+        )
+        plan_text = " ".join(str(row[-1]) for row in plan)
+    await engine.dispose()
+
+    assert indexes["ix_messages_conversation_id_id"] == ["conversation_id", "id"]
+    # An index range scan that needs no separate sort step
+    assert "INDEX ix_messages_conversation_id" in plan_text
+    assert "TEMP B-TREE" not in plan_text
+
+
+def test_resolve_profile():
+    """Test that "auto" picks the tuned profile for each backend."""
+    assert resolve_profile("sqlite:///app.db") == "sqlite-wal"
+    assert resolve_profile("postgresql://u:p@localhost/db") == "postgres"
+    assert resolve_profile("sqlite:///app.db", "basic") == "basic"
+    with pytest.raises(ValueError):
+        resolve_profile("sqlite:///app.db", "turbo")
+
+
+def test_postgres_profile_tunes_pool():
+    """Test that the postgres profile sets explicit pool options."""
+    settings = Settings(db_pool_size=7, db_max_overflow=3)
+    options = engine_options("postgresql://u:p@localhost/db", "auto", settings)
+
+    assert options["pool_size"] == 7
+    assert options["max_overflow"] == 3
+    assert options["pool_pre_ping"] is True
+    assert options["pool_recycle"] == settings.db_pool_recycle_seconds
+    assert "connect_args" not in options
+
+
+def test_basic_profile_is_untuned():
+    """Test that the basic profile keeps the driver's default engine."""
+    options = engine_options("sqlite:///app.db", "basic", Settings())
+    assert options == {"echo": False, "connect_args": {"check_same_thread": False}}
+
+
+@pytest.mark.asyncio
+async def test_sqlite_wal_profile_applies_pragmas(tmp_path):
+    """Test that sqlite-wal connections run in WAL mode with the pragmas set."""
+    settings = Settings(sqlite_busy_timeout_ms=1234, sqlite_cache_size_kib=2048)
+    engine = make_engine(f"sqlite:///{tmp_path / 'wal.db'}", "auto", settings)
+    assert isinstance(engine.pool, AsyncAdaptedQueuePool)
+
+    async with engine.connect() as conn:
+        pragmas = {
+            name: (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size")
+        }
+    await engine.dispose()
+
+    assert pragmas == {
+        "journal_mode": "wal",
+        "synchronous": 1,  # NORMAL
+        "busy_timeout": 1234,
+        "cache_size": -2048,
+    }
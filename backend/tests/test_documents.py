@@ -0,0 +1,118 @@
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.settings import Settings
+from app.storage import BlobStore, BlobTooLarge
+
+TRANSCRIPT = b"Fall 2024: AP Calculus BC (A), AP Chemistry (A-)\n" * 2000
+
+
+def _upload(client, student_id, body, filename="transcript.txt"):
+    return client.post(
+        f"/students/{student_id}/documents",
+        params={"filename": filename},
+        content=body,
+        headers={"Content-Type": "text/plain"},
+    )
+
+
+def _blob_files(store):
+    return [p for p in store.root.rglob("*") if p.is_file()]
+
+
+def test_upload_document(client: TestClient, sample_student, isolated_blob_store):
+    """Test that an upload stores the bytes and records only metadata."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+
+    response = _upload(client, student_id, TRANSCRIPT)
+
+    assert response.status_code == 201
+    data = response.json()
+    assert data["filename"] == "transcript.txt"
+    assert data["content_type"] == "text/plain"
+    assert data["size_bytes"] == len(TRANSCRIPT)
+    assert data["sha256"] == hashlib.sha256(TRANSCRIPT).hexdigest()
+    assert data["deduplicated"] is False
+    path = isolated_blob_store.path_for(data["sha256"])
+    assert path.read_bytes() == TRANSCRIPT
+
+    content = client.get(f"/documents/{data['id']}/content")
+    assert content.status_code == 200
+    assert content.content == TRANSCRIPT
+
+
+def test_reuploads_are_deduplicated(
+    client: TestClient, sample_student, isolated_blob_store
+):
+    """Test that the same file uploaded five times costs one copy."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+
+    responses = [_upload(client, student_id, TRANSCRIPT) for _ in range(5)]
+
+    assert [r.status_code for r in responses] == [201, 200, 200, 200, 200]
+    assert {r.json()["id"] for r in responses} == {responses[0].json()["id"]}
+    assert all(r.json()["deduplicated"] for r in responses[1:])
+    documents = client.get(f"/students/{student_id}/documents").json()["documents"]
+    assert len(documents) == 1
+    assert len(_blob_files(isolated_blob_store)) == 1
+
+
+def test_same_file_for_two_students_shares_one_blob(
+    client: TestClient, isolated_blob_store
+):
+    """Test that each student gets a document row backed by one blob."""
+    a = client.post("/auth/login", json={"email": "a@example.com"}).json()["id"]
+    b = client.post("/auth/login", json={"email": "b@example.com"}).json()["id"]
+
+    doc_a = _upload(client, a, TRANSCRIPT).json()
+    doc_b = _upload(client, b, TRANSCRIPT, filename="mine.txt").json()
+
+    assert doc_a["id"] != doc_b["id"]
+    assert doc_b["deduplicated"] is False
+    assert len(_blob_files(isolated_blob_store)) == 1
+
+
+def test_upload_too_large(client: TestClient, sample_student, monkeypatch):
+    """Test that oversized uploads are rejected with 413."""
+    monkeypatch.setattr(main, "get_settings", lambda: Settings(document_max_bytes=1024))
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+
+    assert _upload(client, student_id, TRANSCRIPT).status_code == 413
+
+
+def test_upload_unknown_student(client: TestClient):
+    """Test that uploads for unknown students fail before storing anything."""
+    assert _upload(client, 99999, TRANSCRIPT).status_code == 404
+
+
+async def _chunks(data, size):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+@pytest.mark.asyncio
+async def test_blob_store_hashes_while_streaming(tmp_path):
+    """Test that chunked writes hash the whole stream and dedupe on disk."""
+    store = BlobStore(tmp_path)
+
+    first = await store.write_stream(_chunks(TRANSCRIPT, 4096))
+    second = await store.write_stream(_chunks(TRANSCRIPT, 1000))
+
+    assert first.sha256 == hashlib.sha256(TRANSCRIPT).hexdigest()
+    assert (first.created, second.created) == (True, False)
+    assert second.path == first.path
+    assert not any((tmp_path / "tmp").iterdir())
+
+
+@pytest.mark.asyncio
+async def test_blob_store_limit_discards_partial_file(tmp_path):
+    """Test that exceeding max_bytes mid-stream leaves nothing behind."""
+    store = BlobStore(tmp_path)
+
+    with pytest.raises(BlobTooLarge):
+        await store.write_stream(_chunks(TRANSCRIPT, 4096), max_bytes=10_000)
+
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
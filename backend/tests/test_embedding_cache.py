@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from app import retrieval
+from app.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.retrieval import HashingEmbeddings
+from app.settings import Settings
+
+
+class _CountingEmbeddings(HashingEmbeddings):
+    """Hashing embeddings that record every text sent to them."""
+
+    def __init__(self, dim=16):
+        super().__init__(dim)
+        self.model = "fake-model"
+        self.requests = []
+
+    async def embed(self, texts):
+        self.requests.append(list(texts))
+        return await super().embed(texts)
+
+
+def _vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_cache_round_trips_and_survives_reopen(tmp_path):
+    """Test lookups, miss reporting and reading back from a fresh instance."""
+    cache = EmbeddingCache(tmp_path, "m", 8, max_entries=100)
+    vectors = _vectors(3)
+    cache.put_many(["a", "b", "c"], vectors)
+
+    found, missing = cache.get_many(["b", "x", "a"])
+    assert missing == [1]
+    np.testing.assert_array_equal(found[0], vectors[1])
+    np.testing.assert_array_equal(found[2], vectors[0])
+
+    reopened = EmbeddingCache(tmp_path, "m", 8, max_entries=100)
+    found, missing = reopened.get_many(["c"])
+    assert missing == []
+    np.testing.assert_array_equal(found[0], vectors[2])
+    # Keys include the model, so another model never sees these vectors
+    other = EmbeddingCache(tmp_path, "other", 8, max_entries=100)
+    assert other.get_many(["a"])[1] == [0]
+
+
+def test_cache_stats_report_hit_rate_and_file_size(tmp_path):
+    """Test the counters exposed for monitoring."""
+    cache = EmbeddingCache(tmp_path, "m", 8, max_entries=100)
+    cache.put_many(["a", "b"], _vectors(2))
+    cache.put_many(["a"], _vectors(1, seed=1))  # already cached, not appended
+    cache.get_many(["a", "b", "c", "d"])
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 0.5
+    assert stats["entries"] == 2
+    assert stats["file_bytes"] == 2 * 8 * 4
+
+
+def test_eviction_drops_least_recently_used_and_compacts(tmp_path):
+    """Test that the cap evicts cold entries and compaction reclaims space."""
+    cache = EmbeddingCache(tmp_path, "m", 8, max_entries=10)
+    texts = [f"t{i}" for i in range(10)]
+    vectors = _vectors(10)
+    cache.put_many(texts, vectors)
+    cache.get_many(texts[:5])  # t0-t4 are now the most recently used
+
+    for i in range(4):
+        cache.put_many([f"new{i}"], _vectors(1, seed=100 + i))
+
+    stats = cache.stats()
+    assert stats["entries"] <= 10
+    assert stats["evictions"] > 0
+    found, missing = cache.get_many(texts[:5])
+    assert missing == []
+    np.testing.assert_array_equal(found, vectors[:5])
+    assert cache.get_many(["t5"])[1] == [0]
+
+    cache.compact()
+    stats = cache.stats()
+    assert stats["dead_rows"] == 0
+    assert stats["file_bytes"] == stats["entries"] * 8 * 4
+    np.testing.assert_array_equal(cache.get_many(texts[:5])[0], vectors[:5])
+
+
+def test_compaction_keeps_the_previous_generation(tmp_path):
+    """Test that a file another process may still read survives one compaction."""
+    cache = EmbeddingCache(tmp_path, "m", 8, max_entries=100)
+    vectors = _vectors(3)
+    cache.put_many(["a", "b", "c"], vectors)
+    other = EmbeddingCache(tmp_path, "m", 8, max_entries=100)
+    other.get_many(["a"])  # maps generation 0
+
+    cache.compact()
+    assert (tmp_path / "m-8.0.f32").exists()
+    np.testing.assert_array_equal(other.get_many(["b"])[0][0], vectors[1])
+
+    cache.compact()
+    assert not (tmp_path / "m-8.0.f32").exists()
+    assert (tmp_path / "m-8.1.f32").exists()
+    np.testing.assert_array_equal(other.get_many(["c"])[0][0], vectors[2])
+
+
+@pytest.mark.asyncio
+async def test_cached_embeddings_only_embed_misses(tmp_path):
+    """Test that the wrapped provider is called once per distinct new text."""
+    provider = _CountingEmbeddings()
+    cached = CachedEmbeddings(provider, EmbeddingCache(tmp_path, "fake", 16, 100))
+
+    first = await cached.embed(["a b", "c d", "a b"])
+    second = await cached.embed(["c d", "e f"])
+
+    assert provider.requests == [["a b", "c d"], ["e f"]]
+    np.testing.assert_array_equal(first[0], first[2])
+    np.testing.assert_array_equal(second[0], first[1])
+    np.testing.assert_allclose(second[1], (await provider.embed(["e f"]))[0])
+
+
+def test_openai_provider_is_cached_unless_disabled(tmp_path):
+    """Test that API embeddings are wrapped with the on-disk cache."""
+    settings = Settings(
+        embedding_provider="openai", embedding_cache_dir=str(tmp_path / "emb")
+    )
+    provider = retrieval.get_embedding_provider(settings)
+    assert isinstance(provider, CachedEmbeddings)
+    assert provider.dim == settings.embedding_dim
+
+    settings = Settings(embedding_provider="openai", embedding_cache_dir="")
+    assert isinstance(
+        retrieval.get_embedding_provider(settings), retrieval.OpenAIEmbeddings
+    )
@@ -1,8 +1,16 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import anyio
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
 
-def test_send_message(client: TestClient, sample_student, sample_message):
+def test_send_message(
+    client: TestClient, sample_student, sample_message, query_counter
+):
     """Test sending a message creates both user and assistant messages."""
     # Create a student
     student_response = client.post("/auth/login", json=sample_student)
@@ -14,7 +22,10 @@ def test_send_message(client: TestClient, sample_student, sample_message):
     conversation_id = conv_response.json()["id"]
     
     # Send a message
-    response = client.post(f"/conversations/{conversation_id}/messages", json=sample_message)
+    with query_counter.budget(5):
+        response = client.post(
+            f"/conversations/{conversation_id}/messages", json=sample_message
+        )
     assert response.status_code == 200
     
     data = response.json()
@@ -42,7 +53,9 @@ def test_get_messages_empty_conversation(client: TestClient, sample_student):
     assert data["messages"] == []
 
 
-def test_get_messages_with_data(client: TestClient, sample_student, sample_message):
+def test_get_messages_with_data(
+    client: TestClient, sample_student, sample_message, query_counter
+):
     """Test getting messages returns all messages in conversation."""
     # Create a student
     student_response = client.post("/auth/login", json=sample_student)
@@ -57,7 +70,8 @@ def test_get_messages_with_data(client: TestClient, sample_student, sample_messa
     client.post(f"/conversations/{conversation_id}/messages", json=sample_message)
     
     # Get messages
-    response = client.get(f"/conversations/{conversation_id}/messages")
+    with query_counter.budget(2):
+        response = client.get(f"/conversations/{conversation_id}/messages")
     assert response.status_code == 200
     
     data = response.json()
@@ -113,3 +127,391 @@ def test_message_persistence(client: TestClient, sample_student, sample_message)
     # Should be identical
     assert len(messages1) == len(messages2)
     assert messages1 == messages2
+
+
+def _parse_sse(body: str):
+    """Split a Server-Sent Events body into (event, data) pairs."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        event = "message"
+        data = ""
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = line[len("data: "):]
+        events.append((event, json.loads(data)))
+    return events
+
+
+def test_send_message_stream(
+    client: TestClient, sample_student, sample_message, query_counter
+):
+    """Test streaming a reply emits deltas followed by the persisted message."""
+    # Create a student
+    student_response = client.post("/auth/login", json=sample_student)
+    student_id = student_response.json()["id"]
+
+    # Create a conversation
+    conv_data = {"student_id": student_id, "title": "Test Conv"}
+    conv_response = client.post("/conversations", json=conv_data)
+    conversation_id = conv_response.json()["id"]
+
+    # Stream a message; the question and the reply are separate writes
+    with query_counter.budget(8):
+        response = client.post(
+            f"/conversations/{conversation_id}/messages/stream", json=sample_message
+        )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _parse_sse(response.text)
+    deltas = [data["delta"] for event, data in events if event == "message"]
+    assert len(deltas) > 0
+
+    event, done = events[-1]
+    assert event == "done"
+    assert done["role"] == "assistant"
+    assert done["conversation_id"] == conversation_id
+    assert done["content"] == "".join(deltas)
+
+    # Both messages are persisted once the stream closes
+    messages = client.get(f"/conversations/{conversation_id}/messages").json()[
+        "messages"
+    ]
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+    assert messages[1]["id"] == done["id"]
+    assert messages[1]["content"] == done["content"]
+
+
+def test_send_message_stream_stores_turn_in_its_own_session(
+    client: TestClient, sample_student, sample_message, monkeypatch
+):
+    """Test that the post-stream write does not reuse the request's session."""
+    from app import main
+    from app.db import get_db
+
+    request_sessions, store_sessions = [], []
+    request_db = main.app.dependency_overrides[get_db]
+
+    async def recording_get_db():
+        async for db in request_db():
+            request_sessions.append(db)
+            yield db
+
+    store_reply = main._store_reply
+
+    async def recording_store_reply(db, *args):
+        store_sessions.append(db)
+        return await store_reply(db, *args)
+
+    monkeypatch.setitem(main.app.dependency_overrides, get_db, recording_get_db)
+    monkeypatch.setattr(main, "_store_reply", recording_store_reply)
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conversation_id = client.post(
+        "/conversations", json={"student_id": student_id}
+    ).json()["id"]
+    request_sessions.clear()
+
+    response = client.post(
+        f"/conversations/{conversation_id}/messages/stream", json=sample_message
+    )
+
+    assert response.status_code == 200
+    assert len(request_sessions) == 1
+    assert len(store_sessions) == 1
+    assert store_sessions[0] is not request_sessions[0]
+    messages = client.get(f"/conversations/{conversation_id}/messages").json()
+    assert len(messages["messages"]) == 2
+
+
+class _BrokenStreamClient:
+    """Fake OpenAI client that streams one chunk, then fails or stalls."""
+
+    def __init__(self, stall=False):
+        self.stall = stall
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        return self._stream()
+
+    async def _stream(self):
+        yield SimpleNamespace(
+            usage=None,
+            choices=[SimpleNamespace(delta=SimpleNamespace(content="Partial"))],
+        )
+        if self.stall:
+            await asyncio.Event().wait()
+        raise RuntimeError("connection dropped")
+
+
+def _roles_and_flags(client: TestClient, conversation_id: int):
+    messages = client.get(f"/conversations/{conversation_id}/messages").json()
+    return [
+        (m["role"], m["content"], m["truncated"]) for m in messages["messages"]
+    ]
+
+
+def test_send_message_stream_marks_interrupted_reply_truncated(
+    client: TestClient, sample_student, monkeypatch
+):
+    """Test that a model error mid-stream stores the partial reply as truncated."""
+    from app import ai
+
+    monkeypatch.setattr(ai, "get_openai_client", lambda: _BrokenStreamClient())
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conversation_id = client.post(
+        "/conversations", json={"student_id": student_id}
+    ).json()["id"]
+
+    response = client.post(
+        f"/conversations/{conversation_id}/messages/stream",
+        json={"content": "Q?", "bypass_cache": True},
+    )
+
+    event, done = _parse_sse(response.text)[-1]
+    assert event == "done"
+    assert done["truncated"] is True
+    assert _roles_and_flags(client, conversation_id) == [
+        ("user", "Q?", False),
+        ("assistant", "Partial", True),
+    ]
+
+
+def test_send_message_stream_disconnect_keeps_question_and_partial_reply(
+    client: TestClient, sample_student, test_db, monkeypatch
+):
+    """Test that cancelling the stream mid-answer still saves the turn."""
+    from app import ai, main
+    from app.schemas import MessageCreate
+
+    monkeypatch.setattr(
+        ai, "get_openai_client", lambda: _BrokenStreamClient(stall=True)
+    )
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conversation_id = client.post(
+        "/conversations", json={"student_id": student_id}
+    ).json()["id"]
+
+    async def disconnect_mid_answer():
+        async with async_sessionmaker(bind=test_db, expire_on_commit=False)() as db:
+            response = await main.send_message_stream(
+                conversation_id, MessageCreate(content="Q?", bypass_cache=True), db
+            )
+        chunks = []
+
+        async def consume():
+            async for chunk in response.body_iterator:
+                chunks.append(chunk)
+
+        # What Starlette does when the client goes away
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(consume)
+            while not chunks:
+                await asyncio.sleep(0.01)
+            tg.cancel_scope.cancel()
+
+    asyncio.run(disconnect_mid_answer())
+
+    assert _roles_and_flags(client, conversation_id) == [
+        ("user", "Q?", False),
+        ("assistant", "Partial", True),
+    ]
+
+
+def test_send_message_stream_nonexistent_conversation(
+    client: TestClient, sample_message
+):
+    """Test streaming to a non-existent conversation fails before streaming."""
+    response = client.post("/conversations/99999/messages/stream", json=sample_message)
+    assert response.status_code == 404
+    assert "Conversation not found" in response.json()["detail"]
+
+
+def _conversation_with_messages(client: TestClient, sample_student, turns: int) -> int:
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conversation_id = client.post(
+        "/conversations", json={"student_id": student_id}
+    ).json()["id"]
+    for i in range(turns):
+        client.post(
+            f"/conversations/{conversation_id}/messages", json={"content": f"Q{i}"}
+        )
+    return conversation_id
+
+
+def test_get_messages_pages_backwards(client: TestClient, sample_student):
+    """Test that before_id pages from the newest messages back to the oldest."""
+    conversation_id = _conversation_with_messages(client, sample_student, turns=5)
+    all_ids = [
+        m["id"]
+        for m in client.get(f"/conversations/{conversation_id}/messages").json()[
+            "messages"
+        ]
+    ]
+    assert len(all_ids) == 10
+
+    url = f"/conversations/{conversation_id}/messages"
+    page1 = client.get(url, params={"limit": 4}).json()
+    assert [m["id"] for m in page1["messages"]] == all_ids[-4:]
+    assert page1["next_cursor"] == all_ids[-4]
+
+    page2 = client.get(
+        url, params={"limit": 4, "before_id": page1["next_cursor"]}
+    ).json()
+    assert [m["id"] for m in page2["messages"]] == all_ids[-8:-4]
+
+    page3 = client.get(
+        url, params={"limit": 4, "before_id": page2["next_cursor"]}
+    ).json()
+    assert [m["id"] for m in page3["messages"]] == all_ids[:2]
+    assert page3["next_cursor"] is None
+
+
+def test_get_messages_pages_forwards(client: TestClient, sample_student):
+    """Test that after_id returns newer messages oldest first."""
+    conversation_id = _conversation_with_messages(client, sample_student, turns=3)
+    url = f"/conversations/{conversation_id}/messages"
+    all_ids = [m["id"] for m in client.get(url).json()["messages"]]
+
+    page = client.get(url, params={"after_id": all_ids[0], "limit": 3}).json()
+    assert [m["id"] for m in page["messages"]] == all_ids[1:4]
+    assert page["next_cursor"] == all_ids[3]
+
+    rest = client.get(url, params={"after_id": page["next_cursor"]}).json()
+    assert [m["id"] for m in rest["messages"]] == all_ids[4:]
+    assert rest["next_cursor"] is None
+
+
+def test_get_messages_rejects_both_cursors(client: TestClient, sample_student):
+    """Test that before_id and after_id cannot be combined."""
+    conversation_id = _conversation_with_messages(client, sample_student, turns=1)
+    response = client.get(
+        f"/conversations/{conversation_id}/messages",
+        params={"before_id": 5, "after_id": 1},
+    )
+    assert response.status_code == 400
+
+
+def test_send_message_uses_one_write_transaction(
+    client: TestClient, sample_student, sample_message, test_db, monkeypatch
+):
+    """Test that a turn is two reads plus a single write transaction."""
+    from sqlalchemy import event
+    from app import main
+
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conversation_id = client.post(
+        "/conversations", json={"student_id": student_id}
+    ).json()["id"]
+
+    calls = []
+
+    async def fake_reply(history, summary, use_cache=True, references=None):
+        calls.append("llm")
+        return "Reply"
+
+    monkeypatch.setattr(main, "generate_assistant_reply", fake_reply)
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        calls.append(statement.split()[0].upper())
+
+    def on_commit(conn):
+        calls.append("COMMIT")
+
+    event.listen(test_db.sync_engine, "before_cursor_execute", on_execute)
+    event.listen(test_db.sync_engine, "commit", on_commit)
+    try:
+        response = client.post(
+            f"/conversations/{conversation_id}/messages", json=sample_message
+        )
+    finally:
+        event.remove(test_db.sync_engine, "before_cursor_execute", on_execute)
+        event.remove(test_db.sync_engine, "commit", on_commit)
+
+    assert response.status_code == 200
+    # Nothing is written before the model call, one read transaction ends
+    # before retrieval and the model call, then one commit for the turn
+    assert calls == [
+        "SELECT", "SELECT", "COMMIT",
+        "llm", "INSERT", "UPDATE", "INSERT", "COMMIT",
+    ]
+
+    messages = client.get(f"/conversations/{conversation_id}/messages").json()[
+        "messages"
+    ]
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+    assert messages[0]["content"] == sample_message["content"]
+    assert messages[1]["id"] == response.json()["id"]
+
+
+def test_query_counts_do_not_grow_with_history(
+    client: TestClient, sample_student, query_counter
+):
+    """Test that reads and turns cost the same number of queries at any size."""
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conversation_id = client.post(
+        "/conversations", json={"student_id": student_id}
+    ).json()["id"]
+
+    def cost(method, url, **kwargs):
+        query_counter.reset()
+        assert getattr(client, method)(url, **kwargs).status_code == 200
+        return query_counter.count
+
+    turn_url = f"/conversations/{conversation_id}/messages"
+    first_turn = cost("post", turn_url, json={"content": "first"})
+    first_read = cost("get", turn_url)
+    for i in range(10):
+        client.post(turn_url, json={"content": f"message {i}"})
+
+    assert cost("post", turn_url, json={"content": "last"}) == first_turn
+    assert cost("get", turn_url) == first_read
+    assert cost("get", f"/conversations/{student_id}") == 2
+
+
+def test_get_messages_since_returns_only_newer_rows(
+    client: TestClient, sample_student, test_db
+):
+    """Test delta sync from a known id through an index range scan."""
+    from sqlalchemy import event
+
+    conversation_id = _conversation_with_messages(client, sample_student, turns=3)
+    url = f"/conversations/{conversation_id}/messages"
+    all_ids = [m["id"] for m in client.get(url).json()["messages"]]
+
+    issued = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        issued.append((statement, parameters))
+
+    event.listen(test_db.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        delta = client.get(url, params={"since_id": all_ids[3]}).json()
+    finally:
+        event.remove(test_db.sync_engine, "before_cursor_execute", on_execute)
+    assert [m["id"] for m in delta["messages"]] == all_ids[4:]
+    assert delta["next_cursor"] is None
+    assert client.get(url, params={"since_id": all_ids[-1]}).json()["messages"] == []
+
+    # Replay the endpoint's own statement and parameters under EXPLAIN
+    statement, parameters = next(
+        (sql, params) for sql, params in issued if "messages.id >" in sql
+    )
+
+    async def plan():
+        async with test_db.connect() as conn:
+            rows = await conn.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            )
+            return " ".join(str(row[-1]) for row in rows)
+
+    plan_text = asyncio.run(plan())
+    # An index keyed on conversation_id then id, with no sort step; SQLite
+    # reports the id bound as id or rowid depending on the index it picks
+    assert "INDEX ix_messages_conversation_id" in plan_text
+    assert "id>?" in plan_text
+    assert "TEMP B-TREE" not in plan_text
+
+    assert client.get(url, params={"since_id": 1, "before_id": 5}).status_code == 400
+    assert client.get(url, params={"since_id": 1, "after_id": 5}).status_code == 400
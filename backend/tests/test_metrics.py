@@ -0,0 +1,142 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import ai, models
+from app.metrics import (
+    HTTP_REQUEST_DB_QUERIES,
+    HTTP_REQUEST_DURATION,
+    LLM_REQUEST_DURATION,
+    LLM_TOKENS,
+    REGISTRY,
+    SUMMARY_DURATION,
+    Counter,
+    Histogram,
+    instrument_engine,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    REGISTRY.clear()
+    yield
+    REGISTRY.clear()
+
+
+class _UsageClient:
+    """Fake OpenAI client whose completions report token usage."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        if self.fail:
+            raise RuntimeError("upstream error")
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Reply"))],
+            usage=SimpleNamespace(
+                prompt_tokens=30, completion_tokens=12, total_tokens=42
+            ),
+        )
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Test the Prometheus exposition of a labelled histogram."""
+    histogram = Histogram("demo_seconds", "Demo.", ["route"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5.0, "/a")
+
+    assert histogram.render() == [
+        "# HELP demo_seconds Demo.",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{route="/a",le="0.1"} 1',
+        'demo_seconds_bucket{route="/a",le="1.0"} 2',
+        'demo_seconds_bucket{route="/a",le="+Inf"} 3',
+        'demo_seconds_sum{route="/a"} 5.55',
+        'demo_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_counter_escapes_label_values():
+    """Test that quotes in label values are escaped."""
+    counter = Counter("demo_total", "Demo.", ["name"])
+    counter.inc('say "hi"', amount=2)
+    assert counter.render()[-1] == 'demo_total{name="say \\"hi\\""} 2'
+
+
+def test_requests_are_recorded_by_route_template(
+    client: TestClient, sample_student, test_db
+):
+    """Test per-route latency and DB query counts for a chat turn."""
+    instrument_engine(test_db)
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conv = client.post("/conversations", json={"student_id": student_id}).json()
+    client.post(f"/conversations/{conv['id']}/messages", json={"content": "Hi"})
+    client.post(f"/conversations/{conv['id']}/messages", json={"content": "Again"})
+
+    route = "/conversations/{conversation_id}/messages"
+    assert HTTP_REQUEST_DURATION.count("POST", route, "200") == 2
+    assert HTTP_REQUEST_DB_QUERIES.count("POST", route) == 2
+    assert HTTP_REQUEST_DB_QUERIES.sum("POST", route) == 10
+
+    client.get("/no/such/path")
+    assert HTTP_REQUEST_DURATION.count("GET", "<unmatched>", "404") == 1
+
+
+def test_metrics_endpoint_serves_prometheus_text(client: TestClient):
+    """Test that /metrics exposes request histograms and cache counters."""
+    client.get("/")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/",status="200"} 1'
+        in body
+    )
+    assert "response_cache_hits_total 0" in body
+
+
+@pytest.mark.asyncio
+async def test_llm_calls_record_timing_and_tokens(monkeypatch):
+    """Test that replies record their duration, outcome and token usage."""
+    monkeypatch.setattr(ai, "get_openai_client", lambda: _UsageClient())
+    await ai.generate_assistant_reply(
+        [{"role": "user", "content": "hi"}], None, use_cache=False
+    )
+    monkeypatch.setattr(ai, "get_openai_client", lambda: _UsageClient(fail=True))
+    await ai.generate_assistant_reply(
+        [{"role": "user", "content": "hi"}], None, use_cache=False
+    )
+
+    assert LLM_REQUEST_DURATION.count("reply", "ok") == 1
+    assert LLM_REQUEST_DURATION.count("reply", "error") == 1
+    assert LLM_TOKENS.value("reply", "prompt") == 30
+    assert LLM_TOKENS.value("reply", "completion") == 12
+    assert LLM_TOKENS.value("reply", "total") == 42
+
+
+@pytest.mark.asyncio
+async def test_summary_calls_are_labelled(test_db, monkeypatch):
+    """Test that model calls made by summaries use the summary label."""
+    monkeypatch.setattr(ai, "get_openai_client", lambda: _UsageClient())
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+    async with Session() as session:
+        session.add(models.Student(id=1, email="m@example.com", name="M"))
+        session.add(models.Conversation(id=1, student_id=1, title="T"))
+        await session.flush()
+        session.add(models.Message(conversation_id=1, role="user", content="GPA 3.9"))
+        await session.commit()
+
+        assert await ai.summarize_student_context(session, 1) == "Reply"
+
+    assert SUMMARY_DURATION.count("ok") == 1
+    assert LLM_REQUEST_DURATION.count("summary", "ok") == 1
+    assert LLM_REQUEST_DURATION.count("reply", "ok") == 0
+    assert LLM_TOKENS.value("summary", "total") == 42
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, models, retrieval
+from app.metrics import RETRIEVAL_FAILURES
+from app.retrieval import (
+    Chunk,
+    HashingEmbeddings,
+    StudentIndex,
+    chunk_text,
+    normalize_rows,
+)
+from app.settings import Settings
+
+
+def test_chunk_text_respects_size_and_overlaps():
+    """Test that long text is split into bounded, overlapping chunks."""
+    text = "\n\n".join(f"Paragraph {i}. " + "word " * 60 for i in range(20))
+
+    chunks = chunk_text(text, max_chars=500, overlap=100)
+
+    assert len(chunks) > 1
+    assert all(len(c) <= 500 for c in chunks)
+    assert chunks[0].startswith("Paragraph 0.")
+    assert "Paragraph 19." in chunks[-1]
+    assert chunk_text("   ") == []
+    assert chunk_text("short") == ["short"]
+
+
+def _random_index(n, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = normalize_rows(rng.standard_normal((n, dim)).astype(np.float32))
+    index = StudentIndex(dim, capacity=4)
+    chunks = [Chunk("message", i, f"c{i % 3}", f"text {i}") for i in range(n)]
+    index.add(vectors[: n // 2], chunks[: n // 2], [i % 3 for i in range(n // 2)])
+    index.add(vectors[n // 2 :], chunks[n // 2 :], [i % 3 for i in range(n // 2, n)])
+    return index, vectors
+
+
+def test_index_top_k_matches_brute_force():
+    """Test that the vectorized top-k equals a full sort of cosine scores."""
+    index, vectors = _random_index(500)
+    query = normalize_rows(np.ones((1, 32), dtype=np.float32))[0]
+
+    hits = index.search(query, k=5, min_score=-1.0)
+
+    expected = np.argsort(-(vectors @ query))[:5]
+    assert [h.chunk.source_id for h in hits] == list(expected)
+    assert hits[0].score >= hits[-1].score
+    assert len(index) == 500
+
+
+def test_index_excludes_conversation():
+    """Test that chunks from the excluded conversation are never returned."""
+    index, _ = _random_index(90)
+    query = normalize_rows(np.ones((1, 32), dtype=np.float32))[0]
+
+    hits = index.search(query, k=90, min_score=-1.0, exclude_conversation_id=1)
+
+    assert len(hits) == 60
+    assert all(h.chunk.source_id % 3 != 1 for h in hits)
+
+
+@pytest.mark.asyncio
+async def test_hashing_embeddings_are_deterministic():
+    """Test that the local provider is stable and ranks shared words higher."""
+    provider = HashingEmbeddings(dim=128)
+    a, b, c = await provider.embed(
+        ["Stanford essay deadline", "stanford ESSAY deadline", "chemistry lab"]
+    )
+    again = (await provider.embed(["Stanford essay deadline"]))[0]
+
+    assert np.allclose(a, again)
+    assert float(a @ b) == pytest.approx(1.0)
+    assert float(a @ c) < 0.5
+    assert a.dtype == np.float32
+
+
+def test_send_message_injects_relevant_chunks(
+    client: TestClient, sample_student, monkeypatch
+):
+    """Test that turns get excerpts from documents and other conversations."""
+    monkeypatch.setattr(
+        retrieval,
+        "get_settings",
+        lambda: Settings(
+            embedding_provider="hash", embedding_dim=512, retrieval_min_score=0.1
+        ),
+    )
+    seen = []
+
+    async def fake_reply(history, summary, use_cache=True, references=None):
+        seen.append(references)
+        return "Noted."
+
+    monkeypatch.setattr(main, "generate_assistant_reply", fake_reply)
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    client.post(
+        f"/students/{student_id}/documents",
+        params={"filename": "essay.txt"},
+        content=b"My Stanford supplemental essay is about robotics club.",
+        headers={"Content-Type": "text/plain"},
+    )
+    earlier = client.post("/conversations", json={"student_id": student_id}).json()
+    client.post(
+        f"/conversations/{earlier['id']}/messages",
+        json={"content": "Stanford early action deadline is November 1"},
+    )
+    client.post(
+        f"/conversations/{earlier['id']}/messages",
+        json={"content": "I also like chemistry"},
+    )
+    current = client.post("/conversations", json={"student_id": student_id}).json()
+
+    # Turns never build the index inline: a cold index yields no references
+    client.post(
+        f"/conversations/{current['id']}/messages", json={"content": "Stanford?"}
+    )
+    assert seen[-1] == []
+
+    # The background refresh, run here directly
+    asyncio.run(retrieval.retrieval_index.refresh(student_id))
+    client.post(
+        f"/conversations/{current['id']}/messages",
+        json={"content": "When is the Stanford deadline for my essay?"},
+    )
+
+    references = seen[-1]
+    assert references
+    assert any(r.startswith("[essay.txt]") for r in references)
+    assert any(
+        r
+        == f"[conversation {earlier['id']}] Stanford early action deadline is November 1"
+        for r in references
+    )
+    assert not any("When is the Stanford deadline" in r for r in references)
+
+
+def test_retrieval_disabled_without_provider(
+    client: TestClient, sample_student, monkeypatch
+):
+    """Test that without a provider no references are sent."""
+    seen = []
+
+    async def fake_reply(history, summary, use_cache=True, references=None):
+        seen.append(references)
+        return "ok"
+
+    monkeypatch.setattr(main, "generate_assistant_reply", fake_reply)
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conv = client.post("/conversations", json={"student_id": student_id}).json()
+    client.post(f"/conversations/{conv['id']}/messages", json={"content": "Hi"})
+
+    assert seen == [[]]
+
+
+def test_retrieval_failures_are_logged_and_counted(
+    client: TestClient, sample_student, monkeypatch, caplog
+):
+    """Test that a broken provider degrades to no references, visibly."""
+    monkeypatch.setattr(
+        retrieval, "get_settings", lambda: Settings(embedding_provider="hash")
+    )
+    student_id = client.post("/auth/login", json=sample_student).json()["id"]
+    conv = client.post("/conversations", json={"student_id": student_id}).json()
+    client.post(f"/conversations/{conv['id']}/messages", json={"content": "Hi"})
+    asyncio.run(retrieval.retrieval_index.refresh(student_id))
+
+    async def broken(texts):
+        raise RuntimeError("embeddings endpoint unavailable")
+
+    monkeypatch.setattr(retrieval.retrieval_index.provider(), "embed", broken)
+    before = RETRIEVAL_FAILURES.value("query")
+
+    with caplog.at_level(logging.ERROR, logger="app.retrieval"):
+        references = asyncio.run(
+            retrieval.retrieve_references(
+                models.Conversation(id=999, student_id=student_id), "Hi"
+            )
+        )
+
+    assert references == []
+    assert RETRIEVAL_FAILURES.value("query") == before + 1
+    assert "Retrieval failed for conversation 999" in caplog.text
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import models
+from app.metrics import SUGGESTION_FAILURES
+from app.rules import (
+    Draft,
+    RuleEngine,
+    StudentFacts,
+    deadline_soon,
+    essay_feedback,
+    plan_deadlines,
+    rule,
+    rule_engine,
+)
+from app.suggestions import SuggestionTriggers
+
+NOW = datetime(2026, 10, 1, 12, 0)
+
+
+def test_engine_indexes_rules_by_fact():
+    """Test that a changed fact maps to exactly the rules that read it."""
+    assert rule_engine.rules_for(["document_count"]) == [essay_feedback]
+    assert rule_engine.rules_for(["deadlines"]) == [deadline_soon, plan_deadlines]
+    assert rule_engine.rules_for(["message_count", "essay_mentions"]) == [
+        essay_feedback,
+        plan_deadlines,
+    ]
+    assert rule_engine.rules_for(["unrelated"]) == []
+    assert RuleEngine.facts_for([essay_feedback]) == {
+        "essay_mentions",
+        "document_count",
+    }
+
+
+def test_rules_must_declare_known_facts():
+    """Test that a typo in a dependency fails at definition time."""
+    with pytest.raises(ValueError):
+
+        @rule("gpa_typo")
+        def broken(facts, horizon_days):
+            return None
+
+
+def test_evaluate_only_considers_given_rules():
+    """Test that evaluation is limited to the affected rules."""
+    facts = StudentFacts(
+        1, NOW, message_count=10, deadlines=[("MIT EA", NOW + timedelta(days=3))]
+    )
+
+    assert rule_engine.evaluate(facts, 14).kind == "deadline_soon"
+    assert rule_engine.evaluate(facts, 14, [essay_feedback, plan_deadlines]) is None
+
+
+def test_plan_deadlines_fires_once_until_dismissed():
+    """Test that an open suggestion to add deadlines is not made again."""
+    facts = StudentFacts(1, NOW, message_count=10)
+    assert plan_deadlines.evaluate(facts, 14).kind == "plan_deadlines"
+
+    facts.open_suggestions = {"plan_deadlines"}
+    assert plan_deadlines.evaluate(facts, 14) is None
+
+
+def _seed(test_db):
+    async def seed():
+        async with async_sessionmaker(bind=test_db)() as db:
+            db.add(models.Student(id=1, email="s@example.com", name="S"))
+            db.add(models.Conversation(id=1, student_id=1, title="T"))
+            await db.flush()
+            db.add(
+                models.Message(
+                    conversation_id=1, role="user", content="Help with my essay"
+                )
+            )
+            await db.commit()
+
+    asyncio.run(seed())
+
+
+def test_triggers_load_only_the_facts_affected_rules_need(test_db, query_counter):
+    """Test the per-update cost: one query per needed fact, then none."""
+    _seed(test_db)
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+    triggers = SuggestionTriggers(session_factory=Session)
+
+    async def run():
+        async with Session() as db:
+            query_counter.reset()
+            first = await triggers.process(db, 1, ["essay_mentions"], now=NOW)
+            issued = list(query_counter.statements)
+            query_counter.reset()
+            second = await triggers.process(db, 1, ["essay_mentions"], now=NOW)
+            kinds = (await db.execute(select(models.Suggestion.kind))).scalars().all()
+            return first, issued, second, kinds
+
+    first, issued, second, kinds = asyncio.run(run())
+    assert first == Draft("essay_feedback", first.message)
+    # essay_mentions + document_count, then the insert; deadlines are not read
+    selects = [sql for sql in issued if sql.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 2
+    assert not any("deadlines" in sql for sql in issued)
+    assert second is None
+    assert kinds == ["essay_feedback"]
+
+
+def test_triggers_ignore_facts_without_rules(test_db, query_counter):
+    """Test that an update no rule reads costs nothing."""
+    _seed(test_db)
+    triggers = SuggestionTriggers(
+        session_factory=async_sessionmaker(bind=test_db, expire_on_commit=False)
+    )
+
+    async def run():
+        async with async_sessionmaker(bind=test_db)() as db:
+            query_counter.reset()
+            return await triggers.process(db, 1, ["unrelated"], now=NOW)
+
+    assert asyncio.run(run()) is None
+    assert query_counter.count == 0
+
+
+def test_triggers_run_in_the_background_after_a_write(test_db):
+    """Test that notify coalesces changes and stores a suggestion."""
+    _seed(test_db)
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+    triggers = SuggestionTriggers(session_factory=Session, debounce_seconds=0.01)
+
+    async def run():
+        triggers.notify(1, "message_count")
+        triggers.notify(1, "essay_mentions")
+        await triggers.join()
+        async with Session() as db:
+            return (await db.execute(select(models.Suggestion.kind))).scalars().all()
+
+    assert asyncio.run(run()) == ["essay_feedback"]
+    assert triggers.last_error is None
+
+
+def test_failed_trigger_run_is_logged_and_counted(caplog):
+    """Test that a failing trigger run is logged and counted, not swallowed."""
+
+    @asynccontextmanager
+    async def broken_session():
+        raise RuntimeError("database is locked")
+        yield
+
+    triggers = SuggestionTriggers(session_factory=broken_session, debounce_seconds=0)
+    before = SUGGESTION_FAILURES.value()
+
+    async def run():
+        triggers.notify(1, "message_count")
+        await triggers.join()
+
+    with caplog.at_level(logging.ERROR, logger="app.suggestions"):
+        asyncio.run(run())
+
+    assert triggers.last_error == "database is locked"
+    assert SUGGESTION_FAILURES.value() == before + 1
+    assert "Suggestion trigger failed for student 1" in caplog.text
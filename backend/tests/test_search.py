@@ -0,0 +1,172 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import models
+from app.search import contains_term, install_message_search, search_messages
+
+
+def _seed(test_db):
+    """Two students; student 1 has two conversations, student 2 has one."""
+
+    async def seed():
+        Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+        async with Session() as db:
+            db.add_all(
+                [
+                    models.Student(id=1, email="a@example.com", name="A"),
+                    models.Student(id=2, email="b@example.com", name="B"),
+                    models.Conversation(id=1, student_id=1, title="Essays"),
+                    models.Conversation(id=2, student_id=1, title="Schools"),
+                    models.Conversation(id=3, student_id=2, title="Other"),
+                ]
+            )
+            await db.flush()
+            db.add_all(
+                [
+                    models.Message(
+                        id=1,
+                        conversation_id=1,
+                        role="user",
+                        content="Should my essay mention robotics?",
+                    ),
+                    models.Message(
+                        id=2,
+                        conversation_id=2,
+                        role="assistant",
+                        content="Stanford values intellectual vitality. Stanford's "
+                        "essays are short, so every Stanford answer should count.",
+                    ),
+                    models.Message(
+                        id=3,
+                        conversation_id=2,
+                        role="user",
+                        content="Is Stanford a reach for me?",
+                    ),
+                    models.Message(
+                        id=4,
+                        conversation_id=3,
+                        role="user",
+                        content="Tell me about Stanford deadlines",
+                    ),
+                ]
+            )
+            await db.commit()
+
+    asyncio.run(seed())
+
+
+def test_search_ranks_matches_within_student(client: TestClient, test_db):
+    """Test ranked, highlighted results from every conversation of one student."""
+    _seed(test_db)
+
+    response = client.get("/students/1/search", params={"q": "stanford"})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    # Student 2's message is never returned; the denser match ranks first
+    assert [r["message_id"] for r in results] == [2, 3]
+    assert results[0]["conversation_id"] == 2
+    assert results[0]["conversation_title"] == "Schools"
+    assert "**Stanford**" in results[0]["snippet"]
+    assert results[0]["score"] >= results[1]["score"]
+
+
+def test_search_requires_every_term_and_stems(client: TestClient, test_db):
+    """Test AND semantics and that word forms match their stem."""
+    _seed(test_db)
+
+    essays = client.get("/students/1/search", params={"q": "essays"}).json()
+    both = client.get("/students/1/search", params={"q": "stanford essays"}).json()
+
+    assert {r["message_id"] for r in essays["results"]} == {1, 2}
+    assert [r["message_id"] for r in both["results"]] == [2]
+
+
+def test_search_treats_operators_as_text(client: TestClient, test_db, query_counter):
+    """Test that FTS syntax in user input neither errors nor costs a query."""
+    _seed(test_db)
+
+    response = client.get("/students/1/search", params={"q": 'reach" OR (NEAR'})
+    assert response.status_code == 200
+    assert response.json()["results"] == []
+
+    with query_counter.budget(0):
+        response = client.get("/students/1/search", params={"q": "?!"})
+    assert response.json()["results"] == []
+
+    with query_counter.budget(1):
+        client.get("/students/1/search", params={"q": "stanford"})
+
+
+def test_index_follows_updates_and_deletes(test_db):
+    """Test that the triggers keep the index in sync with the messages table."""
+    _seed(test_db)
+
+    async def run():
+        Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+        async with Session() as db:
+            await db.execute(
+                update(models.Message)
+                .where(models.Message.id == 1)
+                .values(content="Should I write about debate?")
+            )
+            await db.execute(delete(models.Message).where(models.Message.id == 3))
+            await db.commit()
+            robotics = await search_messages(db, 1, "robotics")
+            debate = await search_messages(db, 1, "debate")
+            reach = await search_messages(db, 1, "reach")
+        return robotics, debate, reach
+
+    robotics, debate, reach = asyncio.run(run())
+    assert robotics == [] and reach == []
+    assert [m.message_id for m in debate] == [1]
+
+
+def test_install_indexes_existing_messages(test_db):
+    """Test that a database created before search is backfilled at startup."""
+    _seed(test_db)
+
+    async def run():
+        async with test_db.begin() as conn:
+            await conn.exec_driver_sql("DROP TABLE messages_fts")
+            created = await conn.run_sync(install_message_search)
+            again = await conn.run_sync(install_message_search)
+        Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+        async with Session() as db:
+            return created, again, await search_messages(db, 1, "robotics")
+
+    created, again, hits = asyncio.run(run())
+    assert (created, again) == (True, False)
+    assert [m.message_id for m in hits] == [1]
+
+
+def test_like_fallback_treats_wildcards_as_text(test_db):
+    """Test that `_` and `%` in a term match only themselves."""
+    _seed(test_db)
+
+    async def run():
+        Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+        async with Session() as db:
+            db.add_all(
+                [
+                    models.Message(id=5, conversation_id=1, role="user", content="a_b"),
+                    models.Message(id=6, conversation_id=1, role="user", content="axb"),
+                    models.Message(id=7, conversation_id=1, role="user", content="5%"),
+                ]
+            )
+            await db.commit()
+
+            async def ids(term):
+                stmt = select(models.Message.id).where(
+                    contains_term(models.Message.content, term)
+                )
+                return (await db.execute(stmt)).scalars().all()
+
+            return await ids("a_b"), await ids("%")
+
+    underscore, percent = asyncio.run(run())
+    assert underscore == [5]
+    assert percent == [7]
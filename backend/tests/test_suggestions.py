@@ -0,0 +1,180 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import models
+from app.rules import Draft, StudentFacts, evaluate_batch
+from app.suggestions import PHASES, SuggestionJob, insert_suggestions
+
+NOW = datetime(2026, 10, 1, 3, 0)
+
+
+def _session_factory(test_db):
+    return async_sessionmaker(bind=test_db, expire_on_commit=False)
+
+
+def _seed(test_db):
+    """Student 1 chats a lot, 2 mentions essays, 3 has a deadline soon."""
+
+    async def seed():
+        async with _session_factory(test_db)() as db:
+            for sid in (1, 2, 3, 4):
+                db.add(models.Student(id=sid, email=f"s{sid}@example.com", name="S"))
+                db.add(models.Conversation(id=sid, student_id=sid, title="T"))
+            await db.flush()
+            for i in range(6):
+                db.add(models.Message(conversation_id=1, role="user", content=f"Q{i}"))
+            db.add(
+                models.Message(
+                    conversation_id=2, role="user", content="Can we work on my Essay?"
+                )
+            )
+            db.add(models.StudentContext(student_id=1, message_count=6))
+            db.add(
+                models.Deadline(
+                    student_id=3, title="MIT Early Action", due_at=NOW + timedelta(5)
+                )
+            )
+            # Student 4 is idle with a deadline still outside the horizon
+            db.add(
+                models.Deadline(
+                    student_id=4, title="UCLA", due_at=NOW + timedelta(days=20)
+                )
+            )
+            await db.commit()
+
+    asyncio.run(seed())
+
+
+def _suggestions(test_db):
+    async def load():
+        async with _session_factory(test_db)() as db:
+            rows = await db.execute(
+                select(models.Suggestion.student_id, models.Suggestion.kind).order_by(
+                    models.Suggestion.id
+                )
+            )
+            return rows.all()
+
+    return asyncio.run(load())
+
+
+def test_rules_pick_one_suggestion_by_priority():
+    """Test that the highest-priority rule that fires wins."""
+    deadline = ("Stanford REA", NOW + timedelta(days=1, hours=2))
+    facts = [
+        StudentFacts(1, NOW, message_count=10, essay_mentions=2, deadlines=[deadline]),
+        StudentFacts(2, NOW, essay_mentions=1, document_count=1),
+        StudentFacts(3, NOW, message_count=10),
+    ]
+
+    results = evaluate_batch(facts, horizon_days=14)
+
+    assert [(sid, d.kind) for sid, d in results] == [
+        (1, "deadline_soon"),
+        (3, "plan_deadlines"),
+    ]
+    assert results[0][1].message.startswith("Stanford REA is due in 2 days")
+
+
+def test_first_run_evaluates_active_students(test_db):
+    """Test the first run's candidates, results and phase timings."""
+    _seed(test_db)
+    job = SuggestionJob(_session_factory(test_db), batch_size=2)
+
+    report = asyncio.run(job.run(now=NOW))
+
+    assert report.candidates == 3
+    assert report.batches == 2
+    assert report.created == 3
+    assert set(report.timings) == set(PHASES) | {"total"}
+    assert _suggestions(test_db) == [
+        (1, "plan_deadlines"),
+        (2, "essay_feedback"),
+        (3, "deadline_soon"),
+    ]
+
+
+def test_later_runs_only_process_changes(test_db):
+    """Test that watermarks skip idle students and one per day is enforced."""
+    _seed(test_db)
+    job = SuggestionJob(_session_factory(test_db))
+    asyncio.run(job.run(now=NOW))
+
+    # Nothing changed since the last run
+    assert asyncio.run(job.run(now=NOW + timedelta(hours=1))).candidates == 0
+
+    async def chat():
+        async with _session_factory(test_db)() as db:
+            db.add(models.Message(conversation_id=2, role="user", content="Hi"))
+            await db.commit()
+
+    asyncio.run(chat())
+    # Same day: student 2 already has today's suggestion
+    assert asyncio.run(job.run(now=NOW + timedelta(hours=2))).candidates == 0
+
+    # A week later student 4's deadline has come within the horizon
+    report = asyncio.run(job.run(now=NOW + timedelta(days=7)))
+    assert report.candidates == 1
+    assert _suggestions(test_db)[-1] == (4, "deadline_soon")
+
+
+def test_plan_deadlines_is_not_repeated_while_open(test_db):
+    """Test that a student who keeps chatting is asked to add deadlines once."""
+    _seed(test_db)
+    job = SuggestionJob(_session_factory(test_db))
+    asyncio.run(job.run(now=NOW))
+
+    async def chat():
+        async with _session_factory(test_db)() as db:
+            db.add(models.Message(conversation_id=1, role="user", content="Hi"))
+            await db.commit()
+
+    asyncio.run(chat())
+    report = asyncio.run(job.run(now=NOW + timedelta(days=1)))
+
+    assert report.candidates == 1
+    assert report.created == 0
+    assert _suggestions(test_db).count((1, "plan_deadlines")) == 1
+
+
+def test_insert_never_exceeds_one_per_day(test_db):
+    """Test the unique constraint backstop when a student is evaluated twice."""
+    _seed(test_db)
+
+    async def insert_twice():
+        async with _session_factory(test_db)() as db:
+            drafts = [(1, Draft("a", "first")), (1, Draft("b", "second"))]
+            first = await insert_suggestions(db, drafts[:1], NOW.date())
+            second = await insert_suggestions(db, drafts[1:], NOW.date())
+            count = await db.scalar(select(func.count(models.Suggestion.id)))
+            return first, second, count
+
+    assert asyncio.run(insert_twice()) == (1, 0, 1)
+
+
+def test_rules_can_run_in_a_process_pool(test_db):
+    """Test that facts and rules survive the trip to worker processes."""
+    _seed(test_db)
+    job = SuggestionJob(_session_factory(test_db), workers=2)
+
+    report = asyncio.run(job.run(now=NOW))
+
+    assert report.created == 3
+
+
+def test_suggestion_endpoints(client: TestClient, test_db):
+    """Test running the job from the admin endpoint and listing results."""
+    _seed(test_db)
+
+    run = client.post("/admin/suggestions/run")
+    listed = client.get("/students/1/suggestions")
+
+    assert run.status_code == 200
+    assert run.json()["created"] >= 1
+    suggestions = listed.json()["suggestions"]
+    assert len(suggestions) == 1
+    assert suggestions[0]["kind"] == "plan_deadlines"
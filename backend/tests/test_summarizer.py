@@ -0,0 +1,322 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import ai, models
+from app.main import app
+from app.summarizer import SummarizationQueue, summary_queue
+
+
+@asynccontextmanager
+async def _null_session():
+    yield None
+
+
+class _RecordingSummarizer:
+    """Fake summarizer that records calls and the peak number in flight."""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, db, student_id):
+        self.calls.append(student_id)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return "summary"
+
+
+@pytest.mark.asyncio
+async def test_triggers_for_same_student_are_coalesced():
+    """Test that repeated triggers during the debounce window run one job."""
+    summarizer = _RecordingSummarizer()
+    queue = SummarizationQueue(
+        session_factory=_null_session, summarize=summarizer, debounce_seconds=0.05
+    )
+
+    for _ in range(3):
+        job = queue.schedule(1)
+    assert job.state == "queued"
+    assert job.triggers == 3
+
+    await queue.join()
+    assert summarizer.calls == [1]
+    assert queue.status(1).state == "done"
+    assert queue.status(1).runs == 1
+
+
+@pytest.mark.asyncio
+async def test_trigger_while_running_schedules_one_rerun():
+    """Test that triggers arriving mid-run fold into a single follow-up run."""
+    summarizer = _RecordingSummarizer(delay=0.05)
+    queue = SummarizationQueue(
+        session_factory=_null_session, summarize=summarizer, debounce_seconds=0
+    )
+
+    queue.schedule(1)
+    await asyncio.sleep(0.01)
+    assert queue.status(1).state == "running"
+    queue.schedule(1)
+    queue.schedule(1)
+
+    await queue.join()
+    assert summarizer.calls == [1, 1]
+    assert queue.status(1).runs == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped():
+    """Test that no more than max_concurrency summaries run at once."""
+    summarizer = _RecordingSummarizer(delay=0.02)
+    queue = SummarizationQueue(
+        session_factory=_null_session,
+        summarize=summarizer,
+        debounce_seconds=0,
+        max_concurrency=2,
+    )
+
+    for student_id in range(6):
+        queue.schedule(student_id)
+    await queue.join()
+
+    assert sorted(summarizer.calls) == list(range(6))
+    assert summarizer.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_job_reports_error():
+    """Test that a failing summary is reported in the job status."""
+
+    async def failing(db, student_id):
+        raise RuntimeError("model unavailable")
+
+    queue = SummarizationQueue(
+        session_factory=_null_session, summarize=failing, debounce_seconds=0
+    )
+    queue.schedule(7)
+    await queue.join()
+
+    job = queue.status(7)
+    assert job.state == "failed"
+    assert job.last_error == "model unavailable"
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_are_not_kept_forever():
+    """Test that only active jobs are held and old finished ones age out."""
+    summarizer = _RecordingSummarizer()
+    queue = SummarizationQueue(
+        session_factory=_null_session,
+        summarize=summarizer,
+        debounce_seconds=0,
+        max_finished=2,
+    )
+
+    for student_id in range(4):
+        queue.schedule(student_id)
+    assert len(queue._jobs) == 4
+    await queue.join()
+
+    assert queue._jobs == {}
+    assert queue.status(0).state == "idle"
+    assert queue.status(3).state == "done"
+
+    # A finished job picks up where it left off when triggered again
+    queue.schedule(3)
+    await queue.join()
+    assert queue.status(3).runs == 2
+
+
+def test_summary_job_status_idle(client: TestClient):
+    """Test that a student without a job reports idle."""
+    response = client.get("/students/123/summary-job")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["student_id"] == 123
+    assert data["state"] == "idle"
+    assert data["runs"] == 0
+
+
+def test_sixth_message_summarizes_in_background(test_db, monkeypatch, sample_student):
+    """Test that the sixth message schedules a summary that runs after the reply."""
+    monkeypatch.setattr(summary_queue, "debounce_seconds", 0)
+    monkeypatch.setattr(app.router, "on_startup", [])
+
+    with TestClient(app) as client:
+        student_id = client.post("/auth/login", json=sample_student).json()["id"]
+        conv_id = client.post("/conversations", json={"student_id": student_id}).json()[
+            "id"
+        ]
+
+        for i in range(3):
+            response = client.post(
+                f"/conversations/{conv_id}/messages", json={"content": f"Msg {i}"}
+            )
+            assert response.status_code == 200
+
+        client.portal.call(summary_queue.join)
+        data = client.get(f"/students/{student_id}/summary-job").json()
+
+    assert data["state"] == "done"
+    assert data["runs"] == 1
+
+
+async def _seed_messages(session, student_id, contents):
+    conv = models.Conversation(student_id=student_id, title="Seed")
+    session.add(conv)
+    await session.flush()
+    for i, content in enumerate(contents):
+        role = "user" if i % 2 == 0 else "assistant"
+        session.add(models.Message(conversation_id=conv.id, role=role, content=content))
+    await session.commit()
+    return conv
+
+
+@pytest.mark.asyncio
+async def test_summarize_only_sends_messages_past_watermark(test_db, monkeypatch):
+    """Test that summaries fold in new messages and skip the model when idle."""
+    sent = []
+
+    async def fake_reply(
+        history, summary, use_cache=True, fallback=True, system_prompt=None
+    ):
+        sent.append([m["content"] for m in history if m["role"] != "system"])
+        return f"summary {len(sent)}"
+
+    monkeypatch.setattr(ai, "generate_assistant_reply", fake_reply)
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+
+    async with Session() as session:
+        session.add(models.Student(id=1, email="w@example.com", name="W"))
+        conv = await _seed_messages(session, 1, ["a", "b", "c", "d"])
+
+        assert await ai.summarize_student_context(session, 1) == "summary 1"
+        ctx = await session.get(models.StudentContext, 1)
+        last_id = (await session.execute(select(func.max(models.Message.id)))).scalar()
+        assert ctx.last_summarized_message_id == last_id
+        assert sent == [["a", "b", "c", "d"]]
+
+        # Nothing new: the previous summary is returned without a model call
+        assert await ai.summarize_student_context(session, 1) == "summary 1"
+        assert len(sent) == 1
+
+        # Only messages past the watermark are sent on the next run
+        session.add(models.Message(conversation_id=conv.id, role="user", content="e"))
+        await session.commit()
+        assert await ai.summarize_student_context(session, 1) == "summary 2"
+        assert sent[-1] == ["e"]
+
+
+@pytest.mark.asyncio
+async def test_summarize_without_watermark_uses_newest_window(test_db, monkeypatch):
+    """Test that a summary from before watermarks is rebuilt from the newest."""
+    sent = []
+
+    async def fake_reply(
+        history, summary, use_cache=True, fallback=True, system_prompt=None
+    ):
+        sent.append([m["content"] for m in history if m["role"] != "system"])
+        return "rebuilt"
+
+    monkeypatch.setattr(ai, "generate_assistant_reply", fake_reply)
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+
+    async with Session() as session:
+        session.add(models.Student(id=1, email="w@example.com", name="W"))
+        await _seed_messages(session, 1, [f"m{i}" for i in range(150)])
+        # A summary written before the watermark column existed
+        session.add(models.StudentContext(student_id=1, context_summary="legacy"))
+        await session.commit()
+
+        assert await ai.summarize_student_context(session, 1) == "rebuilt"
+        assert sent == [[f"m{i}" for i in range(50, 150)]]
+        ctx = await session.get(models.StudentContext, 1)
+        last_id = (await session.execute(select(func.max(models.Message.id)))).scalar()
+        assert ctx.last_summarized_message_id == last_id
+
+
+class _RecordingClient:
+    def __init__(self):
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.calls.append(kwargs["messages"])
+        message = SimpleNamespace(content="Junior, wants CS")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.mark.asyncio
+async def test_summarize_sends_summarizer_prompt(test_db, monkeypatch):
+    """Test that the model gets the summarize instruction, not the chat prompt."""
+    client = _RecordingClient()
+    monkeypatch.setattr(ai, "get_openai_client", lambda: client)
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+
+    async with Session() as session:
+        session.add(models.Student(id=1, email="s@example.com", name="S"))
+        await _seed_messages(session, 1, ["I'm a junior", "Nice!"])
+        session.add(
+            models.StudentContext(
+                student_id=1, context_summary="Likes math", last_summarized_message_id=0
+            )
+        )
+        await session.commit()
+
+        assert await ai.summarize_student_context(session, 1) == "Junior, wants CS"
+
+    [messages] = client.calls
+    system = [m["content"] for m in messages if m["role"] == "system"]
+    assert messages[0]["role"] == "system"
+    assert "Summarize key facts only" in messages[0]["content"]
+    assert any("Previous summary" in c and "Likes math" in c for c in system)
+    assert not any("college counseling assistant. Be concise" in c for c in system)
+    assert [m["content"] for m in messages if m["role"] != "system"] == [
+        "I'm a junior",
+        "Nice!",
+    ]
+
+
+class _FailingClient:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        raise RuntimeError("upstream 500")
+
+
+@pytest.mark.asyncio
+async def test_failed_model_call_keeps_summary_and_watermark(test_db, monkeypatch):
+    """Test that a failed call is reported and the messages are retried later."""
+    monkeypatch.setattr(ai, "get_openai_client", lambda: _FailingClient())
+    Session = async_sessionmaker(bind=test_db, expire_on_commit=False)
+    async with Session() as session:
+        session.add(models.Student(id=1, email="f@example.com", name="F"))
+        await _seed_messages(session, 1, ["a", "b"])
+        session.add(
+            models.StudentContext(
+                student_id=1, context_summary="Wants CS", last_summarized_message_id=0
+            )
+        )
+        await session.commit()
+
+    queue = SummarizationQueue(session_factory=Session, debounce_seconds=0)
+    queue.schedule(1)
+    await queue.join()
+
+    job = queue.status(1)
+    assert job.state == "failed"
+    assert "upstream 500" in job.last_error
+    async with Session() as session:
+        ctx = await session.get(models.StudentContext, 1)
+        assert ctx.context_summary == "Wants CS"
+        assert ctx.last_summarized_message_id == 0
@@ -8,17 +8,49 @@ export type Conversation = {
   id: number;
   student_id: number;
   title: string;
+  message_count: number;
+  last_message_at: string | null;
+  last_message_preview: string | null;
 };
 
+export type ConversationSort = "created" | "activity";
+
 export type Message = {
   id: number;
   conversation_id: number;
   role: "user" | "assistant";
   content: string;
+  // A streamed reply that was cut off before it finished
+  truncated?: boolean;
 };
 
 const BASE_URL = import.meta.env.VITE_API_URL || "http://localhost:8000";
 
+// Last body per URL, revalidated with If-None-Match; oldest entries go first
+const ETAG_CACHE_SIZE = 100;
+const etagCache = new Map<string, { etag: string; data: unknown }>();
+
+async function getJSON<T>(url: string, errorMessage: string): Promise<T> {
+  const cached = etagCache.get(url);
+  const res = await fetch(url, {
+    // Revalidation is handled here, not by the browser cache
+    cache: "no-store",
+    headers: cached ? { "If-None-Match": cached.etag } : {},
+  });
+  if (res.status === 304 && cached) return cached.data as T;
+  if (!res.ok) throw new Error(errorMessage);
+  const data = await res.json();
+  const etag = res.headers.get("ETag");
+  etagCache.delete(url);
+  if (etag) {
+    etagCache.set(url, { etag, data });
+    if (etagCache.size > ETAG_CACHE_SIZE) {
+      etagCache.delete(etagCache.keys().next().value as string);
+    }
+  }
+  return data as T;
+}
+
 export async function login(email: string, name?: string): Promise<Student> {
   const res = await fetch(`${BASE_URL}/auth/login`, {
     method: "POST",
@@ -29,13 +61,27 @@ export async function login(email: string, name?: string): Promise<Student> {
   return res.json();
 }
 
+// Every conversation, following `next_cursor` through the server's pages;
+// unchanged pages come back as 304s from the ETag cache
 export async function listConversations(
-  studentId: number
+  studentId: number,
+  sort: ConversationSort = "created"
 ): Promise<Conversation[]> {
-  const res = await fetch(`${BASE_URL}/conversations/${studentId}`);
-  if (!res.ok) throw new Error("Failed to load conversations");
-  const data = await res.json();
-  return data.conversations;
+  const conversations: Conversation[] = [];
+  let cursor: string | null = null;
+  do {
+    const params: string = cursor
+      ? `&cursor=${encodeURIComponent(cursor)}`
+      : "";
+    const data: { conversations: Conversation[]; next_cursor?: string | null } =
+      await getJSON(
+        `${BASE_URL}/conversations/${studentId}?sort=${sort}${params}`,
+        "Failed to load conversations"
+      );
+    conversations.push(...data.conversations);
+    cursor = data.next_cursor ?? null;
+  } while (cursor !== null);
+  return conversations;
 }
 
 export async function createConversation(
@@ -51,19 +97,57 @@ export async function createConversation(
   return res.json();
 }
 
-export async function getMessages(conversationId: number): Promise<Message[]> {
-  const res = await fetch(
-    `${BASE_URL}/conversations/${conversationId}/messages`
+export type MessagesPage = {
+  messages: Message[];
+  // Pass as `beforeId` to load the next page of older messages
+  nextCursor: number | null;
+};
+
+export async function getMessages(
+  conversationId: number,
+  beforeId?: number
+): Promise<MessagesPage> {
+  const params = beforeId ? `?before_id=${beforeId}` : "";
+  const data = await getJSON<{ messages: Message[]; next_cursor?: number | null }>(
+    `${BASE_URL}/conversations/${conversationId}/messages${params}`,
+    "Failed to load messages"
   );
-  if (!res.ok) throw new Error("Failed to load messages");
-  const data = await res.json();
-  return data.messages;
+  return { messages: data.messages, nextCursor: data.next_cursor ?? null };
+}
+
+// Every message after `sinceId`, oldest first; unchanged deltas come back
+// as 304s from the ETag cache
+export async function getMessagesSince(
+  conversationId: number,
+  sinceId: number
+): Promise<Message[]> {
+  const delta: Message[] = [];
+  let cursor: number | null = sinceId;
+  while (cursor !== null) {
+    const data: { messages: Message[]; next_cursor?: number | null } =
+      await getJSON(
+        `${BASE_URL}/conversations/${conversationId}/messages?since_id=${cursor}`,
+        "Failed to sync messages"
+      );
+    delta.push(...data.messages);
+    cursor = data.next_cursor ?? null;
+  }
+  return delta;
+}
+
+// Append a delta to the local copy, skipping messages it already holds
+export function mergeMessages(existing: Message[], delta: Message[]): Message[] {
+  const known = new Set(existing.map((m) => m.id));
+  const added = delta.filter((m) => !known.has(m.id));
+  return added.length ? [...existing, ...added] : existing;
 }
 
 export async function sendMessage(
   conversationId: number,
-  content: string
+  content: string,
+  onToken?: (delta: string) => void
 ): Promise<Message> {
+  if (onToken) return sendMessageStream(conversationId, content, onToken);
   const res = await fetch(
     `${BASE_URL}/conversations/${conversationId}/messages`,
     {
@@ -75,3 +159,114 @@ export async function sendMessage(
   if (!res.ok) throw new Error("Failed to send message");
   return res.json();
 }
+
+// Consumes the Server-Sent Events variant of the send endpoint: each
+// `data: {"delta": ...}` event is forwarded to `onToken`, and the final
+// `event: done` carries the persisted assistant message.
+async function sendMessageStream(
+  conversationId: number,
+  content: string,
+  onToken: (delta: string) => void
+): Promise<Message> {
+  const res = await fetch(
+    `${BASE_URL}/conversations/${conversationId}/messages/stream`,
+    {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        Accept: "text/event-stream",
+      },
+      body: JSON.stringify({ content }),
+    }
+  );
+  if (!res.ok || !res.body) throw new Error("Failed to send message");
+
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  let done: Message | null = null;
+  while (true) {
+    const { value, done: finished } = await reader.read();
+    if (finished) break;
+    buffer += value;
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (data) {
+        const parsed = JSON.parse(data);
+        if (event === "done") done = parsed as Message;
+        else onToken(parsed.delta);
+      }
+      boundary = buffer.indexOf("\n\n");
+    }
+  }
+  if (!done) throw new Error("Failed to send message");
+  return done;
+}
+
+export type MessageSearchHit = {
+  message_id: number;
+  conversation_id: number;
+  conversation_title: string;
+  role: "user" | "assistant";
+  // Matched terms are wrapped in ** markers
+  snippet: string;
+  score: number;
+  created_at: string | null;
+};
+
+export async function searchMessages(
+  studentId: number,
+  query: string,
+  limit = 20
+): Promise<MessageSearchHit[]> {
+  const params = new URLSearchParams({ q: query, limit: String(limit) });
+  const res = await fetch(`${BASE_URL}/students/${studentId}/search?${params}`);
+  if (!res.ok) throw new Error("Search failed");
+  const data = await res.json();
+  return data.results;
+}
+
+export type StudentDocument = {
+  id: number;
+  student_id: number;
+  filename: string;
+  content_type: string;
+  size_bytes: number;
+  sha256: string;
+  created_at: string | null;
+};
+
+// Sends the file as the raw request body so the server can stream it to
+// disk; re-uploading an identical file returns the existing document.
+export async function uploadDocument(
+  studentId: number,
+  file: File
+): Promise<StudentDocument & { deduplicated: boolean }> {
+  const params = new URLSearchParams({ filename: file.name });
+  const res = await fetch(
+    `${BASE_URL}/students/${studentId}/documents?${params}`,
+    {
+      method: "POST",
+      headers: { "Content-Type": file.type || "application/octet-stream" },
+      body: file,
+    }
+  );
+  if (!res.ok) throw new Error("Failed to upload document");
+  return res.json();
+}
+
+export async function listDocuments(
+  studentId: number
+): Promise<StudentDocument[]> {
+  const res = await fetch(`${BASE_URL}/students/${studentId}/documents`);
+  if (!res.ok) throw new Error("Failed to load documents");
+  const data = await res.json();
+  return data.documents;
+}
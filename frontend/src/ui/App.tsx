@@ -2,8 +2,10 @@ import { useEffect, useMemo, useState } from "react";
 import {
   createConversation,
   getMessages,
+  getMessagesSince,
   listConversations,
   login,
+  mergeMessages,
   sendMessage,
   type Conversation,
   type Message,
@@ -34,12 +36,13 @@ export function App() {
     number | null
   >("activeConversationId", null);
   const [messages, setMessages] = useState<Message[]>([]);
+  const [olderCursor, setOlderCursor] = useState<number | null>(null);
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(false);
 
   useEffect(() => {
     if (!student) return;
-    listConversations(student.id)
+    listConversations(student.id, "activity")
       .then(setConversations)
       .catch((error) => {
         // If student no longer exists in database, log them out
@@ -54,10 +57,46 @@ export function App() {
   useEffect(() => {
     if (!activeConversationId) return;
     getMessages(activeConversationId)
-      .then(setMessages)
-      .catch(() => setMessages([]));
+      .then((page) => {
+        setMessages(page.messages);
+        setOlderCursor(page.nextCursor);
+      })
+      .catch(() => {
+        setMessages([]);
+        setOlderCursor(null);
+      });
   }, [activeConversationId]);
 
+  // Catch up on messages sent from other tabs when this one regains focus
+  // or reconnects; skipped while a send is in flight
+  useEffect(() => {
+    if (!activeConversationId || loading) return;
+    const conversationId = activeConversationId;
+    const sinceId = messages.length ? messages[messages.length - 1].id : 0;
+    function syncNewMessages() {
+      getMessagesSince(conversationId, sinceId)
+        .then((delta) => setMessages((prev) => mergeMessages(prev, delta)))
+        .catch((error) => console.error("Failed to sync messages:", error));
+    }
+    window.addEventListener("focus", syncNewMessages);
+    window.addEventListener("online", syncNewMessages);
+    return () => {
+      window.removeEventListener("focus", syncNewMessages);
+      window.removeEventListener("online", syncNewMessages);
+    };
+  }, [activeConversationId, messages, loading]);
+
+  async function loadOlderMessages() {
+    if (!activeConversationId || olderCursor === null) return;
+    try {
+      const page = await getMessages(activeConversationId, olderCursor);
+      setMessages((prev) => [...page.messages, ...prev]);
+      setOlderCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Failed to load older messages:", error);
+    }
+  }
+
   async function handleLogin(e: React.FormEvent) {
     e.preventDefault();
     try {
@@ -74,6 +113,7 @@ export function App() {
     setActiveConversationId(null);
     setConversations([]);
     setMessages([]);
+    setOlderCursor(null);
     setEmail("");
     setName("");
   }
@@ -85,6 +125,7 @@ export function App() {
       setConversations((prev) => [conv, ...prev]);
       setActiveConversationId(conv.id);
       setMessages([]);
+      setOlderCursor(null);
     } catch (error) {
       console.error("Failed to create conversation:", error);
       // If student no longer exists, log them out
@@ -106,23 +147,63 @@ export function App() {
       role: "user",
       content: input,
     };
+    // Placeholder that fills in as streamed tokens arrive
+    const assistantLocal: Message = {
+      id: userLocal.id + 1,
+      conversation_id: activeConversationId,
+      role: "assistant",
+      content: "",
+    };
     setMessages((prev) => [...prev, userLocal]);
     setInput("");
     setLoading(true);
     try {
       const assistant = await sendMessage(
         activeConversationId,
-        userLocal.content
+        userLocal.content,
+        (delta) => {
+          setLoading(false);
+          setMessages((prev) => {
+            const partial = prev.find((m) => m.id === assistantLocal.id);
+            const content = (partial?.content ?? "") + delta;
+            return [
+              ...prev.filter((m) => m.id !== assistantLocal.id),
+              { ...assistantLocal, content },
+            ];
+          });
+        }
       );
       setMessages((prev) => [
-        ...prev.filter((m) => m.id !== userLocal.id),
+        ...prev.filter(
+          (m) => m.id !== userLocal.id && m.id !== assistantLocal.id
+        ),
         userLocal,
         assistant,
       ]);
+      // Mirror the server's activity columns and move the chat to the top
+      setConversations((prev) => {
+        const current = prev.find((c) => c.id === assistant.conversation_id);
+        if (!current) return prev;
+        const updated: Conversation = {
+          ...current,
+          message_count: current.message_count + 2,
+          last_message_at: new Date().toISOString(),
+          last_message_preview: assistant.content
+            .split(/\s+/)
+            .filter(Boolean)
+            .join(" ")
+            .slice(0, 140),
+        };
+        return [updated, ...prev.filter((c) => c.id !== updated.id)];
+      });
     } catch (error) {
       console.error("Failed to send message:", error);
-      // Remove the optimistic message on error
-      setMessages((prev) => prev.filter((m) => m.id !== userLocal.id));
+      // Remove the optimistic messages on error
+      setMessages((prev) =>
+        prev.filter(
+          (m) => m.id !== userLocal.id && m.id !== assistantLocal.id
+        )
+      );
       // If conversation no longer exists, refresh conversations
       if (
         error instanceof Error &&
@@ -132,7 +213,7 @@ export function App() {
         setMessages([]);
         // Try to refresh conversations list
         if (student) {
-          listConversations(student.id)
+          listConversations(student.id, "activity")
             .then(setConversations)
             .catch(() => handleLogout());
         }
@@ -204,7 +285,12 @@ export function App() {
                 activeConversationId === c.id ? "bg-blue-100" : ""
               }`}
             >
-              {c.title}
+              <div className="truncate">{c.title}</div>
+              {c.last_message_preview && (
+                <div className="text-xs text-gray-500 truncate">
+                  {c.last_message_preview}
+                </div>
+              )}
             </button>
           ))}
         </div>
@@ -216,6 +302,14 @@ export function App() {
               Select or create a conversation to start.
             </div>
           )}
+          {olderCursor !== null && (
+            <button
+              onClick={loadOlderMessages}
+              className="text-sm text-blue-600 hover:underline"
+            >
+              Load earlier messages
+            </button>
+          )}
           {messages.map((m) => (
             <div
               key={m.id}
@@ -227,6 +321,11 @@ export function App() {
                 }`}
               >
                 {m.content}
+                {m.truncated && (
+                  <div className="text-xs text-gray-400 mt-1">
+                    Response interrupted
+                  </div>
+                )}
               </div>
             </div>
           ))}